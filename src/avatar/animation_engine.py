@@ -0,0 +1,330 @@
+"""
+アバターのアニメーションエンジン
+一定周期で表情のブレンドシェイプを目標値へ補間し、リップシンクの口形を重ねる
+"""
+
+import asyncio
+import time
+from collections import deque
+from collections.abc import Callable
+from typing import Literal
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from src.avatar.animation_recorder import AnimationRecorder
+from src.avatar.avatar_controller import AvatarController, ExpressionConfig
+from src.avatar.lip_sync_timeline import PHONEMES, LipSyncTimeline
+
+# 音素とVRMの口形の表情名の対応(「ん」は口を閉じるため対応なし)
+VISEME_EXPRESSIONS = {"a": "aa", "i": "ih", "u": "ou", "e": "ee", "o": "oh"}
+
+# 補間のイージング関数(0〜1の進捗を0〜1の補間率に変換)
+EASINGS: dict[str, Callable[[float], float]] = {
+    "linear": lambda t: t,
+    "ease_in_out": lambda t: t * t * (3.0 - 2.0 * t),
+    "ease_out": lambda t: 1.0 - (1.0 - t) * (1.0 - t),
+}
+
+
+class AnimationConfig(BaseModel):
+    """アニメーションエンジンの設定"""
+
+    tick_rate: float = Field(default=60.0, description="更新周期(Hz)")
+    transition_time: float = Field(default=0.25, description="表情の切り替えにかける時間(秒)")
+    easing: Literal["linear", "ease_in_out", "ease_out"] = Field(
+        default="ease_in_out", description="表情の補間に使うイージング"
+    )
+    viseme_gain: float = Field(default=1.0, description="口形の重みに掛ける係数")
+    cpu_budget: float = Field(default=0.5, description="1周期のうち計算に使える割合")
+
+
+class AnimationEngine:
+    """一定周期でブレンドシェイプの重みを計算するアニメーションエンジン
+
+    重みはチャンネル(表情名)ごとの連続したfloat32配列として計算し、
+    周期ごとに `on_frame` へ渡す。配列は次の周期で上書きされる。
+    計算時間が予算を超えた周期と、予定時刻に間に合わなかった周期を記録する。
+    """
+
+    def __init__(
+        self,
+        avatar: AvatarController,
+        config: AnimationConfig | None = None,
+        on_frame: Callable[[np.ndarray], None] | None = None,
+        clock: Callable[[], float] = time.perf_counter,
+    ) -> None:
+        """
+        Args:
+            avatar: アバター制御システム
+            config: アニメーション設定
+            on_frame: 周期ごとに重みの配列を受け取るコールバック
+            clock: 現在時刻(秒)を返す関数
+        """
+        self.avatar = avatar
+        self.config = config or AnimationConfig()
+        self.on_frame = on_frame
+        self.clock = clock
+
+        # モデルの表情に口形の表情を加えたものをチャンネルとする
+        names = list(avatar.get_available_expressions())
+        names += [name for name in VISEME_EXPRESSIONS.values() if name not in names]
+        self.channel_names = names
+        self.channel_index = {name: i for i, name in enumerate(names)}
+
+        # 音素コードから口形チャンネルへの対応(対応がない音素は-1)
+        self._viseme_channels = np.array(
+            [self.channel_index.get(VISEME_EXPRESSIONS.get(p, ""), -1) for p in PHONEMES],
+            dtype=np.intp,
+        )
+        viseme_mask = np.zeros(len(names), dtype=bool)
+        viseme_mask[self._viseme_channels[self._viseme_channels >= 0]] = True
+        self._viseme_mask = viseme_mask
+
+        size = len(names)
+        self._start = np.zeros(size, dtype=np.float32)
+        self._target = np.zeros(size, dtype=np.float32)
+        self._base = np.zeros(size, dtype=np.float32)
+        self._weights = np.zeros(size, dtype=np.float32)
+        for name, weight in avatar.blend_shapes.items():
+            self._target[self.channel_index[name]] = weight
+        self._base[:] = self._target
+        self._transition_start = 0.0
+        self._transition_time = 0.0
+
+        # 再生待ちを含むリップシンク(開始時刻とタイムライン、開始時刻の順)
+        self._timelines: deque[tuple[float, LipSyncTimeline]] = deque()
+
+        self.recorder: AnimationRecorder | None = None
+        self._recorded_nodes = np.zeros(0, dtype=np.intp)
+        self._recording_start = 0.0
+
+        self._task: asyncio.Task[None] | None = None
+        self.stats = {
+            "ticks": 0,
+            "missed_deadlines": 0,
+            "over_budget": 0,
+            "max_tick_time": 0.0,
+            "total_tick_time": 0.0,
+        }
+
+    @property
+    def tick_interval(self) -> float:
+        """更新周期(秒)"""
+        return 1.0 / self.config.tick_rate
+
+    @property
+    def tick_budget(self) -> float:
+        """1周期の計算時間の予算(秒)"""
+        return self.tick_interval * self.config.cpu_budget
+
+    @property
+    def is_running(self) -> bool:
+        """更新ループが動作中かどうか"""
+        return self._task is not None and not self._task.done()
+
+    @property
+    def weights(self) -> np.ndarray:
+        """最後に計算した重み"""
+        return self._weights
+
+    @property
+    def lip_sync_end(self) -> float | None:
+        """再生待ちを含むリップシンクの終了時刻(再生するものがない場合はNone)"""
+        if not self._timelines:
+            return None
+        start, timeline = self._timelines[-1]
+        return start + timeline.duration
+
+    def set_target(
+        self,
+        expression: ExpressionConfig | dict[str, float],
+        transition_time: float | None = None,
+    ) -> None:
+        """表情の目標値を設定し、現在の値から補間を開始
+
+        Args:
+            expression: 目標とする表情
+            transition_time: 切り替えにかける時間(Noneの場合は設定値)
+        """
+        values = expression.model_dump() if isinstance(expression, ExpressionConfig) else expression
+        now = self.clock()
+        # 補間の途中で切り替えた場合も現在の値から滑らかに続ける
+        self._update_base(now)
+        self._start[:] = self._base
+        for name, weight in values.items():
+            index = self.channel_index.get(name)
+            if index is not None:
+                self._target[index] = weight
+        self._transition_start = now
+        self._transition_time = (
+            self.config.transition_time if transition_time is None else transition_time
+        )
+
+    def play_lip_sync(self, timeline: LipSyncTimeline, start_time: float | None = None) -> float:
+        """リップシンクの再生を予約
+
+        再生中・再生待ちのものがある場合は、その終了後に続けて再生する。
+        応答を文単位で続けて出力しても、前の文の口形を途中で打ち切らない。
+
+        Args:
+            timeline: 再生するタイムライン
+            start_time: 再生を開始できる最も早い時刻(Noneの場合は現在時刻)
+
+        Returns:
+            実際の再生開始時刻
+        """
+        start = self.clock() if start_time is None else start_time
+        end = self.lip_sync_end
+        if end is not None:
+            start = max(start, end)
+        self._timelines.append((start, timeline))
+        return start
+
+    def stop_lip_sync(self) -> None:
+        """リップシンクの再生を停止し、再生待ちのものも破棄"""
+        self._timelines.clear()
+
+    async def start_recording(
+        self, path: str, nodes: list[str | int] | None = None, chunk_frames: int = 1024
+    ) -> AnimationRecorder:
+        """更新ループが計算した重みとノードの姿勢の記録を開始
+
+        記録中の場合は前の記録を終了してから開始する。
+
+        Args:
+            path: 出力ファイルのパス
+            nodes: 姿勢を記録するノード名または番号(Noneの場合は記録しない)
+            chunk_frames: ファイルに書き出す間隔(フレーム数)
+
+        Returns:
+            記録に使うレコーダー
+        """
+        await self.stop_recording()
+        transforms = self.avatar.node_transforms
+        self._recorded_nodes = transforms.indices(nodes or [])
+        self.recorder = AnimationRecorder(
+            path,
+            self.channel_names,
+            [transforms.names[i] for i in self._recorded_nodes.tolist()],
+            chunk_frames=chunk_frames,
+        )
+        self._recording_start = self.clock()
+        return self.recorder
+
+    async def stop_recording(self) -> None:
+        """記録を終了してファイルを作成"""
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            # 一時ファイルの連結は記録時間に比例するため、イベントループを止めない
+            await asyncio.to_thread(recorder.close)
+
+    def tick(self, now: float | None = None) -> np.ndarray:
+        """指定時刻の重みを計算
+
+        Args:
+            now: 時刻(Noneの場合は現在時刻)
+
+        Returns:
+            チャンネルごとの重み(次の計算で上書きされる)
+        """
+        if now is None:
+            now = self.clock()
+        self._update_base(now)
+        self._weights[:] = self._base
+
+        # リップシンクの口形を重ねる(口形チャンネルは再生中の音素で置き換える)
+        timelines = self._timelines
+        while timelines and now - timelines[0][0] >= timelines[0][1].duration:
+            timelines.popleft()
+        if timelines:
+            start, timeline = timelines[0]
+            playback = now - start
+            if playback >= 0:
+                self._weights[self._viseme_mask] = 0.0
+                index = timeline.index_at(playback)
+                if index >= 0:
+                    channel = self._viseme_channels[timeline.codes[index]]
+                    if channel >= 0:
+                        weight = timeline.intensities[index] * self.config.viseme_gain
+                        self._weights[channel] = min(max(weight, 0.0), 1.0)
+
+        return self._weights
+
+    def _update_base(self, now: float) -> None:
+        """表情の補間値を計算"""
+        if self._transition_time > 0:
+            progress = min(max((now - self._transition_start) / self._transition_time, 0.0), 1.0)
+        else:
+            progress = 1.0
+        eased = EASINGS[self.config.easing](progress)
+        np.subtract(self._target, self._start, out=self._base)
+        self._base *= eased
+        self._base += self._start
+
+    async def start(self) -> None:
+        """更新ループを開始"""
+        if self.is_running:
+            return
+        self._task = asyncio.create_task(self._run(), name="animation-engine")
+
+    async def stop(self) -> None:
+        """更新ループを停止し、記録中の場合はファイルを作成"""
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.stop_recording()
+
+    def get_stats(self) -> dict:
+        """更新ループの統計を取得
+
+        Returns:
+            周期数、予定時刻に遅れた周期数、予算超過の周期数、計算時間(秒)
+        """
+        stats = dict(self.stats)
+        total = stats.pop("total_tick_time")
+        stats["mean_tick_time"] = total / stats["ticks"] if stats["ticks"] else 0.0
+        return stats
+
+    def _record(self, recorder: AnimationRecorder, now: float, weights: np.ndarray) -> None:
+        """1周期分の重みと姿勢を記録"""
+        nodes = self._recorded_nodes
+        transforms = self.avatar.node_transforms
+        recorder.record(
+            now - self._recording_start,
+            weights,
+            transforms.translation[nodes] if len(nodes) else None,
+            transforms.rotation[nodes] if len(nodes) else None,
+        )
+
+    async def _run(self) -> None:
+        """一定周期で重みを計算する"""
+        interval = self.tick_interval
+        budget = self.tick_budget
+        deadline = self.clock()
+        while True:
+            started = time.perf_counter()
+            now = self.clock()
+            weights = self.tick(now)
+            if self.on_frame is not None:
+                self.on_frame(weights)
+            recorder = self.recorder
+            if recorder is not None:
+                self._record(recorder, now, weights)
+            elapsed = time.perf_counter() - started
+
+            self.stats["ticks"] += 1
+            self.stats["total_tick_time"] += elapsed
+            self.stats["max_tick_time"] = max(self.stats["max_tick_time"], elapsed)
+            if elapsed > budget:
+                self.stats["over_budget"] += 1
+
+            deadline += interval
+            now = self.clock()
+            if now > deadline:
+                # 遅れた周期はまとめて飛ばし、追いつくために連続で計算しない
+                missed = int((now - deadline) / interval) + 1
+                self.stats["missed_deadlines"] += missed
+                deadline += missed * interval
+            await asyncio.sleep(deadline - now)
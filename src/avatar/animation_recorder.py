@@ -0,0 +1,386 @@
+"""
+アニメーションの記録と再生用の読み込み
+ブレンドシェイプの重みとノードの姿勢を時系列で記録し、glTFのアニメーション形式(GLB)で保存する
+"""
+
+import json
+import shutil
+import struct
+import tempfile
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from src.avatar.vrm_loader import CHUNK_BIN, CHUNK_JSON, GLB_MAGIC, GlbFile
+
+# glTFのcomponentType(FLOAT)
+_FLOAT = 5126
+# 一時ファイルのディレクトリに置く、記録の内容を表すファイル
+_MANIFEST = "manifest.json"
+
+
+class _Track:
+    """1種類の時系列データを一時ファイルに追記する"""
+
+    def __init__(
+        self, directory: Path, name: str, width: int, gltf_type: str, mode: str = "wb"
+    ) -> None:
+        self.name = name
+        self.width = width
+        self.gltf_type = gltf_type
+        self.path = directory / f"{name}.bin"
+        self.file = self.path.open(mode)
+        self.min = np.full(width, np.inf, dtype=np.float32)
+        self.max = np.full(width, -np.inf, dtype=np.float32)
+
+    @property
+    def frames(self) -> int:
+        """ファイルに書き出し済みのフレーム数"""
+        return self.path.stat().st_size // (self.width * 4)
+
+    def write(self, block: np.ndarray) -> None:
+        if len(block):
+            np.minimum(self.min, block.min(axis=0), out=self.min)
+            np.maximum(self.max, block.max(axis=0), out=self.max)
+        self.file.write(block.tobytes())
+        # プロセスが異常終了しても書き出し済みのフレームを復元できるようにする
+        self.file.flush()
+
+    def truncate(self, frames: int) -> None:
+        """フレーム数に切り詰め、値の範囲をファイルから計算し直す"""
+        self.file.truncate(frames * self.width * 4)
+        if frames:
+            values = np.memmap(self.path, dtype=np.float32, mode="r", shape=(frames, self.width))
+            self.min[:] = values.min(axis=0)
+            self.max[:] = values.max(axis=0)
+            del values
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class AnimationRecorder:
+    """ブレンドシェイプの重みとノードの姿勢を記録する
+
+    記録は固定長のバッファにためてから、トラックごとの一時ファイルに追記する。
+    `close` でトラックを連結したGLBファイルを作成するため、記録時間によらず
+    メモリ使用量は一定。ノードの姿勢はglTFのアニメーションチャンネル、
+    重みはチャンネル名とともにアニメーションの `extras` に格納する。
+
+    GLBファイルは `close` まで作成されない(記録中に読める形式では書き出さない)。
+    プロセスが異常終了した場合は、一時ファイルのディレクトリ(`*.tracks`)に残った
+    書き出し済みのフレームから `recover_recordings` でGLBファイルを作成できる。
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        channel_names: list[str],
+        node_names: list[str] | None = None,
+        chunk_frames: int = 1024,
+    ) -> None:
+        """
+        Args:
+            path: 出力ファイルのパス
+            channel_names: 重みのチャンネル名
+            node_names: 姿勢を記録するノード名
+            chunk_frames: 一時ファイルに書き出す間隔(フレーム数)
+        """
+        self.path = Path(path)
+        self.channel_names = list(channel_names)
+        self.node_names = list(node_names or [])
+        self.chunk_frames = chunk_frames
+        self.frames = 0
+
+        n_channels = len(self.channel_names)
+        n_nodes = len(self.node_names)
+        self._times = np.empty((chunk_frames, 1), dtype=np.float32)
+        self._weights = np.empty((chunk_frames, n_channels), dtype=np.float32)
+        self._translations = np.empty((chunk_frames, n_nodes, 3), dtype=np.float32)
+        self._rotations = np.empty((chunk_frames, n_nodes, 4), dtype=np.float32)
+        self._buffered = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._directory = Path(tempfile.mkdtemp(dir=self.path.parent, suffix=".tracks"))
+        self._time_track = _Track(self._directory, "time", 1, "SCALAR")
+        self._weight_track = _Track(self._directory, "weights", n_channels, "SCALAR")
+        self._translation_tracks = [
+            _Track(self._directory, f"translation_{i}", 3, "VEC3") for i in range(n_nodes)
+        ]
+        self._rotation_tracks = [
+            _Track(self._directory, f"rotation_{i}", 4, "VEC4") for i in range(n_nodes)
+        ]
+        manifest = {
+            "path": str(self.path),
+            "channel_names": self.channel_names,
+            "node_names": self.node_names,
+        }
+        (self._directory / _MANIFEST).write_text(json.dumps(manifest, ensure_ascii=False))
+        self._closed = False
+
+    def record(
+        self,
+        time: float,
+        weights: np.ndarray,
+        translations: np.ndarray | None = None,
+        rotations: np.ndarray | None = None,
+    ) -> None:
+        """1フレーム分を記録
+
+        Args:
+            time: 時刻(秒)
+            weights: チャンネルごとの重み
+            translations: (ノード数 x 3) の位置
+            rotations: (ノード数 x 4) の回転(クォータニオン)
+        """
+        if self._closed:
+            raise RuntimeError("Recorder is closed")
+        row = self._buffered
+        self._times[row, 0] = time
+        self._weights[row] = weights
+        if self.node_names:
+            self._translations[row] = 0.0 if translations is None else translations
+            self._rotations[row] = (0.0, 0.0, 0.0, 1.0) if rotations is None else rotations
+        self._buffered += 1
+        self.frames += 1
+        if self._buffered == self.chunk_frames:
+            self.flush()
+
+    def flush(self) -> None:
+        """バッファの内容を一時ファイルに書き出す"""
+        count = self._buffered
+        if count == 0:
+            return
+        self._time_track.write(self._times[:count])
+        self._weight_track.write(self._weights[:count])
+        for i, track in enumerate(self._translation_tracks):
+            track.write(self._translations[:count, i])
+        for i, track in enumerate(self._rotation_tracks):
+            track.write(self._rotations[:count, i])
+        self._buffered = 0
+
+    def close(self) -> None:
+        """記録を終了し、GLBファイルを作成
+
+        一時ファイルをすべてコピーするため、長時間の記録では時間がかかる。
+        イベントループ上では `asyncio.to_thread` などで実行する。
+        """
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        tracks = self._tracks()
+        for track in tracks:
+            track.close()
+
+        _write_glb(self.path, tracks, self.frames, self.channel_names, self.node_names)
+        # 作成に失敗した場合は復元できるよう一時ファイルを残す
+        shutil.rmtree(self._directory, ignore_errors=True)
+
+    def _tracks(self) -> list[_Track]:
+        return [
+            self._time_track,
+            self._weight_track,
+            *self._translation_tracks,
+            *self._rotation_tracks,
+        ]
+
+    def __enter__(self) -> "AnimationRecorder":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+def recover_recordings(directory: str | Path) -> list[Path]:
+    """異常終了した記録の一時ファイルからGLBファイルを作成
+
+    書き出し済みのフレームのうち、すべてのトラックに揃っているものだけを使う。
+    記録先に既にファイルがある場合は一時ディレクトリ名を付けた別名で保存する。
+
+    Args:
+        directory: 記録先のディレクトリ
+
+    Returns:
+        作成したGLBファイルのパス
+    """
+    recovered = []
+    for tracks_dir in sorted(Path(directory).glob("*.tracks")):
+        manifest_path = tracks_dir / _MANIFEST
+        if not manifest_path.exists():
+            continue
+        try:
+            manifest = json.loads(manifest_path.read_text())
+            node_names = manifest["node_names"]
+            specs = [("time", 1, "SCALAR"), ("weights", len(manifest["channel_names"]), "SCALAR")]
+            specs += [(f"translation_{i}", 3, "VEC3") for i in range(len(node_names))]
+            specs += [(f"rotation_{i}", 4, "VEC4") for i in range(len(node_names))]
+            tracks = [_Track(tracks_dir, *spec, mode="r+b") for spec in specs]
+            frames = min(track.frames for track in tracks)
+            for track in tracks:
+                track.truncate(frames)
+                track.close()
+
+            path = Path(manifest["path"])
+            if path.exists():
+                path = path.with_name(f"{path.stem}-{tracks_dir.stem}{path.suffix}")
+            _write_glb(path, tracks, frames, manifest["channel_names"], node_names)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error recovering animation recording {tracks_dir}: {e}")
+            continue
+        shutil.rmtree(tracks_dir, ignore_errors=True)
+        recovered.append(path)
+    return recovered
+
+
+def _write_glb(
+    path: Path, tracks: list[_Track], frames: int, channel_names: list[str], node_names: list[str]
+) -> None:
+    """トラックの一時ファイルを連結してGLBファイルを作成"""
+    gltf, bin_length = _build_gltf(tracks, frames, channel_names, node_names)
+    json_chunk = json.dumps(gltf, separators=(",", ":")).encode()
+    json_chunk += b" " * (-len(json_chunk) % 4)
+    total = 12 + 8 + len(json_chunk) + 8 + bin_length
+
+    # 書き込み途中のファイルを読まないよう一時ファイルから置き換える
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("wb") as f:
+        f.write(struct.pack("<4sII", GLB_MAGIC, 2, total))
+        f.write(struct.pack("<II", len(json_chunk), CHUNK_JSON))
+        f.write(json_chunk)
+        f.write(struct.pack("<II", bin_length, CHUNK_BIN))
+        for track in tracks:
+            with track.path.open("rb") as source:
+                shutil.copyfileobj(source, f)
+    tmp_path.replace(path)
+
+
+def _build_gltf(
+    tracks: list[_Track], frames: int, channel_names: list[str], node_names: list[str]
+) -> tuple[dict[str, Any], int]:
+    """トラックの配置に合わせたglTFのJSONを作成"""
+    buffer_views = []
+    accessors = []
+    offset = 0
+    for track in tracks:
+        length = track.path.stat().st_size
+        buffer_views.append({"buffer": 0, "byteOffset": offset, "byteLength": length})
+        accessor: dict[str, Any] = {
+            "bufferView": len(buffer_views) - 1,
+            "componentType": _FLOAT,
+            "count": frames * (track.width if track.gltf_type == "SCALAR" else 1),
+            "type": track.gltf_type,
+            "name": track.name,
+        }
+        # glTFの仕様どおり、時刻と姿勢のアクセサーには値の範囲を記録する
+        if frames and (track.name == "time" or track.gltf_type != "SCALAR"):
+            accessor["min"] = track.min.tolist()
+            accessor["max"] = track.max.tolist()
+        accessors.append(accessor)
+        offset += length
+
+    n_nodes = len(node_names)
+    samplers: list[dict[str, Any]] = []
+    channels: list[dict[str, Any]] = []
+    for i in range(n_nodes):
+        for path, output in (("translation", 2 + i), ("rotation", 2 + n_nodes + i)):
+            channels.append({"sampler": len(samplers), "target": {"node": i, "path": path}})
+            samplers.append({"input": 0, "output": output, "interpolation": "LINEAR"})
+
+    gltf = {
+        "asset": {"version": "2.0", "generator": "aituber-animation-recorder"},
+        "nodes": [{"name": name} for name in node_names],
+        "buffers": [{"byteLength": offset}],
+        "bufferViews": buffer_views,
+        "accessors": accessors,
+        "animations": [
+            {
+                "name": "session",
+                "samplers": samplers,
+                "channels": channels,
+                "extras": {
+                    "frames": frames,
+                    "times": 0,
+                    "weights": {"accessor": 1, "channels": channel_names},
+                },
+            }
+        ],
+    }
+    return gltf, offset
+
+
+class AnimationRecording:
+    """記録したアニメーションをメモリマップして読み込む
+
+    各トラックはファイルを参照するコピーなしの配列として取得できる。
+    """
+
+    def __init__(self, glb: GlbFile) -> None:
+        """
+        Args:
+            glb: 記録したGLBファイル
+        """
+        self.glb = glb
+        animation = glb.json["animations"][0]
+        extras = animation["extras"]
+        self.frames: int = extras["frames"]
+        self.channel_names: list[str] = extras["weights"]["channels"]
+        self.node_names = [node["name"] for node in glb.json.get("nodes", [])]
+        self._node_accessors: dict[tuple[int, str], int] = {
+            (channel["target"]["node"], channel["target"]["path"]): animation["samplers"][
+                channel["sampler"]
+            ]["output"]
+            for channel in animation["channels"]
+        }
+        self._times_accessor = extras["times"]
+        self._weights_accessor = extras["weights"]["accessor"]
+
+    @classmethod
+    def open(cls, path: str | Path) -> "AnimationRecording":
+        """ファイルをメモリマップして開く
+
+        Args:
+            path: 記録したファイルのパス
+
+        Returns:
+            読み込んだ記録
+        """
+        return cls(GlbFile.open(path))
+
+    @property
+    def times(self) -> np.ndarray:
+        """(フレーム数,) の時刻"""
+        return self.glb.accessor(self._times_accessor)
+
+    @property
+    def weights(self) -> np.ndarray:
+        """(フレーム数 x チャンネル数) の重み"""
+        return self.glb.accessor(self._weights_accessor).reshape(
+            self.frames, len(self.channel_names)
+        )
+
+    def translation(self, node: str | int) -> np.ndarray:
+        """(フレーム数 x 3) のノードの位置"""
+        return self.glb.accessor(self._node_accessors[self._node_index(node), "translation"])
+
+    def rotation(self, node: str | int) -> np.ndarray:
+        """(フレーム数 x 4) のノードの回転"""
+        return self.glb.accessor(self._node_accessors[self._node_index(node), "rotation"])
+
+    def channel(self, name: str) -> np.ndarray:
+        """(フレーム数,) の1チャンネル分の重み"""
+        return self.weights[:, self.channel_names.index(name)]
+
+    def close(self) -> None:
+        """メモリマップを閉じる"""
+        self.glb.close()
+
+    def _node_index(self, node: str | int) -> int:
+        return self.node_names.index(node) if isinstance(node, str) else node
+
+    def __enter__(self) -> "AnimationRecording":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
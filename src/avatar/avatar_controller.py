@@ -4,24 +4,37 @@ VRMモデルの制御とリップシンクを担当
 """
 
 import json
-import math
-from dataclasses import dataclass
+import threading
 from pathlib import Path
 from typing import Optional
 
-import librosa
 import numpy as np
 from pydantic import BaseModel, Field
 
+from src.avatar import mfcc as mfcc_features
+from src.avatar.lip_sync_timeline import PHONEME_CODES, LipSyncData, LipSyncTimeline
+from src.avatar.pose import NodeTransforms
+from src.avatar.vrm_loader import GlbFile
+from src.avatar.wav_reader import PcmConverter, is_wav, read_wav
 
-@dataclass
-class LipSyncData:
-    """リップシンクデータ"""
+# モデルの定義によらず常に設定できる表情
+DEFAULT_EXPRESSIONS = ("happy", "angry", "sad", "relaxed", "surprised")
 
-    phoneme: str
-    start_time: float
-    end_time: float
-    intensity: float
+# 口を閉じる子音(両唇音)。それ以外の子音は続く母音の口形で発音する
+BILABIAL_CONSONANTS = frozenset({"m", "my", "p", "py", "b", "by"})
+
+# 無声化母音(大文字)・撥音・促音・無音の口形と強度
+_SPECIAL_VOWELS = {
+    "N": ("n", 1.0),
+    "cl": ("n", 0.0),
+    "pau": ("n", 0.0),
+}
+DEVOICED_INTENSITY = 0.3
+# 両唇音以外の子音区間の強度(続く母音の強度に対する比)
+CONSONANT_INTENSITY = 0.5
+
+# 音声特徴量の計算方法。librosaは初回呼び出し時にnumbaのコンパイルが走り起動が遅い
+MFCC_BACKENDS = ("numpy", "librosa")
 
 
 class ExpressionConfig(BaseModel):
@@ -41,36 +54,43 @@ class AvatarController:
         self,
         vrm_path: str,
         expression_config: ExpressionConfig | None = None,
+        mfcc_backend: str = "numpy",
     ) -> None:
         """
         Args:
             vrm_path: VRMモデルのパス
             expression_config: 表情設定
+            mfcc_backend: 音声特徴量の計算方法 ("numpy" or "librosa")
         """
+        if mfcc_backend not in MFCC_BACKENDS:
+            raise ValueError(f"Unknown MFCC backend: {mfcc_backend}")
         self.vrm_path = vrm_path
         self.expression_config = expression_config or ExpressionConfig()
+        self.mfcc_backend = mfcc_backend
         self._load_vrm()
         self._setup_lip_sync()
 
     def _load_vrm(self) -> None:
         """VRMモデルを読み込む"""
+        self.vrm: GlbFile | None = None
+        self._node_transforms: NodeTransforms | None = None
         try:
             # VRMファイルが存在しない場合は、ダミーデータで初期化
             if not Path(self.vrm_path).exists():
                 print(f"VRM file not found: {self.vrm_path}, using dummy data")
                 self.vrm_data = {"nodes": [{"translation": [0, 0, 0], "rotation": [0, 0, 0, 1]}]}
+            elif GlbFile.is_glb(self.vrm_path):
+                # バイナリ部分はメモリマップして必要になるまで読み込まない
+                self.vrm = GlbFile.open(self.vrm_path)
+                self.vrm_data = self.vrm.json
             else:
                 with Path(self.vrm_path).open("rb") as f:
                     self.vrm_data = json.load(f)
 
-            # ブレンドシェイプの初期化
-            self.blend_shapes = {
-                "happy": 0.0,
-                "angry": 0.0,
-                "sad": 0.0,
-                "relaxed": 0.0,
-                "surprised": 0.0,
-            }
+            # ブレンドシェイプの初期化(モデルに定義された表情を追加する)
+            self.blend_shapes = dict.fromkeys(DEFAULT_EXPRESSIONS, 0.0)
+            self.expressions = self.vrm.expressions() if self.vrm is not None else {}
+            self.blend_shapes.update(dict.fromkeys(self.expressions, 0.0))
 
             # リップシンク用の音素マッピング
             self.phoneme_map = {
@@ -84,18 +104,21 @@ class AvatarController:
         except Exception as e:
             print(f"Error loading VRM model: {e}")
             # テスト用にダミーデータで初期化
+            self.vrm = None
             self.vrm_data = {"nodes": [{"translation": [0, 0, 0], "rotation": [0, 0, 0, 1]}]}
-            self.blend_shapes = {
-                "happy": 0.0,
-                "angry": 0.0,
-                "sad": 0.0,
-                "relaxed": 0.0,
-                "surprised": 0.0,
-            }
+            self.expressions = {}
+            self.blend_shapes = dict.fromkeys(DEFAULT_EXPRESSIONS, 0.0)
+
+    @property
+    def node_transforms(self) -> NodeTransforms:
+        """ノードの位置・回転・拡大率の配列"""
+        if self._node_transforms is None:
+            self._node_transforms = NodeTransforms.from_nodes(self.vrm_data.get("nodes", []))
+        return self._node_transforms
 
     def _setup_lip_sync(self) -> None:
         """リップシンクの初期設定"""
-        # 音素認識用のパラメータ
+        # 音素認識用のパラメータ(WAVヘッダーを持たない音声データのサンプリングレート)
         self.sample_rate = 44100
         self.hop_length = 512
         self.win_length = 2048
@@ -109,6 +132,14 @@ class AvatarController:
             "o": np.array([0.0, 0.0, 0.0, 0.0, 0.8, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]),
             "n": np.array([0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]),
         }
+        # 一括計算用に音素テンプレートを行列にまとめる (音素数 x 次元数)
+        self._phoneme_names = list(self.phoneme_model)
+        self._phoneme_templates = np.stack([self.phoneme_model[p] for p in self._phoneme_names])
+        self._phoneme_codes = np.array([PHONEME_CODES[p] for p in self._phoneme_names], np.uint8)
+
+        # PCM変換用のバッファ(使い回すため変換から解析までを排他制御する)
+        self._pcm_converter = PcmConverter()
+        self._pcm_lock = threading.Lock()
 
     def set_expression(self, expression: ExpressionConfig) -> None:
         """表情を設定
@@ -132,52 +163,165 @@ class AvatarController:
         """音声データからリップシンクデータを生成
 
         Args:
-            audio_data: 音声データ
+            audio_data: 音声データ(WAV形式、またはfloat32のPCM)
+
+        Returns:
+            フレームごとのリップシンクデータのリスト
+        """
+        return self.lip_sync_timeline(audio_data, merge=False).to_list()
+
+    def lip_sync_timeline(self, audio_data: bytes, merge: bool = True) -> LipSyncTimeline:
+        """音声データからリップシンクのタイムラインを生成
+
+        Args:
+            audio_data: 音声データ(WAV形式、またはfloat32のPCM)
+            merge: 同じ音素が続くフレームを1区間にまとめるかどうか
+
+        Returns:
+            リップシンクのタイムライン
+        """
+        with self._pcm_lock:
+            if is_wav(audio_data):
+                # ヘッダーからサンプリングレートを取得し、PCMを一度だけfloat32に変換
+                wav = read_wav(audio_data)
+                sample_rate = wav.sample_rate
+                audio_array = self._pcm_converter.to_float32(wav)
+            else:
+                # ヘッダーのないデータはfloat32のPCMとして扱う
+                sample_rate = self.sample_rate
+                audio_array = np.frombuffer(audio_data, dtype=np.float32)
+
+            # 音声解析
+            mfcc = self._compute_mfcc(audio_array, sample_rate)
+
+        # 音素認識(簡易実装)
+        phoneme_indices, scores = self._classify_frames(mfcc.T)
+        frame_duration = self.hop_length / sample_rate
+        frame_numbers = np.arange(len(phoneme_indices))
+        return LipSyncTimeline.from_frames(
+            self._phoneme_codes[phoneme_indices],
+            frame_numbers * frame_duration,
+            (frame_numbers + 1) * frame_duration,
+            1.0 - (scores / 10.0),  # スコアを強度に変換
+            merge=merge,
+        )
+
+    def lip_sync_from_audio_query(self, audio_query: dict) -> list[LipSyncData]:
+        """VOICEVOXの音声クエリのモーラ長からリップシンクデータを生成
+
+        音声解析を行わず、合成に使った音声クエリの子音長・母音長をそのまま時刻に変換する。
+        前後の無音と句間のポーズも含めるため、合成音声と時刻が一致する。
+
+        Args:
+            audio_query: 音声設定を反映済みの音声クエリ
 
         Returns:
             リップシンクデータのリスト
         """
-        # 音声データをnumpy配列に変換
-        audio_array = np.frombuffer(audio_data, dtype=np.float32)
+        speed = audio_query.get("speedScale") or 1.0
+        segments: list[tuple[str, float, float]] = [
+            ("n", audio_query.get("prePhonemeLength", 0.0), 0.0)
+        ]
+        for accent_phrase in audio_query.get("accent_phrases", []):
+            moras = list(accent_phrase.get("moras", []))
+            if accent_phrase.get("pause_mora"):
+                moras.append(accent_phrase["pause_mora"])
+            for mora in moras:
+                phoneme, intensity = self._vowel_viseme(mora["vowel"])
+                consonant = mora.get("consonant")
+                if consonant:
+                    if consonant in BILABIAL_CONSONANTS:
+                        segments.append(("n", mora.get("consonant_length") or 0.0, 1.0))
+                    else:
+                        segments.append(
+                            (
+                                phoneme,
+                                mora.get("consonant_length") or 0.0,
+                                intensity * CONSONANT_INTENSITY,
+                            )
+                        )
+                segments.append((phoneme, mora.get("vowel_length") or 0.0, intensity))
+        segments.append(("n", audio_query.get("postPhonemeLength", 0.0), 0.0))
+
+        lip_sync_data = []
+        current = 0.0
+        for phoneme, length, intensity in segments:
+            if length <= 0.0:
+                continue
+            end = current + length / speed
+            lip_sync_data.append(LipSyncData(phoneme, current, end, intensity))
+            current = end
+        return lip_sync_data
+
+    def _vowel_viseme(self, vowel: str) -> tuple[str, float]:
+        """音声クエリの母音を口形と強度に変換"""
+        if vowel in _SPECIAL_VOWELS:
+            return _SPECIAL_VOWELS[vowel]
+        if vowel in self.phoneme_model:
+            return vowel, 1.0
+        if vowel.lower() in self.phoneme_model:
+            return vowel.lower(), DEVOICED_INTENSITY
+        return "n", 0.0
+
+    def create_lip_sync_stream(
+        self,
+        sample_rate: int | None = None,
+        dtype: str = "<i2",
+        channels: int = 1,
+    ) -> "LipSyncStream":
+        """音声チャンクを逐次解析するリップシンク解析器を作成
+
+        Args:
+            sample_rate: 入力音声のサンプリングレート(Noneの場合は既定値)
+            dtype: バイト列で入力されるPCMのデータ型
+            channels: 入力音声のチャンネル数
 
-        # 音声解析
-        mfcc = librosa.feature.mfcc(
-            y=audio_array,
-            sr=self.sample_rate,
+        Returns:
+            リップシンク解析器
+        """
+        return LipSyncStream(self, sample_rate or self.sample_rate, dtype=dtype, channels=channels)
+
+    def _compute_mfcc(self, audio_array: np.ndarray, sample_rate: int) -> np.ndarray:
+        """設定されたバックエンドでMFCCを計算"""
+        if self.mfcc_backend == "librosa":
+            import librosa
+
+            return librosa.feature.mfcc(
+                y=audio_array,
+                sr=sample_rate,
+                n_mfcc=13,
+                hop_length=self.hop_length,
+                win_length=self.win_length,
+            )
+        return mfcc_features.mfcc(
+            audio_array,
+            sample_rate,
             n_mfcc=13,
             hop_length=self.hop_length,
             win_length=self.win_length,
         )
 
-        # 音素認識(簡易実装)
-        lip_sync_data = []
-        frame_duration = self.hop_length / self.sample_rate
+    def _classify_frames(self, features: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """各フレームの特徴量に最も近い音素テンプレートを一括で求める
 
-        for i in range(mfcc.shape[1]):
-            # 現在のフレームの特徴量
-            frame_features = mfcc[:, i]
-
-            # 最も近い音素を特定
-            best_phoneme = "n"
-            best_score = float("inf")
-
-            for phoneme, features in self.phoneme_model.items():
-                score = np.linalg.norm(frame_features - features)
-                if score < best_score:
-                    best_score = score
-                    best_phoneme = phoneme
-
-            # リップシンクデータの生成
-            lip_sync_data.append(
-                LipSyncData(
-                    phoneme=best_phoneme,
-                    start_time=i * frame_duration,
-                    end_time=(i + 1) * frame_duration,
-                    intensity=1.0 - (best_score / 10.0),  # スコアを強度に変換
-                )
-            )
+        Args:
+            features: フレームごとの特徴量 (フレーム数 x 次元数)
 
-        return lip_sync_data
+        Returns:
+            音素インデックスの配列と、そのテンプレートとの距離の配列
+        """
+        # (フレーム数 x 音素数) の距離行列をブロードキャストで計算
+        diff = features[:, np.newaxis, :] - self._phoneme_templates[np.newaxis, :, :]
+        distances = np.sqrt(np.einsum("fpk,fpk->fp", diff, diff))
+        distances[np.isnan(distances)] = np.inf
+
+        indices = distances.argmin(axis=1)
+        scores = distances[np.arange(len(indices)), indices]
+
+        # 有効な距離が得られないフレームは口を閉じた状態とする
+        invalid = np.isinf(scores)
+        indices[invalid] = self._phoneme_names.index("n")
+        return indices, scores
 
     def update_pose(
         self,
@@ -194,26 +338,28 @@ class AvatarController:
         self.current_position = position
         self.current_rotation = rotation
 
-        # VRMモデルの更新
+        # VRMモデルの更新(ルートノードはノード定義にも書き戻す)
         if hasattr(self, "vrm_data"):
-            # 位置の更新
-            self.vrm_data["nodes"][0]["translation"] = list(position)
-
-            # 回転の更新(クォータニオンに変換)
-            qx = math.sin(rotation[0] / 2) * math.cos(rotation[1] / 2) * math.cos(
-                rotation[2] / 2
-            ) - math.cos(rotation[0] / 2) * math.sin(rotation[1] / 2) * math.sin(rotation[2] / 2)
-            qy = math.cos(rotation[0] / 2) * math.sin(rotation[1] / 2) * math.cos(
-                rotation[2] / 2
-            ) + math.sin(rotation[0] / 2) * math.cos(rotation[1] / 2) * math.sin(rotation[2] / 2)
-            qz = math.cos(rotation[0] / 2) * math.cos(rotation[1] / 2) * math.sin(
-                rotation[2] / 2
-            ) - math.sin(rotation[0] / 2) * math.sin(rotation[1] / 2) * math.cos(rotation[2] / 2)
-            qw = math.cos(rotation[0] / 2) * math.cos(rotation[1] / 2) * math.cos(
-                rotation[2] / 2
-            ) + math.sin(rotation[0] / 2) * math.sin(rotation[1] / 2) * math.sin(rotation[2] / 2)
-
-            self.vrm_data["nodes"][0]["rotation"] = [qx, qy, qz, qw]
+            root = np.zeros(1, dtype=np.intp)
+            self.update_poses(root, [position], [rotation])
+            self.node_transforms.write_nodes(self.vrm_data["nodes"], root)
+
+    def update_poses(
+        self,
+        nodes: np.ndarray | list[str | int],
+        positions: np.ndarray | list | None = None,
+        rotations: np.ndarray | list | None = None,
+    ) -> None:
+        """複数ノードの姿勢を一括で更新
+
+        回転はまとめてクォータニオンに変換し、`node_transforms` の配列に書き込む。
+
+        Args:
+            nodes: ノード名または番号
+            positions: (ノード数 x 3) の位置
+            rotations: (ノード数 x 3) のオイラー角(ラジアン)
+        """
+        self.node_transforms.set_pose(nodes, positions, rotations)
 
     def get_available_expressions(self) -> list[str]:
         """利用可能な表情の一覧を取得
@@ -237,3 +383,180 @@ class AvatarController:
 
         with Path(output_path).open("w") as f:
             json.dump(animation_data, f, indent=2)
+
+
+class LipSyncStream:
+    """音声チャンクを受け取るたびにリップシンクデータを生成する解析器
+
+    STFTの窓長分だけのリングバッファを持ち、ホップ長分のサンプルが揃うたびに
+    1フレームを解析する。保持するデータ量は音声の長さによらず一定。
+    フレームの位置と時刻は `AvatarController.lip_sync` (中心揃えのSTFT)と一致する。
+    振幅の下限(top_db)はそれまでに入力された音声全体の最大値を基準にする。
+    """
+
+    def __init__(
+        self,
+        controller: AvatarController,
+        sample_rate: int,
+        dtype: str = "<i2",
+        channels: int = 1,
+    ) -> None:
+        """
+        Args:
+            controller: 音素テンプレートを持つアバター制御システム
+            sample_rate: 入力音声のサンプリングレート
+            dtype: バイト列で入力されるPCMのデータ型
+            channels: 入力音声のチャンネル数
+        """
+        self.controller = controller
+        self.sample_rate = sample_rate
+        self.hop_length = controller.hop_length
+        self.win_length = controller.win_length
+        self.dtype = np.dtype(dtype)
+        self.channels = channels
+
+        self._ring = np.zeros(self.win_length, dtype=np.float32)
+        self._remainder = b""
+        self.reset()
+
+    def reset(self) -> None:
+        """解析状態を初期化"""
+        self._peak_db = -np.inf
+        self._rewind()
+
+    def _rewind(self) -> None:
+        """振幅の基準を残して、フレームの位置を先頭に戻す"""
+        self._ring.fill(0.0)
+        # 中心揃えのSTFTと同じく先頭に窓長の半分の無音を置く
+        self._write = self.win_length // 2
+        self._pending = self.win_length - self.win_length // 2
+        self._frame_index = 0
+        self._remainder = b""
+
+    @property
+    def frames_emitted(self) -> int:
+        """これまでに生成したフレーム数"""
+        return self._frame_index
+
+    def feed(self, chunk: bytes | np.ndarray, merge: bool = False) -> LipSyncTimeline:
+        """音声チャンクを解析
+
+        Args:
+            chunk: PCMのバイト列、またはサンプルの配列
+            merge: 同じ音素が続くフレームを1区間にまとめるかどうか
+
+        Returns:
+            このチャンクで確定したフレームのタイムライン
+        """
+        return self._analyze(self._to_float32(chunk), merge)
+
+    def flush(self, merge: bool = False) -> LipSyncTimeline:
+        """末尾のフレームを確定して解析状態を初期化
+
+        Args:
+            merge: 同じ音素が続くフレームを1区間にまとめるかどうか
+
+        Returns:
+            残りのフレームのタイムライン
+        """
+        result = self._analyze(self._tail_padding(), merge)
+        self.reset()
+        return result
+
+    def analyze(self, chunk: bytes | np.ndarray, merge: bool = True) -> LipSyncTimeline:
+        """区切りとなる音声(文など)をまとめて解析
+
+        時刻は `chunk` の先頭を0とし、解析後はフレームの位置を先頭に戻す。
+        振幅の基準は引き継ぐため、同じ応答の文を順に渡すと口の開きが揃う。
+
+        Args:
+            chunk: PCMのバイト列、またはサンプルの配列
+            merge: 同じ音素が続くフレームを1区間にまとめるかどうか
+
+        Returns:
+            `chunk` 全体のタイムライン
+        """
+        samples = np.concatenate([self._to_float32(chunk), self._tail_padding()])
+        self._remainder = b""
+        result = self._analyze(samples, merge)
+        self._rewind()
+        return result
+
+    def _tail_padding(self) -> np.ndarray:
+        """末尾にも窓長の半分の無音を置いて最後のフレームまで確定させる"""
+        return np.zeros(self.win_length // 2, dtype=np.float32)
+
+    def _to_float32(self, chunk: bytes | np.ndarray) -> np.ndarray:
+        """入力を-1.0〜1.0のfloat32モノラル信号に変換"""
+        if isinstance(chunk, np.ndarray):
+            samples = chunk
+        else:
+            # サンプルの途中で分割されたバイト列は次のチャンクに持ち越す
+            data = self._remainder + bytes(chunk)
+            frame_size = self.dtype.itemsize * self.channels
+            usable = len(data) - len(data) % frame_size
+            self._remainder = data[usable:]
+            samples = np.frombuffer(data, dtype=self.dtype, count=usable // self.dtype.itemsize)
+
+        if samples.dtype.kind in "iu":
+            scale = float(1 << (samples.dtype.itemsize * 8 - 1))
+            offset = scale if samples.dtype.kind == "u" else 0.0
+            samples = (samples.astype(np.float32) - offset) / scale
+        else:
+            samples = samples.astype(np.float32, copy=False)
+
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1, dtype=np.float32)
+        return samples.reshape(-1)
+
+    def _analyze(self, samples: np.ndarray, merge: bool) -> LipSyncTimeline:
+        """サンプルをリングバッファに書き込み、確定したフレームを解析"""
+        n_samples = len(samples)
+        if n_samples < self._pending:
+            n_frames = 0
+        else:
+            n_frames = 1 + (n_samples - self._pending) // self.hop_length
+        frames = np.empty((n_frames, self.win_length), dtype=np.float32)
+
+        ring = self._ring
+        size = self.win_length
+        position = 0
+        frame = 0
+        while position < n_samples:
+            take = min(self._pending, n_samples - position)
+            # リングバッファの末尾で折り返して書き込む
+            first = min(take, size - self._write)
+            ring[self._write : self._write + first] = samples[position : position + first]
+            ring[: take - first] = samples[position + first : position + take]
+            self._write = (self._write + take) % size
+            position += take
+            self._pending -= take
+
+            if self._pending == 0:
+                # 書き込み位置が最も古いサンプルを指すので、そこから窓を並べ直す
+                frames[frame, : size - self._write] = ring[self._write :]
+                frames[frame, size - self._write :] = ring[: self._write]
+                frame += 1
+                self._pending = self.hop_length
+
+        return self._frames_to_timeline(frames, merge)
+
+    def _frames_to_timeline(self, frames: np.ndarray, merge: bool) -> LipSyncTimeline:
+        """窓単位のフレームからタイムラインを生成"""
+        log_mel = mfcc_features.log_mel_from_frames(frames, self.sample_rate)
+        if log_mel.size:
+            # 振幅の下限(top_db)はチャンク単位ではなく入力全体の最大値を基準にする
+            self._peak_db = max(self._peak_db, float(log_mel.max()))
+        mfcc = mfcc_features.mfcc_from_log_mel(log_mel, n_mfcc=13, peak_db=self._peak_db)
+
+        phoneme_indices, scores = self.controller._classify_frames(mfcc.T)
+        frame_duration = self.hop_length / self.sample_rate
+        frame_numbers = self._frame_index + np.arange(len(phoneme_indices))
+        self._frame_index += len(phoneme_indices)
+        return LipSyncTimeline.from_frames(
+            self.controller._phoneme_codes[phoneme_indices],
+            frame_numbers * frame_duration,
+            (frame_numbers + 1) * frame_duration,
+            1.0 - (scores / 10.0),
+            merge=merge,
+        )
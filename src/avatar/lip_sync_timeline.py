@@ -0,0 +1,214 @@
+"""
+リップシンクのタイムライン
+音素・時刻・強度をNumPy配列で保持し、同じ音素が続く区間をまとめて扱う
+"""
+
+from collections.abc import Iterable, Iterator, Sequence
+from dataclasses import dataclass
+
+import numpy as np
+
+# 音素コードと音素の対応(AvatarController.phoneme_mapと同じ並び)
+PHONEMES = ("a", "i", "u", "e", "o", "n")
+PHONEME_CODES = {phoneme: code for code, phoneme in enumerate(PHONEMES)}
+
+
+@dataclass
+class LipSyncData:
+    """リップシンクデータ"""
+
+    phoneme: str
+    start_time: float
+    end_time: float
+    intensity: float
+
+
+class LipSyncTimeline:
+    """配列で保持するリップシンクのタイムライン
+
+    区間は開始時刻の昇順に並び、互いに重ならない。
+    `at` は二分探索で指定時刻の区間を求めるため、描画フレームごとの参照に向く。
+    イテレーションや添字アクセスでは `LipSyncData` として取り出せる。
+    """
+
+    __slots__ = ("codes", "end_times", "intensities", "start_times")
+
+    def __init__(
+        self,
+        codes: np.ndarray,
+        start_times: np.ndarray,
+        end_times: np.ndarray,
+        intensities: np.ndarray,
+    ) -> None:
+        """
+        Args:
+            codes: 音素コード(`PHONEMES` の添字)
+            start_times: 区間の開始時刻(秒)
+            end_times: 区間の終了時刻(秒)
+            intensities: 区間の強度
+        """
+        self.codes = np.asarray(codes, dtype=np.uint8)
+        self.start_times = np.asarray(start_times, dtype=np.float32)
+        self.end_times = np.asarray(end_times, dtype=np.float32)
+        self.intensities = np.asarray(intensities, dtype=np.float32)
+
+    @classmethod
+    def from_frames(
+        cls,
+        codes: np.ndarray,
+        start_times: np.ndarray,
+        end_times: np.ndarray,
+        intensities: np.ndarray,
+        merge: bool = True,
+    ) -> "LipSyncTimeline":
+        """フレーム単位の解析結果からタイムラインを作成
+
+        Args:
+            codes: フレームごとの音素コード
+            start_times: フレームの開始時刻(秒)
+            end_times: フレームの終了時刻(秒)
+            intensities: フレームの強度
+            merge: 同じ音素が続くフレームを1区間にまとめるかどうか
+
+        Returns:
+            タイムライン
+        """
+        codes = np.asarray(codes, dtype=np.uint8)
+        start_times = np.asarray(start_times, dtype=np.float64)
+        end_times = np.asarray(end_times, dtype=np.float64)
+        intensities = np.asarray(intensities, dtype=np.float64)
+        if not merge or len(codes) == 0:
+            return cls(codes, start_times, end_times, intensities)
+
+        # 音素が切り替わる位置を区間の先頭とする
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        ends = np.r_[starts[1:], len(codes)] - 1
+
+        # 区間の強度はフレームの長さで重み付けした平均
+        durations = end_times - start_times
+        weighted = np.add.reduceat(intensities * durations, starts)
+        total = np.add.reduceat(durations, starts)
+        counts = np.diff(np.r_[starts, len(codes)])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            merged = np.where(
+                total > 0, weighted / total, np.add.reduceat(intensities, starts) / counts
+            )
+
+        return cls(codes[starts], start_times[starts], end_times[ends], merged)
+
+    @classmethod
+    def from_lip_sync_data(
+        cls, lip_sync_data: Iterable[LipSyncData], merge: bool = True
+    ) -> "LipSyncTimeline":
+        """`LipSyncData` の列からタイムラインを作成
+
+        Args:
+            lip_sync_data: リップシンクデータ
+            merge: 同じ音素が続く区間を1区間にまとめるかどうか
+
+        Returns:
+            タイムライン
+        """
+        data = list(lip_sync_data)
+        return cls.from_frames(
+            np.array([PHONEME_CODES[d.phoneme] for d in data], dtype=np.uint8),
+            np.array([d.start_time for d in data], dtype=np.float64),
+            np.array([d.end_time for d in data], dtype=np.float64),
+            np.array([d.intensity for d in data], dtype=np.float64),
+            merge=merge,
+        )
+
+    @property
+    def duration(self) -> float:
+        """タイムラインの終了時刻(秒)"""
+        return float(self.end_times[-1]) if len(self) else 0.0
+
+    @property
+    def nbytes(self) -> int:
+        """配列の合計バイト数"""
+        return (
+            self.codes.nbytes
+            + self.start_times.nbytes
+            + self.end_times.nbytes
+            + self.intensities.nbytes
+        )
+
+    def index_at(self, time: float) -> int:
+        """指定時刻を含む区間の添字を取得
+
+        Args:
+            time: 時刻(秒)
+
+        Returns:
+            区間の添字(該当する区間がない場合は-1)
+        """
+        index = int(np.searchsorted(self.start_times, time, side="right")) - 1
+        if index < 0 or time >= self.end_times[index]:
+            return -1
+        return index
+
+    def at(self, time: float) -> LipSyncData | None:
+        """指定時刻のリップシンクデータを取得
+
+        Args:
+            time: 時刻(秒)
+
+        Returns:
+            リップシンクデータ(該当する区間がない場合はNone)
+        """
+        index = self.index_at(time)
+        return self[index] if index >= 0 else None
+
+    def sample(self, times: Sequence[float] | np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """複数の時刻の音素コードと強度を一括で取得
+
+        区間外の時刻は口を閉じた状態(`n`、強度0)とする。
+
+        Args:
+            times: 時刻(秒)の配列
+
+        Returns:
+            音素コードの配列と強度の配列
+        """
+        times = np.asarray(times, dtype=np.float32)
+        indices = np.searchsorted(self.start_times, times, side="right") - 1
+        clipped = np.clip(indices, 0, max(len(self) - 1, 0))
+        if len(self):
+            inside = (indices >= 0) & (times < self.end_times[clipped])
+            codes = np.where(inside, self.codes[clipped], PHONEME_CODES["n"])
+            intensities = np.where(inside, self.intensities[clipped], 0.0)
+        else:
+            codes = np.full(times.shape, PHONEME_CODES["n"])
+            intensities = np.zeros(times.shape)
+        return codes.astype(np.uint8), intensities.astype(np.float32)
+
+    def to_list(self) -> list[LipSyncData]:
+        """`LipSyncData` のリストに変換"""
+        return list(self)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, index: int) -> LipSyncData:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("timeline index out of range")
+        return LipSyncData(
+            phoneme=PHONEMES[self.codes[index]],
+            start_time=float(self.start_times[index]),
+            end_time=float(self.end_times[index]),
+            intensity=float(self.intensities[index]),
+        )
+
+    def __iter__(self) -> Iterator[LipSyncData]:
+        for code, start, end, intensity in zip(
+            self.codes.tolist(),
+            self.start_times.tolist(),
+            self.end_times.tolist(),
+            self.intensities.tolist(),
+        ):
+            yield LipSyncData(PHONEMES[code], start, end, intensity)
+
+    def __repr__(self) -> str:
+        return f"LipSyncTimeline(segments={len(self)}, duration={self.duration:.3f})"
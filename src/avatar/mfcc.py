@@ -0,0 +1,209 @@
+"""
+NumPyのみによるMFCCの計算
+librosaの既定値(Slaneyメル尺度・中心揃えのSTFT・直交DCT-II)と同じ結果を返す
+"""
+
+import functools
+
+import numpy as np
+
+# librosa.power_to_db の既定値
+AMIN = 1e-10
+TOP_DB = 80.0
+
+
+def hz_to_mel(frequencies: np.ndarray | float) -> np.ndarray:
+    """周波数をメル尺度(Slaney)に変換"""
+    frequencies = np.asanyarray(frequencies, dtype=np.float64)
+    f_sp = 200.0 / 3
+    mels = frequencies / f_sp
+    # 1kHz以上は対数尺度
+    min_log_hz = 1000.0
+    min_log_mel = min_log_hz / f_sp
+    logstep = np.log(6.4) / 27.0
+    log_region = frequencies >= min_log_hz
+    mels = np.where(
+        log_region,
+        min_log_mel + np.log(np.maximum(frequencies, min_log_hz) / min_log_hz) / logstep,
+        mels,
+    )
+    return mels
+
+
+def mel_to_hz(mels: np.ndarray | float) -> np.ndarray:
+    """メル尺度(Slaney)を周波数に変換"""
+    mels = np.asanyarray(mels, dtype=np.float64)
+    f_sp = 200.0 / 3
+    min_log_hz = 1000.0
+    min_log_mel = min_log_hz / f_sp
+    logstep = np.log(6.4) / 27.0
+    return np.where(
+        mels >= min_log_mel,
+        min_log_hz * np.exp(logstep * (mels - min_log_mel)),
+        f_sp * mels,
+    )
+
+
+@functools.lru_cache(maxsize=16)
+def mel_filterbank(sample_rate: int, n_fft: int, n_mels: int = 128) -> np.ndarray:
+    """メルフィルタバンク行列を取得
+
+    Args:
+        sample_rate: サンプリングレート
+        n_fft: FFT長
+        n_mels: メル帯域数
+
+    Returns:
+        (メル帯域数 x 周波数ビン数) の行列(読み取り専用)
+    """
+    fft_freqs = np.fft.rfftfreq(n_fft, 1.0 / sample_rate)
+    mel_freqs = mel_to_hz(np.linspace(hz_to_mel(0.0), hz_to_mel(sample_rate / 2.0), n_mels + 2))
+
+    # 三角フィルタの上り・下りの傾き
+    fdiff = np.diff(mel_freqs)
+    ramps = np.subtract.outer(mel_freqs, fft_freqs)
+    lower = -ramps[:-2] / fdiff[:-1, np.newaxis]
+    upper = ramps[2:] / fdiff[1:, np.newaxis]
+    weights = np.maximum(0.0, np.minimum(lower, upper))
+
+    # Slaney正規化(帯域幅あたりのエネルギーを揃える)
+    enorm = 2.0 / (mel_freqs[2 : n_mels + 2] - mel_freqs[:n_mels])
+    weights *= enorm[:, np.newaxis]
+
+    filterbank: np.ndarray = weights.astype(np.float32)
+    filterbank.flags.writeable = False
+    return filterbank
+
+
+@functools.lru_cache(maxsize=16)
+def dct_matrix(n_mfcc: int, n_mels: int) -> np.ndarray:
+    """直交正規化したDCT-II行列を取得
+
+    Args:
+        n_mfcc: 出力する係数の数
+        n_mels: メル帯域数
+
+    Returns:
+        (係数の数 x メル帯域数) の行列(読み取り専用)
+    """
+    k = np.arange(n_mfcc)[:, np.newaxis]
+    n = np.arange(n_mels)[np.newaxis, :]
+    basis = np.cos(np.pi * k * (2 * n + 1) / (2 * n_mels)) * np.sqrt(2.0 / n_mels)
+    basis[0] /= np.sqrt(2.0)
+    matrix: np.ndarray = basis.astype(np.float32)
+    matrix.flags.writeable = False
+    return matrix
+
+
+@functools.lru_cache(maxsize=16)
+def hann_window(win_length: int, n_fft: int) -> np.ndarray:
+    """FFT長の中央に配置した周期的なハン窓を取得"""
+    window = 0.5 - 0.5 * np.cos(2.0 * np.pi * np.arange(win_length) / win_length)
+    padded = np.zeros(n_fft, dtype=np.float32)
+    offset = (n_fft - win_length) // 2
+    padded[offset : offset + win_length] = window
+    padded.flags.writeable = False
+    return padded
+
+
+def log_mel_from_frames(
+    frames: np.ndarray,
+    sample_rate: int,
+    n_mels: int = 128,
+    win_length: int | None = None,
+) -> np.ndarray:
+    """窓掛け前のフレームから対数メルスペクトログラムを計算
+
+    振幅の下限(top_db)によるクリップは行わない。
+
+    Args:
+        frames: (フレーム数 x FFT長) のフレーム
+        sample_rate: サンプリングレート
+        n_mels: メル帯域数
+        win_length: 窓長(Noneの場合はFFT長)
+
+    Returns:
+        (メル帯域数 x フレーム数) の対数メルスペクトログラム(dB)
+    """
+    n_fft = frames.shape[1]
+    window = hann_window(win_length or n_fft, n_fft)
+    spectrum = np.fft.rfft(frames * window, axis=1)
+    power = (spectrum.real**2 + spectrum.imag**2).astype(np.float32)
+
+    mel = mel_filterbank(sample_rate, n_fft, n_mels) @ power.T
+    log_mel: np.ndarray = 10.0 * np.log10(np.maximum(AMIN, mel))
+    return log_mel
+
+
+def mfcc_from_log_mel(
+    log_mel: np.ndarray, n_mfcc: int = 13, peak_db: float | None = None
+) -> np.ndarray:
+    """対数メルスペクトログラムからMFCCを計算
+
+    Args:
+        log_mel: (メル帯域数 x フレーム数) の対数メルスペクトログラム(dB)
+        n_mfcc: 出力する係数の数
+        peak_db: 振幅の下限(top_db)の基準にする最大値(Noneの場合は `log_mel` の最大値)
+
+    Returns:
+        (係数の数 x フレーム数) のMFCC
+    """
+    if log_mel.size:
+        peak = log_mel.max() if peak_db is None else peak_db
+        log_mel = np.maximum(log_mel, peak - TOP_DB)
+    coefficients: np.ndarray = dct_matrix(n_mfcc, log_mel.shape[0]) @ log_mel
+    return coefficients
+
+
+def mfcc_from_frames(
+    frames: np.ndarray,
+    sample_rate: int,
+    n_mfcc: int = 13,
+    n_mels: int = 128,
+    win_length: int | None = None,
+) -> np.ndarray:
+    """窓掛け前のフレームからMFCCを計算
+
+    Args:
+        frames: (フレーム数 x FFT長) のフレーム
+        sample_rate: サンプリングレート
+        n_mfcc: 出力する係数の数
+        n_mels: メル帯域数
+        win_length: 窓長(Noneの場合はFFT長)
+
+    Returns:
+        (係数の数 x フレーム数) のMFCC
+    """
+    log_mel = log_mel_from_frames(frames, sample_rate, n_mels, win_length)
+    return mfcc_from_log_mel(log_mel, n_mfcc)
+
+
+def mfcc(
+    y: np.ndarray,
+    sample_rate: int,
+    n_mfcc: int = 13,
+    n_fft: int = 2048,
+    hop_length: int = 512,
+    win_length: int | None = None,
+    n_mels: int = 128,
+) -> np.ndarray:
+    """音声信号からMFCCを計算(`librosa.feature.mfcc` 相当)
+
+    Args:
+        y: 音声信号
+        sample_rate: サンプリングレート
+        n_mfcc: 出力する係数の数
+        n_fft: FFT長
+        hop_length: フレームの間隔(サンプル数)
+        win_length: 窓長(Noneの場合はFFT長)
+        n_mels: メル帯域数
+
+    Returns:
+        (係数の数 x フレーム数) のMFCC
+    """
+    # 中心揃えのため両端をFFT長の半分だけ無音で埋める
+    padded = np.pad(np.asarray(y, dtype=np.float32), n_fft // 2)
+    if len(padded) < n_fft:
+        return np.zeros((n_mfcc, 0), dtype=np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(padded, n_fft)[::hop_length]
+    return mfcc_from_frames(frames, sample_rate, n_mfcc, n_mels, win_length)
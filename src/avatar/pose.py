@@ -0,0 +1,191 @@
+"""
+姿勢の一括計算
+オイラー角からクォータニオンへの変換、キーフレーム間の球面線形補間、ノード変換の配列を扱う
+"""
+
+import numpy as np
+
+# 補間元と補間先がほぼ同じ向きの場合は線形補間に切り替える
+_SLERP_LINEAR_THRESHOLD = 0.9995
+
+
+def euler_to_quaternion(euler: np.ndarray | list) -> np.ndarray:
+    """オイラー角(x, y, z)をクォータニオン(x, y, z, w)に一括変換
+
+    Args:
+        euler: (..., 3) のオイラー角(ラジアン)
+
+    Returns:
+        (..., 4) のクォータニオン
+    """
+    half = np.asarray(euler, dtype=np.float64) * 0.5
+    cos = np.cos(half)
+    sin = np.sin(half)
+    cr, cp, cy = cos[..., 0], cos[..., 1], cos[..., 2]
+    sr, sp, sy = sin[..., 0], sin[..., 1], sin[..., 2]
+
+    quaternion = np.empty((*half.shape[:-1], 4), dtype=np.float64)
+    quaternion[..., 0] = sr * cp * cy - cr * sp * sy
+    quaternion[..., 1] = cr * sp * cy + sr * cp * sy
+    quaternion[..., 2] = cr * cp * sy - sr * sp * cy
+    quaternion[..., 3] = cr * cp * cy + sr * sp * sy
+    return quaternion
+
+
+def slerp(q0: np.ndarray, q1: np.ndarray, t: np.ndarray | float) -> np.ndarray:
+    """クォータニオンの球面線形補間(ブロードキャスト対応)
+
+    Args:
+        q0: (..., 4) の補間元
+        q1: (..., 4) の補間先
+        t: 補間率(0〜1、q0・q1の先頭の次元とブロードキャストできる形)
+
+    Returns:
+        (..., 4) の正規化されたクォータニオン
+    """
+    q0 = np.asarray(q0, dtype=np.float64)
+    q1 = np.asarray(q1, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64)[..., np.newaxis]
+
+    dot = np.sum(q0 * q1, axis=-1, keepdims=True)
+    # 最短経路で補間するため、内積が負の場合は補間先を反転する
+    q1 = np.where(dot < 0.0, -q1, q1)
+    dot = np.abs(dot)
+
+    theta = np.arccos(np.clip(dot, -1.0, 1.0))
+    sin_theta = np.sin(theta)
+    linear = dot > _SLERP_LINEAR_THRESHOLD
+    safe_sin = np.where(linear, 1.0, sin_theta)
+    w0 = np.where(linear, 1.0 - t, np.sin((1.0 - t) * theta) / safe_sin)
+    w1 = np.where(linear, t, np.sin(t * theta) / safe_sin)
+
+    result: np.ndarray = w0 * q0 + w1 * q1
+    result /= np.linalg.norm(result, axis=-1, keepdims=True)
+    return result
+
+
+def interpolate_keyframes(
+    key_times: np.ndarray, key_rotations: np.ndarray, times: np.ndarray | float
+) -> np.ndarray:
+    """キーフレームの回転を指定時刻で補間
+
+    範囲外の時刻は最初または最後のキーフレームの値とする。
+
+    Args:
+        key_times: (K,) の昇順のキーフレーム時刻
+        key_rotations: (K, ..., 4) のキーフレームの回転
+        times: (T,) の時刻、またはスカラー
+
+    Returns:
+        (T, ..., 4) の回転(スカラーの時刻の場合は (..., 4))
+    """
+    key_times = np.asarray(key_times, dtype=np.float64)
+    key_rotations = np.asarray(key_rotations, dtype=np.float64)
+    scalar = np.ndim(times) == 0
+    times = np.atleast_1d(np.asarray(times, dtype=np.float64))
+
+    if len(key_times) == 1:
+        result = np.broadcast_to(key_rotations[0], (len(times), *key_rotations.shape[1:])).copy()
+        return result[0] if scalar else result
+
+    # 各時刻を挟むキーフレームの組を二分探索で求める
+    upper = np.clip(np.searchsorted(key_times, times, side="right"), 1, len(key_times) - 1)
+    lower = upper - 1
+    span = key_times[upper] - key_times[lower]
+    t = np.clip((times - key_times[lower]) / np.where(span > 0, span, 1.0), 0.0, 1.0)
+
+    # キーフレームの先頭以外の次元に補間率をブロードキャストする
+    t = t.reshape(t.shape + (1,) * (key_rotations.ndim - 2))
+    result = slerp(key_rotations[lower], key_rotations[upper], t)
+    return result[0] if scalar else result
+
+
+class NodeTransforms:
+    """ノードの位置・回転・拡大率を配列で保持する
+
+    各配列は (ノード数 x 成分数) で、ノードの番号で一括して更新できる。
+    """
+
+    def __init__(self, names: list[str], count: int | None = None) -> None:
+        """
+        Args:
+            names: ノード名
+            count: ノード数(Noneの場合は名前の数)
+        """
+        count = len(names) if count is None else count
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.translation = np.zeros((count, 3), dtype=np.float32)
+        self.rotation = np.zeros((count, 4), dtype=np.float32)
+        self.rotation[:, 3] = 1.0
+        self.scale = np.ones((count, 3), dtype=np.float32)
+
+    @classmethod
+    def from_nodes(cls, nodes: list[dict]) -> "NodeTransforms":
+        """glTFのノード定義から作成
+
+        Args:
+            nodes: glTFの `nodes`
+
+        Returns:
+            ノード変換
+        """
+        transforms = cls([node.get("name", f"node_{i}") for i, node in enumerate(nodes)])
+        for i, node in enumerate(nodes):
+            if "translation" in node:
+                transforms.translation[i] = node["translation"]
+            if "rotation" in node:
+                transforms.rotation[i] = node["rotation"]
+            if "scale" in node:
+                transforms.scale[i] = node["scale"]
+        return transforms
+
+    def __len__(self) -> int:
+        return len(self.translation)
+
+    def indices(self, nodes: list[str | int] | np.ndarray) -> np.ndarray:
+        """ノード名または番号の列を番号の配列に変換
+
+        整数の配列はコピーせずに変換し、名前を含む場合だけ1件ずつ番号を引く。
+        """
+        if isinstance(nodes, np.ndarray) and nodes.dtype.kind in "iu":
+            return nodes.astype(np.intp, copy=False)
+        if not any(isinstance(node, str) for node in nodes):
+            return np.asarray(nodes, dtype=np.intp)
+        return np.array(
+            [self.index[node] if isinstance(node, str) else node for node in nodes], dtype=np.intp
+        )
+
+    def set_pose(
+        self,
+        nodes: np.ndarray | list[str | int],
+        positions: np.ndarray | list | None = None,
+        rotations: np.ndarray | list | None = None,
+    ) -> None:
+        """複数ノードの位置と回転を一括で設定
+
+        Args:
+            nodes: ノード名または番号
+            positions: (ノード数 x 3) の位置
+            rotations: (ノード数 x 3) のオイラー角(ラジアン)
+        """
+        indices = self.indices(nodes)
+        if positions is not None:
+            self.translation[indices] = positions
+        if rotations is not None:
+            self.rotation[indices] = euler_to_quaternion(rotations)
+
+    def write_nodes(self, nodes: list[dict], indices: np.ndarray | None = None) -> None:
+        """glTFのノード定義に書き戻す
+
+        Args:
+            nodes: 書き込み先のglTFの `nodes`
+            indices: 書き戻すノードの番号(Noneの場合は全ノード)
+        """
+        if indices is None:
+            indices = np.arange(len(nodes))
+        translations = self.translation[indices].tolist()
+        rotations = self.rotation[indices].tolist()
+        for i, translation, rotation in zip(indices.tolist(), translations, rotations):
+            nodes[i]["translation"] = translation
+            nodes[i]["rotation"] = rotation
@@ -0,0 +1,294 @@
+"""
+GLB/VRMファイルの読み込み
+ファイルをメモリマップし、JSONチャンクのみを解析してバイナリデータは必要時に参照する
+"""
+
+import contextlib
+import json
+import mmap
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+GLB_MAGIC = b"glTF"
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+
+# glTFのcomponentTypeとNumPyの型の対応
+_COMPONENT_DTYPES: dict[int, np.dtype] = {
+    5120: np.dtype("i1"),
+    5121: np.dtype("u1"),
+    5122: np.dtype("<i2"),
+    5123: np.dtype("<u2"),
+    5125: np.dtype("<u4"),
+    5126: np.dtype("<f4"),
+}
+
+# glTFのaccessor.typeと要素数の対応
+_TYPE_SIZES = {
+    "SCALAR": 1,
+    "VEC2": 2,
+    "VEC3": 3,
+    "VEC4": 4,
+    "MAT2": 4,
+    "MAT3": 9,
+    "MAT4": 16,
+}
+
+# VRM 0.xのプリセット名とVRM 1.0の表情名の対応
+VRM0_PRESET_NAMES = {
+    "joy": "happy",
+    "angry": "angry",
+    "sorrow": "sad",
+    "fun": "relaxed",
+    "surprised": "surprised",
+    "a": "aa",
+    "i": "ih",
+    "u": "ou",
+    "e": "ee",
+    "o": "oh",
+    "blink": "blink",
+    "blink_l": "blinkLeft",
+    "blink_r": "blinkRight",
+    "lookup": "lookUp",
+    "lookdown": "lookDown",
+    "lookleft": "lookLeft",
+    "lookright": "lookRight",
+    "neutral": "neutral",
+}
+
+
+@dataclass
+class MorphTargetBind:
+    """表情が参照するブレンドシェイプ"""
+
+    mesh: int
+    index: int
+    weight: float
+
+
+class GlbFile:
+    """GLB形式(バイナリglTF)のファイル
+
+    JSONチャンクは読み込み時に解析し、BINチャンクは元のバッファを参照する
+    `memoryview` として保持する。アクセサーは初回参照時にコピーなしの配列として作成する。
+    """
+
+    def __init__(self, data: bytes | mmap.mmap | memoryview) -> None:
+        """
+        Args:
+            data: GLB形式のデータ
+
+        Raises:
+            ValueError: GLB形式でない場合
+        """
+        self._data = data
+        view = memoryview(data)
+        if len(view) < 12 or bytes(view[:4]) != GLB_MAGIC:
+            raise ValueError("Not a GLB file")
+        version, length = struct.unpack_from("<II", view, 4)
+        if version != 2:
+            raise ValueError(f"Unsupported GLB version: {version}")
+        length = min(length, len(view))
+
+        document: dict[str, Any] | None = None
+        self.bin: memoryview | None = None
+        offset = 12
+        while offset + 8 <= length:
+            chunk_length, chunk_type = struct.unpack_from("<II", view, offset)
+            body = offset + 8
+            if chunk_type == CHUNK_JSON and document is None:
+                document = json.loads(bytes(view[body : body + chunk_length]))
+            elif chunk_type == CHUNK_BIN and self.bin is None:
+                self.bin = view[body : body + chunk_length]
+            offset = body + chunk_length
+        if document is None:
+            raise ValueError("GLB file is missing JSON chunk")
+        self.json: dict[str, Any] = document
+
+        self._accessors: dict[int, np.ndarray] = {}
+
+    @classmethod
+    def open(cls, path: str | Path) -> "GlbFile":
+        """ファイルをメモリマップして開く
+
+        Args:
+            path: GLB/VRMファイルのパス
+
+        Returns:
+            読み込んだファイル
+        """
+        with Path(path).open("rb") as f:
+            # マップはファイルを閉じた後も有効
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapped)
+
+    @staticmethod
+    def is_glb(path: str | Path) -> bool:
+        """ファイルがGLB形式かどうかを判定"""
+        with Path(path).open("rb") as f:
+            return f.read(4) == GLB_MAGIC
+
+    def buffer_view(self, index: int) -> memoryview:
+        """バッファビューのデータを取得
+
+        Args:
+            index: バッファビューの番号
+
+        Returns:
+            BINチャンクを参照するデータ
+        """
+        buffer_view = self.json["bufferViews"][index]
+        if buffer_view.get("buffer", 0) != 0 or self.bin is None:
+            raise ValueError("Only the GLB-stored buffer is supported")
+        start = buffer_view.get("byteOffset", 0)
+        return self.bin[start : start + buffer_view["byteLength"]]
+
+    def accessor(self, index: int) -> np.ndarray:
+        """アクセサーのデータを配列として取得
+
+        データはコピーせずBINチャンクを参照する(読み取り専用)。
+
+        Args:
+            index: アクセサーの番号
+
+        Returns:
+            (要素数 x 成分数) の配列(SCALARの場合は1次元)
+        """
+        cached = self._accessors.get(index)
+        if cached is not None:
+            return cached
+
+        accessor = self.json["accessors"][index]
+        if "sparse" in accessor:
+            raise ValueError("Sparse accessors are not supported")
+        dtype = _COMPONENT_DTYPES[accessor["componentType"]]
+        components = _TYPE_SIZES[accessor["type"]]
+        count = accessor["count"]
+
+        array: np.ndarray
+        if "bufferView" not in accessor:
+            # バッファビューのないアクセサーは0で埋めた値を表す
+            array = np.zeros((count, components), dtype=dtype)
+        else:
+            buffer_view = self.json["bufferViews"][accessor["bufferView"]]
+            data = self.buffer_view(accessor["bufferView"])
+            element_size = dtype.itemsize * components
+            stride = buffer_view.get("byteStride") or element_size
+            array = np.ndarray(
+                shape=(count, components),
+                dtype=dtype,
+                buffer=data,
+                offset=accessor.get("byteOffset", 0),
+                strides=(stride, dtype.itemsize),
+            )
+
+        if components == 1:
+            array = array[:, 0]
+        array.flags.writeable = False
+        self._accessors[index] = array
+        return array
+
+    def node_transforms(self) -> list[dict]:
+        """ノードの名前と位置・回転・拡大率を取得
+
+        Returns:
+            ノードごとの `name`・`translation`・`rotation`・`scale`
+        """
+        return [
+            {
+                "name": node.get("name", f"node_{i}"),
+                "translation": node.get("translation", [0.0, 0.0, 0.0]),
+                "rotation": node.get("rotation", [0.0, 0.0, 0.0, 1.0]),
+                "scale": node.get("scale", [1.0, 1.0, 1.0]),
+            }
+            for i, node in enumerate(self.json.get("nodes", []))
+        ]
+
+    def morph_target_names(self, mesh: int) -> list[str]:
+        """メッシュのブレンドシェイプ名を取得"""
+        mesh_data = self.json["meshes"][mesh]
+        names = mesh_data.get("extras", {}).get("targetNames")
+        if names is None:
+            primitives = mesh_data.get("primitives", [])
+            names = primitives[0].get("extras", {}).get("targetNames", []) if primitives else []
+        return list(names)
+
+    def morph_target(
+        self, mesh: int, target: int, attribute: str = "POSITION", primitive: int = 0
+    ) -> np.ndarray:
+        """ブレンドシェイプの頂点差分を取得
+
+        Args:
+            mesh: メッシュの番号
+            target: ブレンドシェイプの番号
+            attribute: 取得する属性
+            primitive: プリミティブの番号
+
+        Returns:
+            (頂点数 x 3) の差分の配列
+        """
+        targets = self.json["meshes"][mesh]["primitives"][primitive]["targets"]
+        return self.accessor(targets[target][attribute])
+
+    def expressions(self) -> dict[str, list[MorphTargetBind]]:
+        """VRMの表情定義を取得
+
+        VRM 1.0 (`VRMC_vrm`) とVRM 0.x (`VRM`) の両方に対応し、
+        VRM 0.xのプリセット名はVRM 1.0の表情名に変換する。
+
+        Returns:
+            表情名と参照するブレンドシェイプの対応
+        """
+        extensions = self.json.get("extensions", {})
+        result: dict[str, list[MorphTargetBind]] = {}
+
+        if "VRMC_vrm" in extensions:
+            expressions = extensions["VRMC_vrm"].get("expressions", {})
+            nodes = self.json.get("nodes", [])
+            for group in ("preset", "custom"):
+                for name, expression in expressions.get(group, {}).items():
+                    result[name] = [
+                        MorphTargetBind(
+                            mesh=nodes[bind["node"]].get("mesh", -1),
+                            index=bind["index"],
+                            weight=bind.get("weight", 1.0),
+                        )
+                        for bind in expression.get("morphTargetBinds", [])
+                    ]
+        elif "VRM" in extensions:
+            groups = extensions["VRM"].get("blendShapeMaster", {}).get("blendShapeGroups", [])
+            for group in groups:
+                preset = group.get("presetName", "unknown")
+                name = VRM0_PRESET_NAMES.get(preset) or group.get("name", preset)
+                # VRM 0.xのウェイトは0〜100
+                result[name] = [
+                    MorphTargetBind(
+                        mesh=bind["mesh"],
+                        index=bind["index"],
+                        weight=bind.get("weight", 100.0) / 100.0,
+                    )
+                    for bind in group.get("binds", [])
+                ]
+        return result
+
+    def close(self) -> None:
+        """メモリマップを閉じる
+
+        閉じた後はバッファビューとアクセサーを参照できない。
+        """
+        self._accessors.clear()
+        self.bin = None
+        if isinstance(self._data, mmap.mmap):
+            # 参照中の配列が残っている場合はガベージコレクションに任せる
+            with contextlib.suppress(BufferError):
+                self._data.close()
+
+    def __enter__(self) -> "GlbFile":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
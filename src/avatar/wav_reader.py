@@ -0,0 +1,172 @@
+"""
+WAVデータの読み込み
+RIFFヘッダーを解析し、PCMデータをコピーせずにNumPy配列として参照する
+"""
+
+import struct
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+
+# WAVEフォーマットタグ
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+_PCM_DTYPES: dict[int, np.dtype[Any]] = {
+    8: np.dtype(np.uint8),
+    16: np.dtype("<i2"),
+    32: np.dtype("<i4"),
+}
+
+
+@dataclass
+class WavAudio:
+    """WAVデータのヘッダー情報とPCMデータ"""
+
+    sample_rate: int
+    channels: int
+    bits_per_sample: int
+    format_tag: int
+    pcm: memoryview
+
+    @property
+    def n_frames(self) -> int:
+        """チャンネルあたりのサンプル数"""
+        return len(self.pcm) // (self.channels * self.bits_per_sample // 8)
+
+    @property
+    def duration(self) -> float:
+        """再生時間(秒)"""
+        return self.n_frames / self.sample_rate
+
+    def samples(self) -> np.ndarray:
+        """PCMデータをコピーせずに参照する配列を取得
+
+        Returns:
+            (サンプル数 x チャンネル数) の配列
+        """
+        dtype: np.dtype[Any]
+        if self.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+            dtype = np.dtype("<f4") if self.bits_per_sample == 32 else np.dtype("<f8")
+        else:
+            dtype = _PCM_DTYPES[self.bits_per_sample]
+        count = self.n_frames * self.channels
+        return np.frombuffer(self.pcm, dtype=dtype, count=count).reshape(-1, self.channels)
+
+
+def is_wav(data: bytes | memoryview) -> bool:
+    """データがRIFF WAV形式かどうかを判定
+
+    Args:
+        data: 判定するデータ
+
+    Returns:
+        RIFF WAV形式の場合はTrue
+    """
+    return len(data) >= 12 and bytes(data[:4]) == b"RIFF" and bytes(data[8:12]) == b"WAVE"
+
+
+def read_wav(data: bytes | memoryview) -> WavAudio:
+    """WAVデータを解析
+
+    PCMデータは元のバッファを参照する `memoryview` として保持する。
+
+    Args:
+        data: RIFF WAV形式のデータ
+
+    Returns:
+        解析結果
+
+    Raises:
+        ValueError: WAV形式でない場合、または未対応のフォーマットの場合
+    """
+    view = memoryview(data).cast("B")
+    if not is_wav(view):
+        raise ValueError("Not a RIFF WAVE file")
+
+    fmt: tuple[int, int, int, int] | None = None
+    pcm: memoryview | None = None
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset : offset + 4])
+        (chunk_size,) = struct.unpack_from("<I", view, offset + 4)
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            format_tag, channels, sample_rate = struct.unpack_from("<HHI", view, body)
+            (bits_per_sample,) = struct.unpack_from("<H", view, body + 14)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 26:
+                # サブフォーマットGUIDの先頭2バイトが実際のフォーマットタグ
+                (format_tag,) = struct.unpack_from("<H", view, body + 24)
+            fmt = (format_tag, channels, sample_rate, bits_per_sample)
+        elif chunk_id == b"data":
+            # ストリーミング出力などでサイズが不正な場合は末尾までをデータとする
+            end = min(body + chunk_size, len(view))
+            pcm = view[body:end]
+            break
+        # チャンクは2バイト境界に揃えられる
+        offset = body + chunk_size + (chunk_size & 1)
+
+    if fmt is None or pcm is None:
+        raise ValueError("WAV file is missing fmt or data chunk")
+
+    format_tag, channels, sample_rate, bits_per_sample = fmt
+    if format_tag == WAVE_FORMAT_PCM and bits_per_sample not in _PCM_DTYPES:
+        raise ValueError(f"Unsupported PCM bit depth: {bits_per_sample}")
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT and bits_per_sample not in (32, 64):
+        raise ValueError(f"Unsupported float bit depth: {bits_per_sample}")
+    if format_tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+        raise ValueError(f"Unsupported WAV format: {format_tag:#x}")
+    if channels < 1 or sample_rate < 1:
+        raise ValueError("Invalid WAV header")
+
+    # サンプル境界に揃える
+    frame_size = channels * bits_per_sample // 8
+    pcm = pcm[: len(pcm) - len(pcm) % frame_size]
+    return WavAudio(sample_rate, channels, bits_per_sample, format_tag, pcm)
+
+
+class PcmConverter:
+    """PCMデータをfloat32のモノラル信号に変換
+
+    変換先のバッファを使い回すため、返される配列は次の変換で上書きされる。
+    """
+
+    def __init__(self, initial_size: int = 0) -> None:
+        """
+        Args:
+            initial_size: 事前に確保するサンプル数
+        """
+        self._buffer = np.empty(initial_size, dtype=np.float32)
+
+    def to_float32(self, wav: WavAudio) -> np.ndarray:
+        """-1.0〜1.0のfloat32モノラル信号に変換
+
+        Args:
+            wav: 変換するWAVデータ
+
+        Returns:
+            内部バッファを参照する配列
+        """
+        samples = wav.samples()
+        n_frames = samples.shape[0]
+        if self._buffer.shape[0] < n_frames:
+            self._buffer = np.empty(max(n_frames, 2 * self._buffer.shape[0]), dtype=np.float32)
+        out = self._buffer[:n_frames]
+
+        if wav.channels == 1:
+            np.copyto(out, samples[:, 0], casting="unsafe")
+        else:
+            np.sum(samples, axis=1, dtype=np.float32, out=out)
+
+        if wav.format_tag == WAVE_FORMAT_PCM:
+            if wav.bits_per_sample == 8:
+                # 8bitは符号なし(中央値128)
+                out -= 128.0 * wav.channels
+            full_scale = float(1 << (wav.bits_per_sample - 1))
+            out *= 1.0 / (full_scale * wav.channels)
+        elif wav.channels > 1:
+            out *= 1.0 / wav.channels
+
+        return out
@@ -0,0 +1,454 @@
+"""
+複数のOllamaサーバーへの振り分け
+同時実行数の少ないホストへ送り、応答のないホストは切り離し、最初のトークンが遅い場合は別のホストにも送る
+"""
+
+import itertools
+import queue
+import threading
+import time
+from collections.abc import Callable, Generator, Iterator, Mapping
+from typing import TYPE_CHECKING, Literal, TypeVar, overload
+
+from pydantic import BaseModel, Field
+
+if TYPE_CHECKING:
+    import ollama
+
+T = TypeVar("T")
+
+
+def _is_retryable(error: Exception) -> bool:
+    """サーバーの障害による失敗かどうか(切り離しと別サーバーへの切り替えの対象)
+
+    モデルが見つからないなどの4xxはどのサーバーに送っても同じ結果になるため対象外。
+    """
+    import httpx
+    import ollama
+
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code >= 500
+    return isinstance(error, ConnectionError | TimeoutError | httpx.TransportError)
+
+
+class BackendConfig(BaseModel):
+    """Ollamaサーバー1台分の設定"""
+
+    host: str = Field(..., description="OllamaサーバーのURL")
+    max_concurrency: int = Field(default=1, description="同時に送るリクエスト数の上限")
+
+
+class BackendPoolConfig(BaseModel):
+    """Ollamaサーバーの振り分けの設定"""
+
+    backends: list[BackendConfig] = Field(default_factory=list, description="Ollamaサーバーの一覧")
+    max_failures: int = Field(default=2, description="連続して失敗した場合に切り離す回数")
+    health_check_interval: float = Field(
+        default=10.0, description="ヘルスチェックの間隔(秒、0で無効)"
+    )
+    health_check_timeout: float = Field(default=2.0, description="ヘルスチェックのタイムアウト(秒)")
+    hedge_delay: float | None = Field(
+        default=2.0,
+        description="最初のトークンがこの時間内に届かない場合に別のサーバーにも送る(秒、Noneで無効)",
+    )
+    acquire_timeout: float = Field(
+        default=30.0, description="全サーバーが上限に達している場合に空きを待つ時間(秒)"
+    )
+
+
+class Backend:
+    """Ollamaサーバー1台分の状態"""
+
+    def __init__(self, config: BackendConfig, health_check_timeout: float) -> None:
+        """
+        Args:
+            config: サーバーの設定
+            health_check_timeout: ヘルスチェックのタイムアウト(秒)
+        """
+        self.host = config.host
+        self.max_concurrency = max(1, config.max_concurrency)
+        self.health_check_timeout = health_check_timeout
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.last_acquired = 0
+        self._client: ollama.Client | None = None
+        self._health_client: ollama.Client | None = None
+        self.stats = {
+            "requests": 0,
+            "failures": 0,
+            "ejections": 0,
+            "readmissions": 0,
+        }
+
+    @property
+    def client(self) -> "ollama.Client":
+        """生成用のクライアント"""
+        if self._client is None:
+            # 起動を速くするため初回使用時に読み込む
+            import ollama
+
+            self._client = ollama.Client(host=self.host)
+        return self._client
+
+    @property
+    def health_client(self) -> "ollama.Client":
+        """ヘルスチェック用のクライアント(短いタイムアウトを設定)"""
+        if self._health_client is None:
+            import ollama
+
+            self._health_client = ollama.Client(host=self.host, timeout=self.health_check_timeout)
+        return self._health_client
+
+
+class _Attempt:
+    """1台のサーバーへのストリーミング呼び出し"""
+
+    def __init__(self, backend: Backend, hedge: bool = False) -> None:
+        self.backend = backend
+        self.hedge = hedge
+        self.cancelled = threading.Event()
+        self.failed = False
+
+
+class BackendPool:
+    """複数のOllamaサーバーにリクエストを振り分けるプール
+
+    `ollama.Client` と同じ `chat` / `generate` / `show` を提供し、`LocalLLM` の呼び出し先になる。
+    上限に達していない正常なサーバーのうち、処理中のリクエストが最も少ないものを選ぶ。
+    接続エラー・タイムアウト・5xxが連続して `max_failures` 回続いたサーバーは切り離し、
+    ヘルスチェックに成功した時点で戻す。4xxなどリクエスト自体の誤りは失敗として数えず、
+    別のサーバーにも再送しない。
+    正常なサーバーが残っていない場合は切り離したサーバーにも送り、成功すればその時点で戻す
+    (ヘルスチェックを無効にしていても復帰できる)。
+    チャットは常にストリーミングで受け取り、`hedge_delay` 秒以内に最初のトークンが届かない場合は
+    別のサーバーにも同じリクエストを送って、先にトークンを返した方を採用する。
+    採用しなかった方は次のチャンクの受信時に接続を閉じ、その時点で同時実行数の枠を解放する
+    (サーバーが生成を続けている間は枠を使用中とみなす)。
+    """
+
+    def __init__(self, config: BackendPoolConfig) -> None:
+        """
+        Args:
+            config: 振り分けの設定
+        """
+        if not config.backends:
+            raise ValueError("At least one LLM backend is required")
+        self.config = config
+        self.backends = [Backend(b, config.health_check_timeout) for b in config.backends]
+        self._condition = threading.Condition()
+        self._sequence = itertools.count(1)
+        self._health_thread: threading.Thread | None = None
+        self._health_stop = threading.Event()
+        self.stats = {
+            "requests": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "failovers": 0,
+        }
+
+    def acquire(
+        self, exclude: set[Backend] | None = None, wait: bool = True, last_resort: bool = True
+    ) -> Backend | None:
+        """処理中のリクエストが最も少ない正常なサーバーを確保
+
+        Args:
+            exclude: 選ばないサーバー
+            wait: 全サーバーが上限に達している場合に空きを待つかどうか
+            last_resort: 正常なサーバーがない場合に切り離したサーバーを選ぶかどうか
+
+        Returns:
+            確保したサーバー(選べるサーバーがない場合や、待たずに空きがない場合はNone)
+        """
+        deadline = time.monotonic() + self.config.acquire_timeout
+        with self._condition:
+            while True:
+                available = [b for b in self.backends if exclude is None or b not in exclude]
+                candidates = [b for b in available if b.healthy]
+                if not candidates and last_resort:
+                    candidates = available
+                if not candidates:
+                    return None
+                free = [b for b in candidates if b.outstanding < b.max_concurrency]
+                if free:
+                    # 同数の場合は最も長く使われていないサーバーを選ぶ
+                    backend = min(free, key=lambda b: (b.outstanding, b.last_acquired))
+                    backend.outstanding += 1
+                    backend.last_acquired = next(self._sequence)
+                    backend.stats["requests"] += 1
+                    return backend
+                if not wait:
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("Timed out waiting for a free LLM backend")
+                self._condition.wait(remaining)
+
+    def release(self, backend: Backend, ok: bool | None) -> None:
+        """確保したサーバーを解放
+
+        Args:
+            backend: 確保したサーバー
+            ok: 呼び出しが成功したかどうか(途中で取り消した場合や、
+                4xxなどサーバーの障害によらない失敗の場合はNone)
+        """
+        with self._condition:
+            backend.outstanding -= 1
+            if ok:
+                backend.failures = 0
+                self._readmit(backend)
+            elif ok is not None:
+                backend.failures += 1
+                backend.stats["failures"] += 1
+                if backend.healthy and backend.failures >= self.config.max_failures:
+                    self._eject(backend)
+            self._condition.notify_all()
+
+    @overload
+    def chat(self, stream: Literal[False] = False, **kwargs: object) -> "ollama.ChatResponse": ...
+
+    @overload
+    def chat(self, stream: Literal[True], **kwargs: object) -> "Iterator[ollama.ChatResponse]": ...
+
+    def chat(
+        self, stream: bool = False, **kwargs: object
+    ) -> "ollama.ChatResponse | Iterator[ollama.ChatResponse]":
+        """チャット応答を生成(`ollama.Client.chat` と同じ引数)
+
+        Args:
+            stream: ストリーミング出力を使用するかどうか
+            **kwargs: `ollama.Client.chat` の引数
+
+        Returns:
+            応答(ストリーミングの場合はチャンクのイテレータ)
+        """
+        chunks = self._hedged_chat(kwargs)
+        if stream:
+            return chunks
+
+        # 最初のトークンで振り分けを判断するため、通常モードでもストリーミングで受け取る
+        parts: list[str] = []
+        final: ollama.ChatResponse | None = None
+        for chunk in chunks:
+            parts.append(chunk["message"]["content"] or "")
+            final = chunk
+        if final is None:
+            raise RuntimeError("LLM backend returned an empty response")
+        final["message"]["content"] = "".join(parts)
+        return final
+
+    def generate(
+        self,
+        model: str = "",
+        prompt: str = "",
+        options: Mapping[str, object] | None = None,
+        keep_alive: float | str | None = None,
+    ) -> "ollama.GenerateResponse":
+        """テキストを生成(`ollama.Client.generate` の引数の一部、ストリーミングは使わない)"""
+        return self._call(
+            lambda client: client.generate(
+                model=model, prompt=prompt, options=options, keep_alive=keep_alive
+            )
+        )
+
+    def show(self, model: str) -> "ollama.ShowResponse":
+        """モデルの情報を取得"""
+        return self._call(lambda client: client.show(model))
+
+    def healthy_clients(self) -> list["ollama.Client"]:
+        """正常な全サーバーのクライアント(モデルの読み込みなど全台に送る処理用)"""
+        with self._condition:
+            return [b.client for b in self.backends if b.healthy]
+
+    def check_health(self) -> None:
+        """全サーバーのヘルスチェックを行い、切り離しと復帰を反映"""
+        for backend in self.backends:
+            try:
+                backend.health_client.list()
+                ok = True
+            except Exception:
+                ok = False
+            with self._condition:
+                if ok:
+                    backend.failures = 0
+                    self._readmit(backend)
+                elif backend.healthy:
+                    self._eject(backend)
+
+    def start_health_checks(self) -> None:
+        """定期的なヘルスチェックを開始"""
+        if self.config.health_check_interval <= 0:
+            return
+        if self._health_thread is not None and self._health_thread.is_alive():
+            return
+        self._health_stop.clear()
+        self._health_thread = threading.Thread(
+            target=self._health_loop, name="llm-health-check", daemon=True
+        )
+        self._health_thread.start()
+
+    def stop_health_checks(self) -> None:
+        """定期的なヘルスチェックを停止"""
+        self._health_stop.set()
+        if self._health_thread is not None:
+            self._health_thread.join(timeout=5.0)
+            self._health_thread = None
+
+    def get_stats(self) -> dict:
+        """振り分けの統計を取得
+
+        Returns:
+            プール全体の統計と、サーバーごとの処理中のリクエスト数・状態
+        """
+        with self._condition:
+            return {
+                **self.stats,
+                "backends": {
+                    b.host: {**b.stats, "outstanding": b.outstanding, "healthy": b.healthy}
+                    for b in self.backends
+                },
+            }
+
+    def _health_loop(self) -> None:
+        while not self._health_stop.wait(self.config.health_check_interval):
+            self.check_health()
+
+    def _count(self, name: str) -> None:
+        with self._condition:
+            self.stats[name] += 1
+
+    def _eject(self, backend: Backend) -> None:
+        """サーバーを切り離す(ロックを取得した状態で呼ぶ)"""
+        backend.healthy = False
+        backend.stats["ejections"] += 1
+        print(f"LLM backend {backend.host} is unavailable and has been ejected")
+
+    def _readmit(self, backend: Backend) -> None:
+        """切り離したサーバーを戻す(ロックを取得した状態で呼ぶ)"""
+        if not backend.healthy:
+            backend.healthy = True
+            backend.stats["readmissions"] += 1
+            print(f"LLM backend {backend.host} is back online")
+            self._condition.notify_all()
+
+    def _acquire_any(self, exclude: set[Backend] | None = None) -> Backend:
+        backend = self.acquire(exclude)
+        if backend is None:
+            raise RuntimeError("No LLM backend available")
+        return backend
+
+    def _call(self, call: Callable[["ollama.Client"], T]) -> T:
+        """1台のサーバーを確保して呼び出す"""
+        backend = self._acquire_any()
+        ok: bool | None = False
+        try:
+            result = call(backend.client)
+            ok = True
+            return result
+        except Exception as e:
+            if not _is_retryable(e):
+                ok = None
+            raise
+        finally:
+            self.release(backend, ok)
+
+    def _start(
+        self, backend: Backend, request: dict, events: queue.Queue, hedge: bool = False
+    ) -> _Attempt:
+        """別スレッドでストリーミング呼び出しを開始"""
+        attempt = _Attempt(backend, hedge)
+        threading.Thread(
+            target=self._run_attempt,
+            args=(attempt, request, events),
+            name=f"llm-backend-{backend.host}",
+            daemon=True,
+        ).start()
+        return attempt
+
+    def _run_attempt(self, attempt: _Attempt, request: dict, events: queue.Queue) -> None:
+        """チャンクを受け取ってキューに入れる(終了時はチャンクなし、失敗時は例外を入れる)"""
+        ok: bool | None = False
+        try:
+            chunks = attempt.backend.client.chat(stream=True, **request)
+            try:
+                for chunk in chunks:
+                    if attempt.cancelled.is_set():
+                        break
+                    events.put((attempt, chunk, None))
+            finally:
+                # 取り消した場合は接続を閉じる
+                if isinstance(chunks, Generator):
+                    chunks.close()
+            events.put((attempt, None, None))
+            ok = True
+        except Exception as e:
+            if not _is_retryable(e):
+                ok = None
+            events.put((attempt, None, e))
+        finally:
+            # 取り消した呼び出しも接続を閉じるまでは枠を使い続ける
+            self.release(attempt.backend, None if attempt.cancelled.is_set() else ok)
+
+    def _hedged_chat(self, request: dict) -> "Iterator[ollama.ChatResponse]":
+        """最初のトークンを先に返したサーバーの応答チャンクを返す"""
+        delay = self.config.hedge_delay
+        events: queue.Queue = queue.Queue()
+        attempts = [self._start(self._acquire_any(), request, events)]
+        tried = {attempts[0].backend}
+        hedge_at = None if delay is None else time.monotonic() + delay
+        self._count("requests")
+
+        winner = None
+        chunk: ollama.ChatResponse | None = None
+        try:
+            while winner is None:
+                timeout = None if hedge_at is None else max(hedge_at - time.monotonic(), 0.0)
+                try:
+                    attempt, chunk, error = events.get(timeout=timeout)
+                except queue.Empty:
+                    # 最初のトークンが遅いため、空いている別のサーバーにも送る
+                    hedge_at = None
+                    backend = self.acquire(tried, wait=False, last_resort=False)
+                    if backend is not None:
+                        tried.add(backend)
+                        attempts.append(self._start(backend, request, events, hedge=True))
+                        self._count("hedges")
+                    continue
+
+                if error is None:
+                    winner = attempt
+                    continue
+                if not _is_retryable(error):
+                    raise error
+                attempt.failed = True
+                if not all(a.failed for a in attempts):
+                    continue
+                # 全て失敗した場合は、まだ送っていないサーバーに切り替える
+                backend = self.acquire(tried)
+                if backend is None:
+                    raise error
+                print(f"LLM backend {attempt.backend.host} failed, retrying on {backend.host}")
+                tried.add(backend)
+                attempts.append(self._start(backend, request, events))
+                hedge_at = None if delay is None else time.monotonic() + delay
+                self._count("failovers")
+
+            # 採用しなかった呼び出しを取り消す
+            for attempt in attempts:
+                if attempt is not winner:
+                    attempt.cancelled.set()
+            if winner.hedge:
+                self._count("hedge_wins")
+
+            while chunk is not None:
+                yield chunk
+                while True:
+                    attempt, chunk, error = events.get()
+                    if attempt is winner:
+                        break
+                if error is not None:
+                    raise error
+        finally:
+            for attempt in attempts:
+                if attempt is not winner or chunk is not None:
+                    attempt.cancelled.set()
@@ -0,0 +1,271 @@
+"""
+会話コンテキストの管理
+トークン数の上限内に収まるよう、直近の発話はそのまま残し、古い発話は要約にまとめる
+"""
+
+import hashlib
+import json
+import math
+import threading
+from collections.abc import Callable
+
+from pydantic import BaseModel, Field
+
+
+class Message(BaseModel):
+    """チャットメッセージのモデル"""
+
+    role: str = Field(..., description="メッセージの役割 (system, user, assistant)")
+    content: str = Field(..., description="メッセージの内容")
+
+
+class ContextConfig(BaseModel):
+    """会話コンテキストの設定"""
+
+    max_tokens: int = Field(default=2048, description="プロンプト全体のトークン数の上限")
+    keep_turns: int = Field(default=6, description="そのまま残す直近の発話数(ユーザーと応答の組)")
+    summary_tokens: int = Field(default=256, description="要約のトークン数の上限")
+    summarize_every: int = Field(default=4, description="要約を更新する間隔(要約待ちの組数)")
+    max_pending_turns: int = Field(
+        default=32, description="要約待ちとして保持する組数の上限(超えた分は古い順に破棄)"
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """テキストのトークン数を概算
+
+    日本語などの非ASCII文字は1文字1トークン、ASCII文字は4文字1トークンとみなす。
+
+    Args:
+        text: テキスト
+
+    Returns:
+        概算のトークン数
+    """
+    ascii_chars = sum(1 for char in text if char.isascii())
+    return (len(text) - ascii_chars) + math.ceil(ascii_chars / 4)
+
+
+# メッセージごとの役割などの付加分のトークン数
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def message_tokens(message: Message) -> int:
+    """メッセージのトークン数を概算"""
+    return estimate_tokens(message.content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _count_turns(messages: list[Message]) -> int:
+    """ユーザーの発話で始まる組の数"""
+    return sum(1 for message in messages if message.role == "user")
+
+
+def _turn_end(messages: list[Message]) -> int:
+    """先頭の組の終わり(次のユーザーの発話の位置)"""
+    end = 1
+    while end < len(messages) and messages[end].role != "user":
+        end += 1
+    return end
+
+
+class ConversationContext:
+    """トークン数の上限付きの会話コンテキスト
+
+    プロンプトはシステムプロンプト(と要約)1件と、直近の発話で構成する。
+    `keep_turns` を超えた発話やトークン数の上限を超えた古い発話は要約待ちに移し、
+    `summarize` で要約に反映する。要約はLLMの呼び出しを伴うため、
+    呼び出し側が応答生成の合間にバックグラウンドで実行する前提で、
+    要約中も発話の追加やプロンプトの作成はロックを短時間取るだけで行える。
+    """
+
+    def __init__(
+        self,
+        system_prompt: str | None = None,
+        config: ContextConfig | None = None,
+        summarizer: Callable[[str, list[Message]], str] | None = None,
+    ) -> None:
+        """
+        Args:
+            system_prompt: システムプロンプト
+            config: コンテキストの設定
+            summarizer: これまでの要約と要約待ちの発話から新しい要約を作成する関数
+        """
+        self.system_prompt = system_prompt
+        self.config = config or ContextConfig()
+        self.summarizer = summarizer
+        self.summary = ""
+        self.history: list[Message] = []
+        self._pending: list[Message] = []
+        self._lock = threading.Lock()
+        # 発話の追加・削除のたびに増える番号(先行生成した応答が古くなったかの判定用)
+        self.version = 0
+
+        self.stats = {
+            "summaries": 0,
+            "summary_failures": 0,
+            "dropped_turns": 0,
+        }
+
+    @property
+    def pending(self) -> list[Message]:
+        """要約待ちの発話"""
+        return list(self._pending)
+
+    @property
+    def needs_summary(self) -> bool:
+        """要約を更新すべきかどうか"""
+        return self.summarizer is not None and _count_turns(self._pending) >= max(
+            1, self.config.summarize_every
+        )
+
+    def add(self, role: str, content: str) -> None:
+        """発話を追加
+
+        Args:
+            role: メッセージの役割
+            content: メッセージの内容
+        """
+        with self._lock:
+            self.version += 1
+            self.history.append(Message(role=role, content=content))
+            # ユーザーの発話で始まる組単位で数え、超えた分を要約待ちに移す
+            while _count_turns(self.history) > max(1, self.config.keep_turns):
+                self._fold_oldest_turn()
+
+    def clear(self) -> None:
+        """発話と要約を削除"""
+        with self._lock:
+            self.version += 1
+            self.history.clear()
+            self._pending.clear()
+            self.summary = ""
+
+    def messages(self) -> list[Message]:
+        """上限内に収まるプロンプトのメッセージ列を作成
+
+        直近の発話が上限を超える場合は古い組から要約待ちに移す(最新の発話は必ず残す)。
+
+        Returns:
+            LLMに送るメッセージ列
+        """
+        with self._lock:
+            system = self._system_message()
+            budget = self.config.max_tokens - (message_tokens(system) if system else 0)
+            while len(self.history) > 1 and self._history_tokens() > budget:
+                self._fold_oldest_turn()
+            messages = [system] if system else []
+            return messages + list(self.history)
+
+    def preview(self, content: str) -> list[Message]:
+        """ユーザーの発話を追加した場合のメッセージ列を、履歴を変更せずに作成
+
+        Args:
+            content: ユーザーの発話
+
+        Returns:
+            LLMに送るメッセージ列
+        """
+        with self._lock:
+            system = self._system_message()
+            budget = self.config.max_tokens - (message_tokens(system) if system else 0)
+            history = [*self.history, Message(role="user", content=content)]
+            while _count_turns(history) > max(1, self.config.keep_turns):
+                del history[: min(_turn_end(history), len(history) - 1)]
+            while len(history) > 1 and sum(message_tokens(m) for m in history) > budget:
+                del history[: min(_turn_end(history), len(history) - 1)]
+            return ([system] if system else []) + history
+
+    def fingerprint(self, turns: int) -> str:
+        """直近の発話の組から会話の文脈を表すハッシュを計算
+
+        Args:
+            turns: 対象にする直近の組数
+
+        Returns:
+            文脈のハッシュ(16進文字列、`turns` が0以下の場合は空文字列)
+        """
+        if turns <= 0:
+            return ""
+        with self._lock:
+            history = list(self.history)
+        start = len(history)
+        found = 0
+        while start > 0 and found < turns:
+            start -= 1
+            if history[start].role == "user":
+                found += 1
+        payload = json.dumps(
+            [[message.role, message.content] for message in history[start:]], ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def prompt_tokens(self) -> int:
+        """現在のプロンプトのトークン数を概算"""
+        return sum(message_tokens(message) for message in self.messages())
+
+    def summarize(self) -> bool:
+        """要約待ちの発話を要約に反映
+
+        要約の作成中に追加された発話は次回の要約に回す。
+
+        Returns:
+            要約を更新した場合はTrue
+        """
+        if self.summarizer is None:
+            return False
+        with self._lock:
+            pending = list(self._pending)
+            summary = self.summary
+        if not pending:
+            return False
+
+        try:
+            new_summary = self.summarizer(summary, pending)
+        except Exception as e:
+            print(f"Error summarizing conversation: {e}")
+            self.stats["summary_failures"] += 1
+            return False
+
+        with self._lock:
+            self.summary = self._truncate(new_summary.strip(), self.config.summary_tokens)
+            # 要約中に上限を超えて破棄された発話もあるため、要約した発話だけを取り除く
+            summarized = {id(message) for message in pending}
+            self._pending = [m for m in self._pending if id(m) not in summarized]
+            self.stats["summaries"] += 1
+        return True
+
+    def _system_message(self) -> Message | None:
+        parts = []
+        if self.system_prompt:
+            parts.append(self.system_prompt)
+        if self.summary:
+            parts.append(f"これまでの会話の要約:\n{self.summary}")
+        return Message(role="system", content="\n\n".join(parts)) if parts else None
+
+    def _history_tokens(self) -> int:
+        return sum(message_tokens(message) for message in self.history)
+
+    def _fold_oldest_turn(self) -> None:
+        """最も古い組(ユーザーの発話とそれに続く応答)を要約待ちに移す(最新の発話は残す)"""
+        end = min(_turn_end(self.history), len(self.history) - 1)
+        self._pending.extend(self.history[:end])
+        del self.history[:end]
+
+        # 要約が追いつかない場合に備えて要約待ちも上限を設ける
+        while _count_turns(self._pending) > self.config.max_pending_turns:
+            del self._pending[: _turn_end(self._pending)]
+            self.stats["dropped_turns"] += 1
+
+    @staticmethod
+    def _truncate(text: str, max_tokens: int) -> str:
+        """トークン数の上限に収まるよう末尾を切り詰める"""
+        if estimate_tokens(text) <= max_tokens:
+            return text
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if estimate_tokens(text[:mid]) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low]
@@ -3,17 +3,61 @@
 Ollamaを使用したローカルLLMの実行と応答生成を担当
 """
 
-from typing import Optional
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, Literal, Optional, TypedDict, overload
 
-import ollama
 from pydantic import BaseModel, Field
 
+from src.llm.backend_pool import BackendPool
+from src.llm.conversation_context import ContextConfig, ConversationContext, Message
 
-class Message(BaseModel):
-    """チャットメッセージのモデル"""
+if TYPE_CHECKING:
+    import ollama
 
-    role: str = Field(..., description="メッセージの役割 (system, user, assistant)")
-    content: str = Field(..., description="メッセージの内容")
+# 古い会話を要約するときの指示
+SUMMARY_PROMPT = (
+    "あなたは配信の会話ログを要約するアシスタントです。"
+    "これまでの要約と新しい会話をもとに、話題・視聴者の名前・約束したことなど"
+    "今後の応答に必要な情報を簡潔な日本語の箇条書きでまとめてください。"
+)
+
+
+class ResidencyConfig(BaseModel):
+    """モデルの常駐に関する設定"""
+
+    keep_alive: float | str | None = Field(
+        default="10m",
+        description="最後の呼び出し後にモデルを保持する時間(Ollamaの形式、-1で無期限)",
+    )
+    heartbeat_interval: float = Field(
+        default=240.0, description="呼び出しがない間にモデルの保持を延長する間隔(秒、0で無効)"
+    )
+    warm_up_prompt: str = Field(default="こんにちは", description="ウォームアップで送る入力")
+    cold_load_threshold: float = Field(
+        default=0.5, description="この時間以上かかった読み込みをコールドスタートとみなす(秒)"
+    )
+
+
+class LLMStats(TypedDict):
+    """モデルの読み込み状況の統計(時間は秒)"""
+
+    requests: int
+    warm_requests: int
+    cold_requests: int
+    total_load_time: float
+    last_load_time: float | None
+    warm_up_time: float | None
+    heartbeats: int
+    heartbeat_failures: int
+
+
+def _seconds(nanoseconds: int | None) -> float | None:
+    """Ollamaの応答の所要時間(ナノ秒)を秒に変換"""
+    return None if nanoseconds is None else nanoseconds / 1e9
 
 
 class LocalLLM:
@@ -25,6 +69,10 @@ class LocalLLM:
         system_prompt: str | None = None,
         temperature: float = 0.7,
         max_tokens: int = 1000,
+        context_config: ContextConfig | None = None,
+        host: str | None = None,
+        residency: ResidencyConfig | None = None,
+        pool: BackendPool | None = None,
     ) -> None:
         """
         Args:
@@ -32,12 +80,43 @@ class LocalLLM:
             system_prompt: システムプロンプト
             temperature: 生成の多様性を制御するパラメータ (0.0-1.0)
             max_tokens: 生成する最大トークン数
+            context_config: 会話コンテキストの設定(プロンプトのトークン数の上限など)
+            host: OllamaサーバーのURL(Noneの場合はollamaの既定値)
+            residency: モデルの常駐に関する設定
+            pool: 複数のOllamaサーバーへの振り分け(指定した場合はhostより優先)
         """
         self.model_name = model_name
         self.system_prompt = system_prompt
         self.temperature = temperature
         self.max_tokens = max_tokens
-        self._message_history: list[Message] = []
+        self.context = ConversationContext(system_prompt, context_config, self._summarize)
+        self._summary_executor: ThreadPoolExecutor | None = None
+        self._summary_future: Future[bool] | None = None
+
+        self.host = host
+        self.pool = pool
+        self.residency = residency or ResidencyConfig()
+        self._client: ollama.Client | None = None
+        self._last_request = time.monotonic()
+        self._heartbeat_thread: threading.Thread | None = None
+        self._heartbeat_stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self.last_request_warm: bool | None = None
+        self.stats: LLMStats = {
+            "requests": 0,
+            "warm_requests": 0,
+            "cold_requests": 0,
+            "total_load_time": 0.0,
+            "last_load_time": None,
+            "warm_up_time": None,
+            "heartbeats": 0,
+            "heartbeat_failures": 0,
+        }
+
+    @property
+    def _message_history(self) -> list[Message]:
+        """そのまま残している直近のメッセージ履歴"""
+        return self.context.history
 
     def add_message(self, role: str, content: str) -> None:
         """メッセージ履歴に新しいメッセージを追加
@@ -46,13 +125,23 @@ class LocalLLM:
             role: メッセージの役割
             content: メッセージの内容
         """
-        self._message_history.append(Message(role=role, content=content))
+        self.context.add(role, content)
 
     def clear_history(self) -> None:
-        """メッセージ履歴をクリア"""
-        self._message_history.clear()
+        """メッセージ履歴と要約をクリア"""
+        self.context.clear()
+
+    @overload
+    def generate_response(self, user_input: str, stream: Literal[False] = False) -> str: ...
 
-    def generate_response(self, user_input: str, stream: bool = False) -> str:
+    @overload
+    def generate_response(
+        self, user_input: str, stream: Literal[True]
+    ) -> "Iterator[ollama.ChatResponse]": ...
+
+    def generate_response(
+        self, user_input: str, stream: bool = False
+    ) -> "str | Iterator[ollama.ChatResponse]":
         """ユーザー入力に対する応答を生成
 
         Args:
@@ -60,39 +149,289 @@ class LocalLLM:
             stream: ストリーミング出力を使用するかどうか
 
         Returns:
-            生成された応答テキスト
+            生成された応答テキスト(ストリーミングの場合は応答のチャンクのイテレータ。
+            応答は履歴に追加されないため、通常は `generate_response_stream` を使う)
         """
-        # システムプロンプトが設定されている場合は追加
-        if self.system_prompt:
-            self.add_message("system", self.system_prompt)
+        if stream:
+            # ストリーミングモードの場合
+            return self._chat(user_input, stream=True)
 
-        # ユーザー入力を追加
-        self.add_message("user", user_input)
+        # 通常モードの場合
+        response = self._chat(user_input, stream=False)
+        self._record_response(response)
+        response_text: str = response["message"]["content"]
+        self.add_message("assistant", response_text)
+        self._schedule_summary()
+        return response_text
 
-        # Ollama APIを使用して応答を生成
-        response = ollama.chat(
+    @property
+    def context_version(self) -> int:
+        """会話履歴の版(発話が追加されるたびに変わる)"""
+        return self.context.version
+
+    def context_fingerprint(self, turns: int) -> str:
+        """直近の会話の文脈を表すハッシュを取得(応答キャッシュのキー用)
+
+        Args:
+            turns: 対象にする直近の発話の組数
+
+        Returns:
+            文脈のハッシュ(`turns` が0以下の場合は空文字列)
+        """
+        return self.context.fingerprint(turns)
+
+    def generate_candidate(self, user_input: str) -> str:
+        """会話履歴を変更せずに応答を生成
+
+        別の応答の再生中に次の応答を先行して生成するためのもので、
+        採用する場合は `commit_response` で履歴に追加する。
+
+        Args:
+            user_input: ユーザーからの入力
+
+        Returns:
+            生成された応答テキスト
+        """
+        self._last_request = time.monotonic()
+        response = self._api().chat(
             model=self.model_name,
-            messages=[msg.model_dump() for msg in self._message_history],
-            stream=stream,
+            messages=[msg.model_dump() for msg in self.context.preview(user_input)],
+            stream=False,
             options={
                 "temperature": self.temperature,
                 "num_predict": self.max_tokens,
             },
+            keep_alive=self.residency.keep_alive,
         )
+        self._record_response(response)
+        response_text: str = response["message"]["content"]
+        return response_text
 
+    def commit_response(self, user_input: str, response: str) -> None:
+        """先行して生成した応答を採用し、会話履歴に追加
+
+        Args:
+            user_input: ユーザーからの入力
+            response: `generate_candidate` で生成した応答
+        """
+        self.add_message("user", user_input)
+        self.add_message("assistant", response)
+        self._schedule_summary()
+
+    def generate_response_stream(self, user_input: str) -> Iterator[str]:
+        """ユーザー入力に対する応答をトークン単位で逐次生成
+
+        全トークンを受け取った時点で応答全体をメッセージ履歴に追加する。
+
+        Args:
+            user_input: ユーザーからの入力
+
+        Yields:
+            生成されたテキスト断片
+        """
+        parts: list[str] = []
+        for chunk in self._chat(user_input, stream=True):
+            token = chunk["message"]["content"]
+            if token:
+                parts.append(token)
+                yield token
+            if chunk.get("done"):
+                # 所要時間は最後のチャンクにのみ含まれる
+                self._record_response(chunk)
+
+        self.add_message("assistant", "".join(parts))
+        self._schedule_summary()
+
+    @overload
+    def _chat(self, user_input: str, stream: Literal[False]) -> "ollama.ChatResponse": ...
+
+    @overload
+    def _chat(self, user_input: str, stream: Literal[True]) -> "Iterator[ollama.ChatResponse]": ...
+
+    def _chat(
+        self, user_input: str, stream: bool
+    ) -> "ollama.ChatResponse | Iterator[ollama.ChatResponse]":
+        """履歴にユーザー入力を追加してOllama APIを呼び出す
+
+        システムプロンプト(と古い会話の要約)は先頭に1件だけ含め、
+        プロンプト全体がトークン数の上限に収まるよう直近の履歴のみを送る。
+        """
+        self.add_message("user", user_input)
+        self._last_request = time.monotonic()
+
+        # Ollama APIを使用して応答を生成
+        request: dict[str, Any] = {
+            "model": self.model_name,
+            "messages": [msg.model_dump() for msg in self.context.messages()],
+            "options": {
+                "temperature": self.temperature,
+                "num_predict": self.max_tokens,
+            },
+            "keep_alive": self.residency.keep_alive,
+        }
+        # ollamaの型定義はstreamの値で戻り値の型が決まるため、分岐して呼び出す
         if stream:
-            # ストリーミングモードの場合
-            return response
-        else:
-            # 通常モードの場合
-            response_text = response["message"]["content"]
-            self.add_message("assistant", response_text)
-            return response_text
-
-    def get_model_info(self) -> dict:
+            return self._api().chat(**request, stream=True)
+        return self._api().chat(**request, stream=False)
+
+    def _api(self) -> "ollama.Client | ModuleType | BackendPool":
+        """Ollama APIの呼び出し先(ホスト指定がない場合はモジュールの関数を使う)"""
+        if self.pool is not None:
+            return self.pool
+
+        # 起動を速くするため初回使用時に読み込む
+        import ollama
+
+        if self.host is None:
+            return ollama
+        if self._client is None:
+            self._client = ollama.Client(host=self.host)
+        return self._client
+
+    def _residency_apis(self) -> list:
+        """モデルを読み込んでおく呼び出し先(振り分けを使う場合は正常な全サーバー)"""
+        if self.pool is not None:
+            return self.pool.healthy_clients()
+        return [self._api()]
+
+    def _record_response(self, response: "ollama.ChatResponse") -> None:
+        """応答に含まれるモデルの読み込み時間から、読み込み済みのモデルだったかを記録"""
+        load_time = _seconds(response.get("load_duration"))
+        if load_time is None:
+            return
+        warm = load_time < self.residency.cold_load_threshold
+        with self._stats_lock:
+            self.last_request_warm = warm
+            self.stats["requests"] += 1
+            if warm:
+                self.stats["warm_requests"] += 1
+            else:
+                self.stats["cold_requests"] += 1
+            self.stats["total_load_time"] += load_time
+            self.stats["last_load_time"] = load_time
+
+    def warm_up(self) -> dict:
+        """モデルを読み込み、システムプロンプトを評価済みにする
+
+        空のプロンプトでモデルを読み込んだ後、システムプロンプトを先頭に含む
+        1トークンだけの生成を行い、以降の応答で共通の接頭辞の評価を省けるようにする。
+        ウォームアップの入力は会話履歴に残さない。
+        複数のOllamaサーバーに振り分ける場合は正常な全サーバーで行う。
+
+        Returns:
+            モデルの読み込み時間(最も遅いサーバー)とウォームアップ全体の所要時間(秒)
+        """
+        started = time.perf_counter()
+        messages = [msg.model_dump() for msg in self.context.messages() if msg.role == "system"]
+        messages.append({"role": "user", "content": self.residency.warm_up_prompt})
+        load_time = 0.0
+        for api in self._residency_apis():
+            loaded = api.generate(
+                model=self.model_name, prompt="", keep_alive=self.residency.keep_alive
+            )
+            load_time = max(load_time, _seconds(loaded.get("load_duration")) or 0.0)
+            api.chat(
+                model=self.model_name,
+                messages=messages,
+                options={"temperature": self.temperature, "num_predict": 1},
+                keep_alive=self.residency.keep_alive,
+            )
+        total_time = time.perf_counter() - started
+        self._last_request = time.monotonic()
+
+        with self._stats_lock:
+            self.stats["warm_up_time"] = total_time
+        return {"load_time": load_time, "total_time": total_time}
+
+    def start_heartbeat(self) -> None:
+        """呼び出しがない間もモデルを保持するよう定期的に保持期間を延長する"""
+        if self.residency.heartbeat_interval <= 0:
+            return
+        if self._heartbeat_thread is not None and self._heartbeat_thread.is_alive():
+            return
+        self._heartbeat_stop.clear()
+        self._heartbeat_thread = threading.Thread(
+            target=self._heartbeat_loop, name="llm-heartbeat", daemon=True
+        )
+        self._heartbeat_thread.start()
+
+    def stop_heartbeat(self) -> None:
+        """保持期間の延長を停止"""
+        self._heartbeat_stop.set()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join(timeout=5.0)
+            self._heartbeat_thread = None
+
+    def _heartbeat_loop(self) -> None:
+        interval = self.residency.heartbeat_interval
+        while True:
+            # 最後の呼び出しから間隔が空いたときだけ延長する
+            remaining = interval - (time.monotonic() - self._last_request)
+            if self._heartbeat_stop.wait(max(remaining, 0.0)):
+                return
+            if time.monotonic() - self._last_request < interval:
+                continue
+            try:
+                # 空のプロンプトは生成を行わず、モデルの保持期間だけを延長する
+                for api in self._residency_apis():
+                    api.generate(
+                        model=self.model_name, prompt="", keep_alive=self.residency.keep_alive
+                    )
+            except Exception as e:
+                print(f"Error sending keep-alive to Ollama: {e}")
+                with self._stats_lock:
+                    self.stats["heartbeat_failures"] += 1
+            else:
+                with self._stats_lock:
+                    self.stats["heartbeats"] += 1
+            self._last_request = time.monotonic()
+
+    def get_stats(self) -> LLMStats:
+        """モデルの読み込み状況の統計を取得
+
+        Returns:
+            呼び出し数、読み込み済みのモデルへの呼び出し数、読み込み時間(秒)など
+        """
+        with self._stats_lock:
+            return self.stats.copy()
+
+    def _schedule_summary(self) -> None:
+        """要約待ちの発話がたまっていれば、応答生成を止めないよう別スレッドで要約する"""
+        if not self.context.needs_summary:
+            return
+        if self._summary_future is not None and not self._summary_future.done():
+            return
+        if self._summary_executor is None:
+            self._summary_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="llm-summary"
+            )
+        self._summary_future = self._summary_executor.submit(self.context.summarize)
+
+    def _summarize(self, summary: str, messages: list[Message]) -> str:
+        """これまでの要約と古い発話から新しい要約を生成"""
+        transcript = "\n".join(f"{msg.role}: {msg.content}" for msg in messages)
+        response = self._api().chat(
+            model=self.model_name,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {
+                    "role": "user",
+                    "content": f"これまでの要約:\n{summary or 'なし'}\n\n新しい会話:\n{transcript}",
+                },
+            ],
+            options={
+                "temperature": 0.0,
+                "num_predict": self.context.config.summary_tokens,
+            },
+            keep_alive=self.residency.keep_alive,
+        )
+        new_summary: str = response["message"]["content"]
+        return new_summary
+
+    def get_model_info(self) -> "ollama.ShowResponse":
         """現在使用しているモデルの情報を取得
 
         Returns:
             モデル情報を含む辞書
         """
-        return ollama.show(self.model_name)
+        return self._api().show(self.model_name)
@@ -0,0 +1,213 @@
+"""
+LLM応答のキャッシュ
+よくある質問への応答を再利用し、LLMの呼び出しを省略する
+"""
+
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from pydantic import BaseModel, Field
+
+# カタカナ(ァ〜ヶ)をひらがなに変換する表
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+# n-gramの両端に付ける記号(正規化後のテキストには含まれない制御文字)
+_PADDING = "\0"
+
+
+class ResponseCacheConfig(BaseModel):
+    """応答キャッシュの設定"""
+
+    enabled: bool = Field(default=True, description="応答キャッシュを使用する")
+    max_entries: int = Field(default=512, description="保持する最大応答数")
+    ttl: float = Field(default=600.0, description="応答を再利用する期間(秒)")
+    similarity_threshold: float = Field(
+        default=0.8, description="近い質問とみなすn-gramの類似度(0〜1、1の場合は完全一致のみ)"
+    )
+    ngram_size: int = Field(default=2, description="類似度の計算に使う文字n-gramの長さ")
+    context_turns: int = Field(
+        default=1,
+        description="応答の再利用に一致を求める直近の発話の組数(0の場合は会話履歴によらず再利用)",
+    )
+
+
+def normalize_query(text: str) -> str:
+    """質問をキャッシュキー用に正規化
+
+    全角・半角と大文字・小文字を揃え、カタカナをひらがなに変換し、
+    空白・句読点・記号を除く。
+
+    Args:
+        text: 質問
+
+    Returns:
+        正規化した質問
+    """
+    text = unicodedata.normalize("NFKC", text).casefold().translate(_KATAKANA_TO_HIRAGANA)
+    return "".join(char for char in text if unicodedata.category(char)[0] not in "PZCS")
+
+
+def char_ngrams(key: str, n: int) -> frozenset[str]:
+    """両端に記号を付けた文字n-gramの集合(短い文も比較できるようにする)
+
+    Args:
+        key: 正規化したテキスト
+        n: n-gramの長さ
+
+    Returns:
+        文字n-gramの集合
+    """
+    padded = _PADDING * (n - 1) + key + _PADDING * (n - 1)
+    return frozenset(padded[i : i + n] for i in range(len(padded) - n + 1))
+
+
+@dataclass
+class _CachedResponse:
+    response: str
+    grams: frozenset[str]
+    expires_at: float
+    context: str
+
+
+class ResponseCache:
+    """正規化した質問をキーとするLLM応答のLRUキャッシュ
+
+    完全一致しない場合は文字n-gramの転置インデックスから候補を集め、
+    Dice係数が閾値以上で最も近い質問の応答を返す。
+    直前の会話を踏まえた応答を別の流れで使い回さないよう、応答は生成時の
+    文脈(直近の発話のハッシュ)と一致する場合のみ再利用する。質問ごとに保持するのは
+    最後に保存した文脈の応答1件のみ。
+    スレッドプールからも呼び出せるようロックで保護する。
+    """
+
+    def __init__(
+        self,
+        config: ResponseCacheConfig | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Args:
+            config: キャッシュの設定
+            clock: 現在時刻(秒)を返す関数
+        """
+        self.config = config or ResponseCacheConfig()
+        self.clock = clock
+        self._entries: OrderedDict[str, _CachedResponse] = OrderedDict()
+        self._index: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "hits": 0,
+            "near_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    def get(self, text: str, context: str = "") -> str | None:
+        """キャッシュから応答を取得
+
+        Args:
+            text: 質問
+            context: 現在の会話の文脈(`LocalLLM.context_fingerprint` の値)
+
+        Returns:
+            応答(キャッシュにない場合はNone)
+        """
+        key = normalize_query(text)
+        if not key:
+            return None
+
+        with self._lock:
+            now = self.clock()
+            entry = self._entries.get(key)
+            if entry is not None and entry.context == context and self._alive(key, entry, now):
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry.response
+
+            if self.config.similarity_threshold < 1.0:
+                match = self._nearest(self._ngrams(key), context, now)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.stats["near_hits"] += 1
+                    return self._entries[match].response
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, text: str, response: str, context: str = "") -> None:
+        """応答をキャッシュに保存
+
+        Args:
+            text: 質問
+            response: LLMの応答
+            context: 応答を生成した時点の会話の文脈
+        """
+        key = normalize_query(text)
+        if not key or not response:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._forget(key)
+            grams = self._ngrams(key)
+            self._entries[key] = _CachedResponse(
+                response, grams, self.clock() + self.config.ttl, context
+            )
+            for gram in grams:
+                self._index.setdefault(gram, set()).add(key)
+
+            while len(self._entries) > self.config.max_entries:
+                self._forget(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        """キャッシュを削除"""
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _ngrams(self, key: str) -> frozenset[str]:
+        return char_ngrams(key, self.config.ngram_size)
+
+    def _nearest(self, grams: frozenset[str], context: str, now: float) -> str | None:
+        """類似度が閾値以上で最も近いキーを検索"""
+        overlaps: Counter[str] = Counter()
+        for gram in grams:
+            keys = self._index.get(gram)
+            if keys:
+                overlaps.update(keys)
+
+        best_key = None
+        best_score = self.config.similarity_threshold
+        for key, overlap in overlaps.items():
+            entry = self._entries[key]
+            if entry.context != context:
+                continue
+            score = 2.0 * overlap / (len(grams) + len(entry.grams))
+            if score >= best_score and self._alive(key, entry, now):
+                best_key, best_score = key, score
+        return best_key
+
+    def _alive(self, key: str, entry: _CachedResponse, now: float) -> bool:
+        """有効期限を確認し、期限切れの場合は削除"""
+        if entry.expires_at > now:
+            return True
+        self._forget(key)
+        self.stats["expirations"] += 1
+        return False
+
+    def _forget(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        for gram in entry.grams:
+            keys = self._index[gram]
+            keys.discard(key)
+            if not keys:
+                del self._index[gram]
@@ -7,12 +7,23 @@ import asyncio
 import json
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Literal, Optional
 
+from src.avatar.animation_engine import AnimationEngine
+from src.avatar.animation_recorder import recover_recordings
 from src.avatar.avatar_controller import AvatarController, ExpressionConfig
-from src.llm.local_llm import LocalLLM
+from src.llm.backend_pool import BackendPool, BackendPoolConfig
+from src.llm.conversation_context import ContextConfig
+from src.llm.local_llm import LocalLLM, ResidencyConfig
+from src.llm.response_cache import ResponseCache, ResponseCacheConfig
+from src.pipeline.chat_queue import ChatQueueConfig
+from src.pipeline.response_pipeline import PipelineConfig, PipelineItem, ResponsePipeline
+from src.startup import StartupTimer
+from src.stream.obs_websocket import OBSWebSocketConfig
 from src.stream.stream_handler import ChatMessage, StreamHandler
-from src.tts.local_tts import LocalTTS, VoiceConfig
+from src.stream.twitch_irc import TwitchIRCConfig
+from src.tts.audio_cache import AudioCache, AudioQueryCache
+from src.tts.local_tts import EnginePoolConfig, LocalTTS, VoiceConfig
 
 
 class AITuberSystem:
@@ -28,6 +39,23 @@ class AITuberSystem:
         obs_password: str | None = None,
         voice_config: VoiceConfig | None = None,
         expression_config: ExpressionConfig | None = None,
+        tts_cache_dir: str | None = None,
+        tts_cache_max_bytes: int | None = 512 * 1024 * 1024,
+        lip_sync_mode: Literal["audio", "audio_query"] = "audio",
+        mfcc_backend: str = "numpy",
+        animation_record_path: str | None = None,
+        chat_queue_config: ChatQueueConfig | None = None,
+        response_cache_config: ResponseCacheConfig | None = None,
+        context_config: ContextConfig | None = None,
+        ollama_host: str | None = None,
+        residency_config: ResidencyConfig | None = None,
+        backend_pool_config: BackendPoolConfig | None = None,
+        tts_engine_pool_config: EnginePoolConfig | None = None,
+        twitch_config: TwitchIRCConfig | None = None,
+        obs_config: OBSWebSocketConfig | None = None,
+        streaming: bool = True,
+        tts_workers: int = 2,
+        speculative: bool = False,
     ) -> None:
         """
         Args:
@@ -39,35 +67,122 @@ class AITuberSystem:
             obs_password: OBS WebSocketのパスワード
             voice_config: 音声設定
             expression_config: 表情設定
+            tts_cache_dir: 合成済み音声のディスクキャッシュ先(Noneの場合はメモリのみ)
+            tts_cache_max_bytes: ディスクキャッシュの上限バイト数(Noneの場合は無制限)
+            lip_sync_mode: リップシンクの生成方法 ("audio" or "audio_query")
+            mfcc_backend: 音声特徴量の計算方法 ("numpy" or "librosa")
+            animation_record_path: アニメーションの記録先(Noneの場合は記録しない)
+            chat_queue_config: チャット受付キューの設定(応答するメッセージの優先度)
+            response_cache_config: LLM応答のキャッシュ設定
+            context_config: LLMに送る会話コンテキストの設定
+            ollama_host: OllamaサーバーのURL(Noneの場合はollamaの既定値)
+            residency_config: LLMのモデルの常駐設定(ウォームアップと保持期間の延長)
+            backend_pool_config: 複数のOllamaサーバーへの振り分け設定(サーバーの指定がない場合は
+                ollama_hostのみを使う)
+            tts_engine_pool_config: 複数のVOICEVOXエンジンへの振り分け設定
+            twitch_config: Twitchチャットへの接続設定
+            obs_config: OBS WebSocketの接続と字幕の更新の設定
+            streaming: LLMの出力を文単位で逐次音声合成する(最初の音声までの待ち時間を短くする)
+            tts_workers: 音声合成ワーカー数(ストリーミング時に複数の文を並行して合成する)
+            speculative: 応答の再生中に次の候補の応答を先行して生成する
         """
-        # コンポーネントの初期化
-        self.llm = LocalLLM()
-        self.tts = LocalTTS(voice_config)
-        self.avatar = AvatarController(vrm_path, expression_config)
-        self.stream = StreamHandler(
-            platform=platform,
-            video_id=video_id,
-            obs_host=obs_host,
-            obs_port=obs_port,
-            obs_password=obs_password,
-        )
+        # コンポーネントの初期化(起動時間の内訳を記録する)
+        self.startup_timer = StartupTimer()
+        with self.startup_timer.measure("llm"):
+            self.llm_pool = (
+                BackendPool(backend_pool_config)
+                if backend_pool_config is not None and backend_pool_config.backends
+                else None
+            )
+            self.llm = LocalLLM(
+                context_config=context_config,
+                host=ollama_host,
+                residency=residency_config,
+                pool=self.llm_pool,
+            )
+            response_cache_config = response_cache_config or ResponseCacheConfig()
+            self.response_cache = (
+                ResponseCache(response_cache_config) if response_cache_config.enabled else None
+            )
+        with self.startup_timer.measure("tts"):
+            self.tts = LocalTTS(
+                voice_config=voice_config,
+                cache=AudioCache(cache_dir=tts_cache_dir, max_disk_bytes=tts_cache_max_bytes),
+                query_cache=AudioQueryCache(),
+                engine_pool=tts_engine_pool_config,
+            )
+        with self.startup_timer.measure("avatar"):
+            self.avatar = AvatarController(vrm_path, expression_config, mfcc_backend=mfcc_backend)
+            self.animation = AnimationEngine(self.avatar)
+        with self.startup_timer.measure("stream"):
+            self.stream = StreamHandler(
+                platform=platform,
+                video_id=video_id,
+                obs_host=obs_host,
+                obs_port=obs_port,
+                obs_password=obs_password,
+                twitch_config=twitch_config,
+                obs_config=obs_config,
+            )
 
         # 状態管理
+        self.animation_record_path = animation_record_path
         self.is_running = False
         self.last_response_time = None
         self.response_interval = 5.0  # 秒
 
+        # 応答パイプライン(各ステージを並行実行)
+        with self.startup_timer.measure("pipeline"):
+            self.pipeline = ResponsePipeline(
+                llm=self.llm,
+                tts=self.tts,
+                avatar=self.avatar,
+                stream=self.stream,
+                config=PipelineConfig(
+                    response_interval=self.response_interval,
+                    lip_sync_mode=lip_sync_mode,
+                    streaming=streaming,
+                    tts_workers=tts_workers,
+                    chat_queue=chat_queue_config or ChatQueueConfig(),
+                    speculative=speculative,
+                ),
+                on_response=self._on_response,
+                animation=self.animation,
+                response_cache=self.response_cache,
+            )
+
     async def start(self) -> None:
         """システムを開始"""
         try:
+            # 最初のコメントでモデルの読み込みを待たないよう事前に読み込む
+            with self.startup_timer.measure("llm_warm_up"):
+                try:
+                    await asyncio.get_running_loop().run_in_executor(None, self.llm.warm_up)
+                except Exception as e:
+                    print(f"Error warming up LLM: {e}")
+            self.llm.start_heartbeat()
+            if self.llm_pool is not None:
+                self.llm_pool.start_health_checks()
+            self.tts.start_health_checks()
+
             # 各コンポーネントの接続
             await self.stream.connect()
+            await self.pipeline.start()
+            await self.animation.start()
+            if self.animation_record_path:
+                # 前回異常終了した記録を先にGLBファイルにする
+                record_dir = Path(self.animation_record_path).parent
+                for path in await asyncio.to_thread(recover_recordings, record_dir):
+                    print(f"Recovered animation recording: {path}")
+                # ルートノードの姿勢と表情の重みを配信中ずっと記録する
+                root: list[str | int] | None = [0] if len(self.avatar.node_transforms) else None
+                await self.animation.start_recording(self.animation_record_path, nodes=root)
             self.is_running = True
 
-            # メインループ
+            # メインループ(チャットの受付のみ行い、応答処理はパイプラインに任せる)
             while self.is_running:
                 async for message in self.stream.get_chat_messages():
-                    await self._process_message(message)
+                    self.pipeline.submit(message)
 
         except Exception as e:
             print(f"Error in main loop: {e}")
@@ -77,54 +192,42 @@ class AITuberSystem:
     async def stop(self) -> None:
         """システムを停止"""
         self.is_running = False
+        self.llm.stop_heartbeat()
+        if self.llm_pool is not None:
+            self.llm_pool.stop_health_checks()
+        await self.pipeline.stop()
+        await self.animation.stop()
+        self.tts.stop_health_checks()
+        await self.tts.aclose()
         await self.stream.disconnect()
 
     async def _process_message(self, message: ChatMessage) -> None:
         """チャットメッセージを処理
 
+        パイプラインが動作中の場合は受付キューに投入し、応答する順番はキューに任せる。
+        応答間隔はパイプラインがLLM処理の開始時に守る。
+
         Args:
             message: チャットメッセージ
         """
-        # 応答間隔のチェック
-        if self.last_response_time:
-            elapsed = (datetime.now() - self.last_response_time).total_seconds()
-            if elapsed < self.response_interval:
-                return
+        if self.pipeline.is_running:
+            self.pipeline.submit(message)
+            return
 
         try:
-            # LLMで応答を生成
-            response = self.llm.generate_response(message.message)
-            if not response:
-                return
-
-            # 音声合成
-            audio_data = self.tts.text_to_speech(response)
-            if not audio_data:
-                return
-
-            # リップシンクデータの生成
-            lip_sync_data = self.avatar.lip_sync(audio_data)
-
-            # アバターの更新
-            self.avatar.set_expression(
-                ExpressionConfig(
-                    happy=0.3,  # 簡易的な感情表現
-                    angry=0.0,
-                    sad=0.0,
-                    relaxed=0.7,
-                    surprised=0.0,
-                )
-            )
-
-            # OBSに送信
-            await self.stream.send_to_obs(response)
-
-            # 状態の更新
-            self.last_response_time = datetime.now()
-
+            await self.pipeline.process(message)
         except Exception as e:
             print(f"Error processing message: {e}")
 
+    def _on_response(self, item: PipelineItem) -> None:
+        """応答の出力完了時の処理
+
+        Args:
+            item: 処理済みのパイプライン項目
+        """
+        # 状態の更新
+        self.last_response_time = datetime.now()
+
     def get_status(self) -> dict:
         """システムの状態を取得
 
@@ -137,7 +240,21 @@ class AITuberSystem:
             if self.last_response_time
             else None,
             "stream_info": self.stream.get_stream_info(),
+            "llm": self.llm.get_stats(),
+            "llm_backends": self.llm_pool.get_stats() if self.llm_pool is not None else None,
+            "pipeline": dict(self.pipeline.stats),
+            "speculation_hit_rate": self.pipeline.speculation_hit_rate,
+            "chat_queue": dict(self.pipeline.chat_queue.stats)
+            if self.pipeline.chat_queue is not None
+            else None,
+            "tts_engines": self.tts.get_engine_stats(),
+            "tts_cache": dict(self.tts.cache.stats) if self.tts.cache is not None else None,
+            "response_cache": dict(self.response_cache.stats)
+            if self.response_cache is not None
+            else None,
             "available_expressions": self.avatar.get_available_expressions(),
+            "startup": dict(self.startup_timer.timings),
+            "animation": self.animation.get_stats(),
         }
 
 
@@ -161,7 +278,25 @@ async def main() -> None:
         obs_password=config.get("obs_password"),
         voice_config=VoiceConfig(**config.get("voice_config", {})),
         expression_config=ExpressionConfig(**config.get("expression_config", {})),
+        tts_cache_dir=config.get("tts_cache_dir"),
+        tts_cache_max_bytes=config.get("tts_cache_max_bytes", 512 * 1024 * 1024),
+        lip_sync_mode=config.get("lip_sync_mode", "audio"),
+        mfcc_backend=config.get("mfcc_backend", "numpy"),
+        animation_record_path=config.get("animation_record_path"),
+        chat_queue_config=ChatQueueConfig(**config.get("chat_queue", {})),
+        response_cache_config=ResponseCacheConfig(**config.get("response_cache", {})),
+        context_config=ContextConfig(**config.get("context", {})),
+        ollama_host=config.get("ollama_host"),
+        residency_config=ResidencyConfig(**config.get("residency", {})),
+        backend_pool_config=BackendPoolConfig(**config.get("llm_backends", {})),
+        tts_engine_pool_config=EnginePoolConfig(**config.get("tts_engines", {})),
+        twitch_config=TwitchIRCConfig(**config.get("twitch", {})),
+        obs_config=OBSWebSocketConfig(**config.get("obs", {})),
+        streaming=config.get("streaming", True),
+        tts_workers=config.get("tts_workers", 2),
+        speculative=config.get("speculative", False),
     )
+    print(f"Startup time:\n{system.startup_timer.report()}")
 
     # システムの開始
     try:
@@ -0,0 +1,413 @@
+"""
+チャット受付キューの実装
+似たメッセージをまとめ、スコアの高いメッセージから順にLLMへ渡す
+"""
+
+import asyncio
+import heapq
+import math
+import re
+import time
+import unicodedata
+from collections import Counter, OrderedDict, deque
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+from pydantic import BaseModel, Field
+
+from src.llm.response_cache import char_ngrams
+from src.stream.stream_handler import ChatMessage
+
+# 3回以上続く同じ文字(「wwww」「ーーー」など)
+_REPEATED_CHARACTERS = re.compile(r"(.)\1{2,}")
+
+
+class ChatQueueConfig(BaseModel):
+    """チャット受付キューの設定"""
+
+    ttl: float = Field(default=30.0, description="メッセージを応答候補として保持する時間(秒)")
+    question_weight: float = Field(default=1.0, description="疑問符を含むメッセージの加点")
+    mention_weight: float = Field(default=1.5, description="呼びかけを含むメッセージの加点")
+    mention_names: list[str] = Field(default_factory=list, description="呼びかけとみなす名前")
+    first_time_weight: float = Field(default=1.0, description="初めて投稿した視聴者の加点")
+    superchat_weight: float = Field(default=3.0, description="スーパーチャットの加点")
+    superchat_amount_weight: float = Field(
+        default=1.0, description="スーパーチャットの金額の桁数あたりの加点"
+    )
+    duplicate_weight: float = Field(default=0.5, description="同じ内容の投稿1件あたりの加点")
+    max_duplicate_bonus: float = Field(default=2.0, description="同じ内容の投稿による加点の上限")
+    similarity_threshold: float = Field(
+        default=0.6,
+        description="まとめる候補とする文字n-gramの類似度(0〜1、1の場合は正規化後の完全一致のみ)",
+    )
+    ngram_size: int = Field(default=2, description="類似度の計算に使う文字n-gramの長さ")
+    max_edit_distance: int = Field(
+        default=1, description="類似の候補とまとめる編集距離(正規化後の文字数)の上限"
+    )
+    author_memory: int = Field(default=10000, description="投稿済みとして記憶する視聴者数")
+
+
+def normalize_message(text: str) -> str:
+    """メッセージを重複判定用に正規化
+
+    全角・半角と大文字・小文字を揃え、空白と句読点を除き、
+    3回以上続く同じ文字を2文字にまとめる。
+
+    Args:
+        text: メッセージ
+
+    Returns:
+        正規化したメッセージ
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(char for char in text if unicodedata.category(char)[0] not in ("P", "Z", "C"))
+    return _REPEATED_CHARACTERS.sub(r"\1\1", text)
+
+
+def within_edit_distance(a: str, b: str, limit: int) -> bool:
+    """2つの文字列の編集距離が上限以下かどうか
+
+    上限を超えることが確定した時点で計算を打ち切る。
+
+    Args:
+        a: 文字列
+        b: 文字列
+        limit: 編集距離の上限
+
+    Returns:
+        編集距離が上限以下の場合はTrue
+    """
+    if abs(len(a) - len(b)) > limit:
+        return False
+    previous = list(range(len(b) + 1))
+    for i, char in enumerate(a, 1):
+        current = [i]
+        for j, other in enumerate(b, 1):
+            current.append(
+                min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other))
+            )
+        if min(current) > limit:
+            return False
+        previous = current
+    return previous[-1] <= limit
+
+
+@dataclass(eq=False)
+class QueuedMessage:
+    """キュー内の応答候補(同じ内容のメッセージをまとめたもの)"""
+
+    message: ChatMessage
+    key: str
+    order: int
+    received_at: float
+    expires_at: float
+    base_score: float
+    grams: frozenset[str] = field(default_factory=frozenset)
+    first_time: bool = False
+    score: float = 0.0
+    count: int = 1
+    version: int = 0
+    alive: bool = True
+
+
+class ChatQueue:
+    """スコア順に取り出せる上限付きのチャット受付キュー
+
+    正規化した内容が同じか、編集距離が上限以下のメッセージは1件にまとめ、
+    件数に応じて加点する(「こんにちは!」「こんにちはー」「こんにちわ」など)。
+    類似の候補は、保持中の候補の文字n-gramの転置インデックスからDice係数が
+    閾値以上のものを集めて確認する。
+    取り出し用と破棄用の2つのヒープで管理し、スコアの更新や削除では
+    古い要素を残したまま無効化する(取り出し時に読み飛ばす)。
+    挿入と取り出しはO(log n)で、保持する件数は `max_size` までに制限する。
+    スコアが同じ場合は先に届いたものを優先する。
+    """
+
+    def __init__(
+        self,
+        config: ChatQueueConfig | None = None,
+        max_size: int = 256,
+        on_discard: Callable[[ChatMessage], None] | None = None,
+        clock: Callable[[], float] = time.perf_counter,
+    ) -> None:
+        """
+        Args:
+            config: キューの設定
+            max_size: 保持する応答候補の上限
+            on_discard: メッセージが応答されずに破棄されたときに呼ばれるコールバック
+            clock: 現在時刻(秒)を返す関数
+        """
+        self.config = config or ChatQueueConfig()
+        self.max_size = max(1, max_size)
+        self.on_discard = on_discard
+        self.clock = clock
+
+        self._entries: dict[str, QueuedMessage] = {}
+        # 文字n-gramから、それを含む候補のキーへの転置インデックス
+        self._index: dict[str, set[str]] = {}
+        # 取り出し用(スコアの高い順)と破棄用(スコアの低い順)のヒープ
+        self._best: list[tuple[float, int, int, QueuedMessage]] = []
+        self._worst: list[tuple[float, int, int, QueuedMessage]] = []
+        # 受付順(有効期限順)の候補
+        self._arrivals: deque[QueuedMessage] = deque()
+        self._authors: OrderedDict[str, None] = OrderedDict()
+        self._order = 0
+        self._available = asyncio.Event()
+        self._mention_names = [normalize_message(name) for name in self.config.mention_names]
+
+        self.stats = {
+            "pushed": 0,
+            "served": 0,
+            "coalesced": 0,
+            "evicted": 0,
+            "expired": 0,
+            "rejected": 0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def put(self, message: ChatMessage) -> bool:
+        """メッセージを投入
+
+        同じ内容の候補がある場合はまとめる。上限に達している場合は
+        最もスコアの低い候補(同点の場合は古いもの)を破棄するが、
+        新しいメッセージの方がスコアが低い場合はそれを破棄する。
+
+        Args:
+            message: チャットメッセージ
+
+        Returns:
+            他のメッセージを破棄せずに投入(またはまとめることが)できた場合はTrue
+        """
+        now = self.clock()
+        self._expire(now)
+        self.stats["pushed"] += 1
+
+        key = normalize_message(message.message)
+        if not key:
+            # 記号や空白だけのメッセージには応答しない
+            self._discard(message, "rejected")
+            return False
+
+        score = self.score(message, key)
+        first_time = self._author(message) not in self._authors
+        grams = char_ngrams(key, self.config.ngram_size)
+        entry = self._entries.get(key) or self._nearest(key, grams)
+        if entry is not None:
+            entry.count += 1
+            if score > entry.base_score:
+                entry.message = message
+                entry.base_score = score
+                entry.first_time = first_time
+            self._push(entry)
+            self._remember_author(message)
+            self._discard(message, "coalesced")
+            return True
+
+        accepted = True
+        if len(self._entries) >= self.max_size:
+            worst = self._peek_worst()
+            if score < worst.score:
+                self._discard(message, "rejected")
+                return False
+            self._remove(worst)
+            self._forget_author(worst)
+            self._discard(worst.message, "evicted")
+            accepted = False
+
+        self._order += 1
+        entry = QueuedMessage(
+            message=message,
+            key=key,
+            order=self._order,
+            received_at=now,
+            expires_at=now + self.config.ttl,
+            base_score=score,
+            grams=grams,
+            first_time=first_time,
+        )
+        self._entries[key] = entry
+        for gram in grams:
+            self._index.setdefault(gram, set()).add(key)
+        self._remember_author(message)
+        self._arrivals.append(entry)
+        self._push(entry)
+        self._available.set()
+        return accepted
+
+    def get_nowait(self) -> QueuedMessage | None:
+        """最もスコアの高い候補を取り出す
+
+        Returns:
+            応答候補(候補がない場合はNone)
+        """
+        self._expire(self.clock())
+        while self._best:
+            _, _, version, entry = heapq.heappop(self._best)
+            if entry.alive and entry.version == version:
+                self._remove(entry)
+                self.stats["served"] += 1
+                return entry
+        return None
+
+    def peek(self, count: int = 1) -> list[QueuedMessage]:
+        """スコアの高い順に候補を取り出さずに取得
+
+        Args:
+            count: 取得する候補数
+
+        Returns:
+            応答候補(スコアの高い順)
+        """
+        self._expire(self.clock())
+        top: list[tuple[float, int, int, QueuedMessage]] = []
+        while self._best and len(top) < count:
+            element = heapq.heappop(self._best)
+            _, _, version, entry = element
+            if entry.alive and entry.version == version:
+                top.append(element)
+        # 有効な要素だけを戻す(無効な要素はここで取り除かれる)
+        for element in top:
+            heapq.heappush(self._best, element)
+        return [entry for _, _, _, entry in top]
+
+    async def get(self) -> QueuedMessage:
+        """候補が届くまで待機して、最もスコアの高い候補を取り出す
+
+        Returns:
+            応答候補
+        """
+        while True:
+            entry = self.get_nowait()
+            if entry is not None:
+                return entry
+            self._available.clear()
+            await self._available.wait()
+
+    def score(self, message: ChatMessage, key: str | None = None) -> float:
+        """メッセージのスコアを計算
+
+        投稿者はキューに受け付けたときに記憶するため、ここでは記憶しない。
+
+        Args:
+            message: チャットメッセージ
+            key: 正規化済みのメッセージ(Noneの場合は正規化する)
+
+        Returns:
+            スコア
+        """
+        config = self.config
+        text = unicodedata.normalize("NFKC", message.message)
+        if key is None:
+            key = normalize_message(text)
+
+        score = 0.0
+        if "?" in text:
+            score += config.question_weight
+        if any(name and name in key for name in self._mention_names):
+            score += config.mention_weight
+        if message.superchat_amount:
+            score += config.superchat_weight
+            score += config.superchat_amount_weight * math.log10(1.0 + message.superchat_amount)
+
+        if self._author(message) not in self._authors:
+            score += config.first_time_weight
+        return score
+
+    @staticmethod
+    def _author(message: ChatMessage) -> str:
+        return f"{message.platform}:{message.author}"
+
+    def _remember_author(self, message: ChatMessage) -> None:
+        """受け付けたメッセージの投稿者を記憶"""
+        author = self._author(message)
+        if author in self._authors:
+            self._authors.move_to_end(author)
+        else:
+            self._authors[author] = None
+            if len(self._authors) > self.config.author_memory:
+                self._authors.popitem(last=False)
+
+    def _forget_author(self, entry: QueuedMessage) -> None:
+        """応答せずに破棄した候補が初めての投稿だった場合は、投稿者を忘れる"""
+        if entry.first_time:
+            self._authors.pop(self._author(entry.message), None)
+
+    def _nearest(self, key: str, grams: frozenset[str]) -> QueuedMessage | None:
+        """類似度が閾値以上かつ編集距離が上限以下で、最も近い候補を検索"""
+        threshold = self.config.similarity_threshold
+        if threshold >= 1.0:
+            return None
+        overlaps: Counter[str] = Counter()
+        for gram in grams:
+            keys = self._index.get(gram)
+            if keys:
+                overlaps.update(keys)
+
+        best = None
+        best_score = threshold
+        for other, overlap in overlaps.items():
+            entry = self._entries[other]
+            score = 2.0 * overlap / (len(grams) + len(entry.grams))
+            if score < best_score:
+                continue
+            # 同点の場合は先に届いた候補にまとめる
+            if best is not None and score <= best_score and entry.order > best.order:
+                continue
+            if within_edit_distance(key, other, self.config.max_edit_distance):
+                best, best_score = entry, score
+        return best
+
+    def _push(self, entry: QueuedMessage) -> None:
+        """候補のスコアを更新してヒープに追加(古い要素は無効になる)"""
+        config = self.config
+        bonus = min((entry.count - 1) * config.duplicate_weight, config.max_duplicate_bonus)
+        entry.score = entry.base_score + bonus
+        entry.version += 1
+        heapq.heappush(self._best, (-entry.score, entry.order, entry.version, entry))
+        heapq.heappush(self._worst, (entry.score, entry.order, entry.version, entry))
+        garbage = len(self._best) + len(self._worst) + len(self._arrivals)
+        if garbage > 6 * len(self._entries) + 64:
+            self._compact()
+
+    def _peek_worst(self) -> QueuedMessage:
+        """最もスコアの低い有効な候補を取得"""
+        while True:
+            _, _, version, entry = self._worst[0]
+            if entry.alive and entry.version == version:
+                return entry
+            heapq.heappop(self._worst)
+
+    def _remove(self, entry: QueuedMessage) -> None:
+        entry.alive = False
+        del self._entries[entry.key]
+        for gram in entry.grams:
+            keys = self._index[gram]
+            keys.discard(entry.key)
+            if not keys:
+                del self._index[gram]
+
+    def _expire(self, now: float) -> None:
+        """有効期限を過ぎた候補を破棄"""
+        arrivals = self._arrivals
+        while arrivals and (not arrivals[0].alive or arrivals[0].expires_at <= now):
+            entry = arrivals.popleft()
+            if entry.alive:
+                self._remove(entry)
+                self._forget_author(entry)
+                self._discard(entry.message, "expired")
+
+    def _compact(self) -> None:
+        """無効になった要素を取り除いてヒープを作り直す"""
+        entries = self._entries.values()
+        self._best = [(-e.score, e.order, e.version, e) for e in entries]
+        self._worst = [(e.score, e.order, e.version, e) for e in entries]
+        heapq.heapify(self._best)
+        heapq.heapify(self._worst)
+        self._arrivals = deque(e for e in self._arrivals if e.alive)
+
+    def _discard(self, message: ChatMessage, reason: str) -> None:
+        self.stats[reason] += 1
+        if self.on_discard is not None:
+            self.on_discard(message)
@@ -0,0 +1,695 @@
+"""
+応答パイプラインの実装
+チャット受付 → LLM → TTS → リップシンク → 出力 の各段を非同期ワーカーとして並行実行する
+"""
+
+import asyncio
+import functools
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Literal, TypeVar
+
+from pydantic import BaseModel, Field
+
+from src.avatar.animation_engine import AnimationEngine
+from src.avatar.avatar_controller import AvatarController, ExpressionConfig, LipSyncStream
+from src.avatar.lip_sync_timeline import LipSyncTimeline
+from src.avatar.wav_reader import is_wav, read_wav
+from src.llm.local_llm import LocalLLM
+from src.llm.response_cache import ResponseCache
+from src.pipeline.chat_queue import ChatQueue, ChatQueueConfig, QueuedMessage
+from src.pipeline.sentence_chunker import SentenceChunker, split_sentences
+from src.stream.stream_handler import ChatMessage, StreamHandler
+from src.tts.local_tts import LocalTTS
+
+T = TypeVar("T")
+
+
+class PipelineConfig(BaseModel):
+    """応答パイプラインの設定"""
+
+    ingest_queue_size: int = Field(default=32, description="チャット受付キューの上限")
+    chat_queue: ChatQueueConfig = Field(
+        default_factory=ChatQueueConfig, description="チャット受付キューの設定"
+    )
+    stage_queue_size: int = Field(default=2, description="ステージ間キューの上限")
+    executor_workers: int = Field(default=4, description="ブロッキング処理用スレッド数")
+    response_interval: float = Field(default=0.0, description="LLM処理開始の最小間隔(秒)")
+    streaming: bool = Field(default=False, description="LLMの出力を文単位で逐次音声合成する")
+    tts_workers: int = Field(default=1, description="音声合成ワーカー数")
+    min_clause_length: int = Field(default=8, description="読点で分割する最小文字数")
+    max_chunk_length: int = Field(default=80, description="1チャンクの最大文字数")
+    lip_sync_mode: Literal["audio", "audio_query"] = Field(
+        default="audio",
+        description="リップシンクの生成方法(音声解析、または音声クエリのモーラ長)",
+    )
+    speculative: bool = Field(
+        default=False, description="応答の再生中に次の候補の応答と音声を先行して生成する"
+    )
+    speculation_depth: int = Field(default=2, description="先行して生成する候補の数(上位から)")
+
+
+@dataclass
+class PipelineItem:
+    """パイプラインを流れる1件分の応答"""
+
+    message: ChatMessage
+    response: str | None = None
+    received_at: float = field(default_factory=time.perf_counter)
+    first_output_at: float | None = None
+    completed_at: float | None = None
+    playback_end: float | None = None
+    spoken_chunks: int = 0
+    failed: bool = False
+    cached: bool = False
+    lip_sync_stream: LipSyncStream | None = field(default=None, repr=False)
+
+
+@dataclass
+class SpeechChunk:
+    """応答を文・節単位に分割した音声合成の単位
+
+    `is_last` のチャンクは応答の終端を示すマーカーで、テキストを持たない。
+    """
+
+    item: PipelineItem
+    sequence: int
+    index: int
+    text: str
+    is_last: bool = False
+    audio_data: bytes | None = None
+    audio_query: dict | None = None
+    lip_sync_data: LipSyncTimeline | None = None
+
+
+@dataclass
+class Speculation:
+    """受付キューの候補に対して先行して生成した応答
+
+    `version` は生成を始めた時点の会話履歴の版で、採用時に変わっていれば破棄する。
+    `task` は完了すると音声合成・リップシンク済みのチャンク(失敗した場合はNone)を返す。
+    """
+
+    item: PipelineItem
+    version: int
+    task: "asyncio.Task[list[SpeechChunk] | None]"
+
+
+class ResponsePipeline:
+    """チャットへの応答を段階的に処理するパイプライン
+
+    各ステージは独立したasyncioタスクとして動作し、上限付きキューで接続される。
+    下流が詰まると上流の `put` が待たされるため、処理量は自然に抑制される。
+    同期APIの呼び出しはスレッドプールで実行し、イベントループを止めない。
+
+    ステージ間は `SpeechChunk` 単位で受け渡す。ストリーミングモードでは
+    LLMのトークンを文単位にまとめて、完成した文から順に音声合成する。
+    文ごとのリップシンクは応答単位の `LipSyncStream` で解析し、口の開きの基準を揃える。
+    音声合成ワーカーが複数ある場合の完了順の入れ替わりは出力段で並べ直す。
+
+    出力段は音声を再生装置に渡した後は待たないため、再生時間はリップシンクの
+    タイムライン(ない場合はWAVの長さ)から見積もり、チャンクは出力開始から
+    続けて再生されるものとする。応答は見積もった再生終了まで出力中として扱う。
+
+    投機モードでは、応答の再生中に受付キューの上位の候補について
+    LLMの応答・音声合成・リップシンクを先行して行い、再生が終わった時点で
+    最もスコアの高い候補の結果が会話履歴の変化なしに使えれば、そのまま出力段へ渡す。
+    上位から外れた候補や会話履歴が変わった後の結果は破棄する。
+    """
+
+    def __init__(
+        self,
+        llm: LocalLLM,
+        tts: LocalTTS,
+        avatar: AvatarController,
+        stream: StreamHandler,
+        config: PipelineConfig | None = None,
+        on_response: Callable[[PipelineItem], None] | None = None,
+        animation: AnimationEngine | None = None,
+        response_cache: ResponseCache | None = None,
+    ) -> None:
+        """
+        Args:
+            llm: LLMシステム
+            tts: 音声合成システム
+            avatar: アバター制御システム
+            stream: 配信システム
+            config: パイプライン設定
+            on_response: 応答の出力が完了したときに呼ばれるコールバック
+            animation: 表情とリップシンクを再生するアニメーションエンジン
+            response_cache: LLMの応答を再利用するキャッシュ
+        """
+        self.llm = llm
+        self.tts = tts
+        self.avatar = avatar
+        self.stream = stream
+        self.config = config or PipelineConfig()
+        self.on_response = on_response
+        self.animation = animation
+        self.response_cache = response_cache
+
+        self._executor: ThreadPoolExecutor | None = None
+        self._ingest_queue: ChatQueue | None = None
+        self._tts_queue: asyncio.Queue[SpeechChunk] | None = None
+        self._lip_sync_queue: asyncio.Queue[SpeechChunk] | None = None
+        self._output_queue: asyncio.Queue[SpeechChunk] | None = None
+        self._tasks: list[asyncio.Task[None]] = []
+        self._pending = 0
+        self._idle: asyncio.Event | None = None
+        self._last_llm_start: float | None = None
+        self._sequence = 0
+        self._replies_in_flight = 0
+        self._playback_end = 0.0
+        self._playback_timers: set[asyncio.TimerHandle] = set()
+        self._wakeup: asyncio.Event | None = None
+        self._speculations: dict[QueuedMessage, Speculation] = {}
+
+        self.stats = {
+            "submitted": 0,
+            "dropped": 0,
+            "completed": 0,
+            "failed": 0,
+            "chunks": 0,
+            "cache_hits": 0,
+            "speculation_hits": 0,
+            "speculation_misses": 0,
+            "speculations_started": 0,
+            "speculations_discarded": 0,
+        }
+
+    @property
+    def is_running(self) -> bool:
+        """ワーカーが動作中かどうか"""
+        return bool(self._tasks)
+
+    @property
+    def speculation_hit_rate(self) -> float:
+        """投機モードで先行生成した応答を採用できた割合"""
+        total = self.stats["speculation_hits"] + self.stats["speculation_misses"]
+        return self.stats["speculation_hits"] / total if total else 0.0
+
+    @property
+    def chat_queue(self) -> ChatQueue | None:
+        """チャット受付キュー(未起動の場合はNone)"""
+        return self._ingest_queue
+
+    async def start(self) -> None:
+        """ステージワーカーを起動"""
+        if self._tasks:
+            return
+
+        size = self.config.stage_queue_size
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.config.executor_workers,
+            thread_name_prefix="pipeline",
+        )
+        self._ingest_queue = ChatQueue(
+            self.config.chat_queue,
+            max_size=self.config.ingest_queue_size,
+            on_discard=lambda message: self._finish_item(dropped=True),
+        )
+        self._tts_queue = asyncio.Queue(maxsize=size)
+        self._lip_sync_queue = asyncio.Queue(maxsize=size)
+        self._output_queue = asyncio.Queue(maxsize=size)
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._wakeup = asyncio.Event()
+        self._replies_in_flight = 0
+
+        llm_worker = self._speculative_worker if self.config.speculative else self._llm_worker
+        self._tasks = [
+            asyncio.create_task(llm_worker(), name="pipeline-llm"),
+            *(
+                asyncio.create_task(self._tts_worker(), name=f"pipeline-tts-{i}")
+                for i in range(max(1, self.config.tts_workers))
+            ),
+            asyncio.create_task(self._lip_sync_worker(), name="pipeline-lip-sync"),
+            asyncio.create_task(self._output_worker(), name="pipeline-output"),
+        ]
+
+    async def stop(self) -> None:
+        """ステージワーカーを停止"""
+        tasks: list[asyncio.Task] = [
+            *self._tasks,
+            *(speculation.task for speculation in self._speculations.values()),
+        ]
+        self._tasks = []
+        self._speculations.clear()
+        for timer in self._playback_timers:
+            timer.cancel()
+        self._playback_timers.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._pending = 0
+        if self._idle:
+            self._idle.set()
+
+    def submit(self, message: ChatMessage) -> bool:
+        """チャットメッセージを受付キューに投入
+
+        チャットの読み込みを止めないよう待機はしない。
+        同じ内容のメッセージはまとめ、LLMが空いたときに最もスコアの高いものを処理する。
+        キューが満杯の場合は最もスコアの低い(同点の場合は最も古い)メッセージを破棄する。
+
+        Args:
+            message: チャットメッセージ
+
+        Returns:
+            破棄なしで投入できた場合はTrue
+        """
+        if self._ingest_queue is None or self._idle is None:
+            raise RuntimeError("Pipeline is not started")
+
+        # まとめられた・破棄されたメッセージは投入中に終了扱いになるため先に数える
+        self._pending += 1
+        self._idle.clear()
+        self.stats["submitted"] += 1
+        accepted = self._ingest_queue.put(message)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return accepted
+
+    async def join(self) -> None:
+        """投入済みのメッセージがすべて処理されるまで待機"""
+        if self._idle:
+            await self._idle.wait()
+
+    async def process(self, message: ChatMessage) -> PipelineItem | None:
+        """1件のメッセージを全ステージに順に通して処理
+
+        ワーカーを使わない単発処理用。ブロッキング処理はスレッドプールで実行する。
+
+        Args:
+            message: チャットメッセージ
+
+        Returns:
+            処理結果(応答が得られなかった場合はNone)
+        """
+        item = PipelineItem(message=message)
+        async for chunk in self._generate_chunks(item):
+            await self._run_tts(chunk)
+            await self._run_lip_sync(chunk)
+            await self._run_output(chunk)
+        return item if item.spoken_chunks and not item.failed else None
+
+    async def _run_blocking(self, func: Callable[..., T], *args: object) -> T:
+        """同期関数をスレッドプールで実行"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+
+    async def _wait_response_interval(self) -> None:
+        """LLM処理開始の最小間隔を守る"""
+        interval = self.config.response_interval
+        if interval > 0 and self._last_llm_start is not None:
+            remaining = interval - (time.perf_counter() - self._last_llm_start)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+        self._last_llm_start = time.perf_counter()
+
+    def _new_chunk(self, item: PipelineItem, index: int, text: str, is_last: bool) -> SpeechChunk:
+        self._sequence += 1
+        return SpeechChunk(item, self._sequence, index, text, is_last)
+
+    async def _generate_chunks(self, item: PipelineItem) -> AsyncIterator[SpeechChunk]:
+        """LLMの応答を音声合成単位のチャンクとして順に生成
+
+        キャッシュに応答がある場合はLLMを呼び出さず、会話履歴にだけ追加する。
+        エラーが発生した場合も必ず終端チャンクを生成する。
+        """
+        index = 0
+        cache = self.response_cache
+        try:
+            # 生成後は履歴が変わるため、文脈は生成前に求める
+            context = self._cache_context()
+            cached = cache.get(item.message.message, context) if cache is not None else None
+            if cached is not None:
+                item.response = cached
+                item.cached = True
+                self.stats["cache_hits"] += 1
+                self.llm.commit_response(item.message.message, cached)
+                # ストリーミングモードでは生成時と同じく文単位で音声合成する
+                texts = (
+                    split_sentences(
+                        cached, self.config.min_clause_length, self.config.max_chunk_length
+                    )
+                    if self.config.streaming
+                    else [cached]
+                )
+                for text in texts:
+                    yield self._new_chunk(item, index, text, is_last=False)
+                    index += 1
+            elif self.config.streaming:
+                chunker = SentenceChunker(
+                    self.config.min_clause_length, self.config.max_chunk_length
+                )
+                tokens = self.llm.generate_response_stream(item.message.message)
+                parts: list[str] = []
+                while True:
+                    # 次のトークンを待つ間もイベントループを止めない
+                    token = await self._run_blocking(next, tokens, None)
+                    if token is None:
+                        break
+                    parts.append(token)
+                    for text in chunker.feed(token):
+                        yield self._new_chunk(item, index, text, is_last=False)
+                        index += 1
+                for text in chunker.flush():
+                    yield self._new_chunk(item, index, text, is_last=False)
+                    index += 1
+                item.response = "".join(parts)
+            else:
+                item.response = await self._run_blocking(
+                    self.llm.generate_response, item.message.message
+                )
+                if item.response:
+                    yield self._new_chunk(item, index, item.response, is_last=False)
+                    index += 1
+            if cache is not None and item.response and not item.cached:
+                cache.put(item.message.message, item.response, context)
+        except Exception as e:
+            print(f"Error generating response: {e}")
+            item.failed = True
+
+        yield self._new_chunk(item, index, "", is_last=True)
+
+    def _cache_context(self) -> str:
+        """応答キャッシュのキーに使う現在の会話の文脈"""
+        cache = self.response_cache
+        if cache is None:
+            return ""
+        return self.llm.context_fingerprint(cache.config.context_turns)
+
+    async def _run_tts(self, chunk: SpeechChunk) -> None:
+        if chunk.text and not chunk.item.failed:
+            if self.config.lip_sync_mode == "audio_query":
+                (
+                    chunk.audio_data,
+                    chunk.audio_query,
+                ) = await self.tts.text_to_speech_with_query_async(chunk.text)
+            else:
+                chunk.audio_data = await self.tts.text_to_speech_async(chunk.text)
+
+    async def _run_lip_sync(self, chunk: SpeechChunk) -> None:
+        if chunk.audio_query is not None:
+            # モーラ長からの変換は軽量なのでイベントループ上で直接実行する
+            # (モーラ単位の区間は既に短いため、子音と母音の強度差を残してまとめない)
+            chunk.lip_sync_data = LipSyncTimeline.from_lip_sync_data(
+                self.avatar.lip_sync_from_audio_query(chunk.audio_query), merge=False
+            )
+        elif chunk.audio_data:
+            if self.config.streaming and is_wav(chunk.audio_data):
+                chunk.lip_sync_data = await self._run_blocking(
+                    self._stream_lip_sync, chunk.item, chunk.audio_data
+                )
+            else:
+                chunk.lip_sync_data = await self._run_blocking(
+                    self.avatar.lip_sync_timeline, chunk.audio_data
+                )
+
+    def _stream_lip_sync(self, item: PipelineItem, audio_data: bytes) -> LipSyncTimeline:
+        """応答ごとの逐次解析器で文単位の音声を解析
+
+        振幅の下限(top_db)の基準を応答内で引き継ぐため、小さな声の文だけ
+        口が大きく開くことがない。時刻はチャンクの先頭を0とする。
+        """
+        wav = read_wav(audio_data)
+        stream = item.lip_sync_stream
+        if stream is None or (stream.sample_rate, stream.channels) != (
+            wav.sample_rate,
+            wav.channels,
+        ):
+            stream = self.avatar.create_lip_sync_stream(wav.sample_rate, channels=wav.channels)
+            item.lip_sync_stream = stream
+        return stream.analyze(wav.samples())
+
+    async def _run_output(self, chunk: SpeechChunk) -> None:
+        item = chunk.item
+        if chunk.audio_data:
+            if item.spoken_chunks == 0:
+                item.first_output_at = time.perf_counter()
+                # アバターの更新
+                expression = ExpressionConfig(
+                    happy=0.3,  # 簡易的な感情表現
+                    angry=0.0,
+                    sad=0.0,
+                    relaxed=0.7,
+                    surprised=0.0,
+                )
+                self.avatar.set_expression(expression)
+                if self.animation is not None:
+                    self.animation.set_target(expression)
+            self._schedule_playback(chunk)
+            item.spoken_chunks += 1
+            self.stats["chunks"] += 1
+
+            # OBSに送信
+            await self.stream.send_to_obs(chunk.text)
+
+        if chunk.is_last:
+            item.completed_at = time.perf_counter()
+            if item.spoken_chunks and not item.failed and self.on_response:
+                self.on_response(item)
+
+    def _schedule_playback(self, chunk: SpeechChunk) -> None:
+        """チャンクの再生を予約し、応答の再生終了時刻(perf_counterの時刻)を更新"""
+        now = time.perf_counter()
+        timeline = chunk.lip_sync_data
+        if self.animation is not None and timeline is not None:
+            # 口形は前のチャンクの終了後に続けて再生される
+            start = self.animation.play_lip_sync(timeline)
+            end = now + start + timeline.duration - self.animation.clock()
+        else:
+            if timeline is not None:
+                duration = timeline.duration
+            elif chunk.audio_data and is_wav(chunk.audio_data):
+                duration = read_wav(chunk.audio_data).duration
+            else:
+                duration = 0.0
+            end = max(now, self._playback_end) + duration
+        self._playback_end = max(self._playback_end, end)
+        chunk.item.playback_end = self._playback_end
+
+    async def _chunk_worker(
+        self,
+        name: str,
+        source: "asyncio.Queue[SpeechChunk]",
+        stage: Callable[[SpeechChunk], Awaitable[None]],
+        sink: "asyncio.Queue[SpeechChunk]",
+    ) -> None:
+        """キューから取り出したチャンクにステージ処理を適用して次段へ流す
+
+        失敗したチャンクも出力段での並べ直しのため音声なしで次段へ渡す。
+        """
+        while True:
+            chunk = await source.get()
+            try:
+                await stage(chunk)
+            except Exception as e:
+                print(f"Error in pipeline stage {name}: {e}")
+                chunk.item.failed = True
+            # 下流が満杯なら空くまで待つ(バックプレッシャー)
+            await sink.put(chunk)
+            source.task_done()
+
+    async def _llm_worker(self) -> None:
+        ingest_queue, tts_queue = self._ingest_queue, self._tts_queue
+        assert ingest_queue is not None and tts_queue is not None
+        while True:
+            queued = await ingest_queue.get()
+            item = PipelineItem(message=queued.message, received_at=queued.received_at)
+            await self._wait_response_interval()
+            async for chunk in self._generate_chunks(item):
+                await tts_queue.put(chunk)
+
+    async def _tts_worker(self) -> None:
+        assert self._tts_queue is not None and self._lip_sync_queue is not None
+        await self._chunk_worker("tts", self._tts_queue, self._run_tts, self._lip_sync_queue)
+
+    async def _lip_sync_worker(self) -> None:
+        assert self._lip_sync_queue is not None and self._output_queue is not None
+        await self._chunk_worker(
+            "lip_sync", self._lip_sync_queue, self._run_lip_sync, self._output_queue
+        )
+
+    async def _output_worker(self) -> None:
+        output_queue = self._output_queue
+        assert output_queue is not None
+        # 生成順に並べ直すための待機バッファ
+        waiting: dict[int, SpeechChunk] = {}
+        next_sequence = self._sequence + 1
+        while True:
+            chunk = await output_queue.get()
+            waiting[chunk.sequence] = chunk
+            while next_sequence in waiting:
+                ready = waiting.pop(next_sequence)
+                next_sequence += 1
+                try:
+                    await self._run_output(ready)
+                except Exception as e:
+                    print(f"Error in pipeline stage output: {e}")
+                    ready.item.failed = True
+                if ready.is_last:
+                    self._finish_reply(ready.item)
+            output_queue.task_done()
+
+    async def _speculative_worker(self) -> None:
+        """出力中の応答がなければ最良の候補を処理し、出力中は上位の候補を先行生成する"""
+        wakeup, ingest_queue = self._wakeup, self._ingest_queue
+        assert wakeup is not None and ingest_queue is not None
+        while True:
+            wakeup.clear()
+            if self._replies_in_flight == 0:
+                entry = ingest_queue.get_nowait()
+                if entry is not None:
+                    await self._wait_response_interval()
+                    await self._commit(entry)
+                    continue
+            self._update_speculations()
+            # 候補の追加、応答の出力完了、先行生成の完了のいずれかで再評価する
+            await wakeup.wait()
+
+    def _update_speculations(self) -> None:
+        """上位から外れた候補や古くなった先行生成を破棄し、次の先行生成を始める"""
+        wakeup, ingest_queue = self._wakeup, self._ingest_queue
+        assert wakeup is not None and ingest_queue is not None
+        top = ingest_queue.peek(self.config.speculation_depth)
+        version = self.llm.context_version
+        for entry, speculation in list(self._speculations.items()):
+            if entry not in top or speculation.version != version:
+                self._discard_speculation(entry)
+
+        # LLMの負荷を抑えるため先行生成は1件ずつ行う
+        if any(not s.task.done() for s in self._speculations.values()):
+            return
+        for entry in top:
+            if entry not in self._speculations:
+                item = PipelineItem(message=entry.message, received_at=entry.received_at)
+                task = asyncio.create_task(self._speculate(item), name="pipeline-speculation")
+                task.add_done_callback(lambda _: wakeup.set())
+                self._speculations[entry] = Speculation(item, version, task)
+                self.stats["speculations_started"] += 1
+                return
+
+    def _discard_speculation(self, entry: QueuedMessage) -> None:
+        speculation = self._speculations.pop(entry)
+        speculation.task.cancel()
+        self.stats["speculations_discarded"] += 1
+
+    async def _speculate(self, item: PipelineItem) -> list[SpeechChunk] | None:
+        """会話履歴を変更せずに応答を生成し、音声合成とリップシンクまで行う"""
+        text = item.message.message
+        cache = self.response_cache
+        try:
+            response = cache.get(text, self._cache_context()) if cache is not None else None
+            if response is not None:
+                item.cached = True
+            else:
+                response = await self._run_blocking(self.llm.generate_candidate, text)
+            if not response:
+                return None
+            item.response = response
+
+            texts = (
+                split_sentences(
+                    response, self.config.min_clause_length, self.config.max_chunk_length
+                )
+                if self.config.streaming
+                else [response]
+            )
+            # 出力順の番号は採用時に振り直す
+            chunks = [SpeechChunk(item, 0, index, chunk) for index, chunk in enumerate(texts)]
+            for chunk in chunks:
+                await self._run_tts(chunk)
+                await self._run_lip_sync(chunk)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error in speculative generation: {e}")
+            return None
+        return chunks
+
+    async def _commit(self, entry: QueuedMessage) -> None:
+        """候補を応答として確定し、先行生成が使えればそれを出力段へ渡す"""
+        output_queue, tts_queue = self._output_queue, self._tts_queue
+        assert output_queue is not None and tts_queue is not None
+        self._replies_in_flight += 1
+        speculation = self._speculations.pop(entry, None)
+        if speculation is not None and speculation.version == self.llm.context_version:
+            chunks = await speculation.task
+            response = speculation.item.response
+            if chunks is not None and response is not None:
+                item = speculation.item
+                text = item.message.message
+                # 版が変わっていないので、文脈は先行生成を始めた時点と同じ
+                context = self._cache_context()
+                self.llm.commit_response(text, response)
+                if item.cached:
+                    self.stats["cache_hits"] += 1
+                elif self.response_cache is not None:
+                    self.response_cache.put(text, response, context)
+                self.stats["speculation_hits"] += 1
+                for chunk in chunks:
+                    self._sequence += 1
+                    chunk.sequence = self._sequence
+                    await output_queue.put(chunk)
+                await output_queue.put(self._new_chunk(item, len(chunks), "", is_last=True))
+                return
+        elif speculation is not None:
+            speculation.task.cancel()
+            self.stats["speculations_discarded"] += 1
+
+        self.stats["speculation_misses"] += 1
+        item = PipelineItem(message=entry.message, received_at=entry.received_at)
+        async for chunk in self._generate_chunks(item):
+            await tts_queue.put(chunk)
+
+    def _finish_reply(self, item: PipelineItem) -> None:
+        """応答1件の出力終了を記録
+
+        音声の再生が終わるまでは出力中として扱い、次の応答を始めない。
+        """
+        remaining = 0.0
+        if item.playback_end is not None:
+            remaining = item.playback_end - time.perf_counter()
+        if remaining > 0:
+
+            def end_playback() -> None:
+                self._playback_timers.discard(timer)
+                self._end_playback()
+
+            timer = asyncio.get_running_loop().call_later(remaining, end_playback)
+            self._playback_timers.add(timer)
+        else:
+            self._end_playback()
+        if item.failed:
+            self._finish_item(failed=True)
+        elif item.spoken_chunks == 0:
+            self._finish_item(dropped=True)
+        else:
+            self._finish_item()
+
+    def _end_playback(self) -> None:
+        """応答1件の再生終了を記録し、次の応答の処理を再開"""
+        self._replies_in_flight = max(0, self._replies_in_flight - 1)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _finish_item(self, dropped: bool = False, failed: bool = False) -> None:
+        """1件の処理終了を記録"""
+        if dropped:
+            self.stats["dropped"] += 1
+        elif failed:
+            self.stats["failed"] += 1
+        else:
+            self.stats["completed"] += 1
+
+        self._pending = max(0, self._pending - 1)
+        if self._pending == 0 and self._idle:
+            self._idle.set()
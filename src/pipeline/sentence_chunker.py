@@ -0,0 +1,95 @@
+"""
+文分割の実装
+LLMのトークン列を音声合成に適した文・節単位のチャンクにまとめる
+"""
+
+# 文末とみなす記号
+SENTENCE_DELIMITERS = frozenset("。！？!?\n")
+# 節の区切りとみなす記号(十分な長さがある場合のみ分割する)
+CLAUSE_DELIMITERS = frozenset("、，,")
+# 区切り記号の直後に続いても同じチャンクに含める閉じ括弧など
+TRAILING_CHARACTERS = frozenset("」』）)】〉》\"'…ー〜~")
+
+
+class SentenceChunker:
+    """トークンを蓄積して文・節単位のチャンクを返す
+
+    区切り記号の直後に続く記号(「！？」や閉じ括弧)を同じチャンクに含めるため、
+    チャンクは区切りの次の文字を受け取った時点、または `flush` 時に確定する。
+    """
+
+    def __init__(self, min_clause_length: int = 8, max_chunk_length: int = 80) -> None:
+        """
+        Args:
+            min_clause_length: 読点で分割する最小文字数
+            max_chunk_length: 区切り記号がなくても分割する最大文字数
+        """
+        self.min_clause_length = min_clause_length
+        self.max_chunk_length = max_chunk_length
+        self._buffer = ""
+        # 確定待ちの区切り位置(区切り記号の直後のインデックス)
+        self._cut: int | None = None
+
+    def feed(self, text: str) -> list[str]:
+        """テキスト断片を追加
+
+        Args:
+            text: LLMから受け取ったテキスト断片
+
+        Returns:
+            確定したチャンクのリスト
+        """
+        chunks: list[str] = []
+        for char in text:
+            if self._cut is not None:
+                if char in SENTENCE_DELIMITERS or char in TRAILING_CHARACTERS:
+                    self._buffer += char
+                    self._cut += 1
+                    continue
+                self._emit(chunks)
+
+            self._buffer += char
+            if char in SENTENCE_DELIMITERS or (
+                char in CLAUSE_DELIMITERS and len(self._buffer) >= self.min_clause_length
+            ):
+                self._cut = len(self._buffer)
+            elif len(self._buffer) >= self.max_chunk_length:
+                self._cut = len(self._buffer)
+                self._emit(chunks)
+
+        return chunks
+
+    def flush(self) -> list[str]:
+        """残りのテキストをチャンクとして確定
+
+        Returns:
+            確定したチャンクのリスト
+        """
+        chunks: list[str] = []
+        self._cut = len(self._buffer)
+        self._emit(chunks)
+        return chunks
+
+    def _emit(self, chunks: list[str]) -> None:
+        """確定待ちの区切り位置までをチャンクとして取り出す"""
+        cut = self._cut if self._cut is not None else len(self._buffer)
+        chunk = self._buffer[:cut].strip()
+        self._buffer = self._buffer[cut:]
+        self._cut = None
+        if chunk:
+            chunks.append(chunk)
+
+
+def split_sentences(text: str, min_clause_length: int = 8, max_chunk_length: int = 80) -> list[str]:
+    """テキスト全体を文・節単位のチャンクに分割
+
+    Args:
+        text: 分割するテキスト
+        min_clause_length: 読点で分割する最小文字数
+        max_chunk_length: 区切り記号がなくても分割する最大文字数
+
+    Returns:
+        チャンクのリスト
+    """
+    chunker = SentenceChunker(min_clause_length, max_chunk_length)
+    return chunker.feed(text) + chunker.flush()
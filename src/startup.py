@@ -0,0 +1,79 @@
+"""
+起動時間の計測
+コンポーネントごとのインポート・初期化にかかった時間を記録して表示する
+"""
+
+import importlib
+import sys
+import time
+from collections.abc import Generator
+from contextlib import contextmanager
+
+# 起動時に読み込まれるコンポーネントのモジュール
+COMPONENT_MODULES = {
+    "avatar": "src.avatar.avatar_controller",
+    "llm": "src.llm.local_llm",
+    "tts": "src.tts.local_tts",
+    "stream": "src.stream.stream_handler",
+    "pipeline": "src.pipeline.response_pipeline",
+}
+
+
+class StartupTimer:
+    """処理ごとの所要時間を記録する"""
+
+    def __init__(self) -> None:
+        self.timings: dict[str, float] = {}
+
+    @contextmanager
+    def measure(self, name: str) -> Generator[None, None, None]:
+        """ブロックの所要時間を記録
+
+        Args:
+            name: 記録する処理の名前
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    @property
+    def total(self) -> float:
+        """記録した所要時間の合計(秒)"""
+        return sum(self.timings.values())
+
+    def report(self) -> str:
+        """所要時間の一覧を文字列で取得
+
+        Returns:
+            処理ごとの所要時間(ミリ秒)と合計
+        """
+        width = max((len(name) for name in self.timings), default=0)
+        lines = [
+            f"{name:<{width}}  {elapsed * 1000:8.1f} ms" for name, elapsed in self.timings.items()
+        ]
+        lines.append(f"{'total':<{width}}  {self.total * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+
+def measure_imports(timer: StartupTimer, modules: dict[str, str] | None = None) -> None:
+    """コンポーネントのモジュールを読み込み、インポート時間を記録
+
+    読み込み済みのモジュールは計測されないため、新しいプロセスで呼び出す。
+
+    Args:
+        timer: 記録先
+        modules: コンポーネント名とモジュール名の対応(Noneの場合は全コンポーネント)
+    """
+    for name, module in (modules or COMPONENT_MODULES).items():
+        if module in sys.modules:
+            continue
+        with timer.measure(f"import {name}"):
+            importlib.import_module(module)
+
+
+if __name__ == "__main__":
+    startup_timer = StartupTimer()
+    measure_imports(startup_timer)
+    print(startup_timer.report())
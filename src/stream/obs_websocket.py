@@ -0,0 +1,354 @@
+"""
+OBS WebSocket(v5)クライアントの実装
+1本の接続を保ち、字幕などの頻繁な更新はまとめてRequestBatchで送る
+"""
+
+import asyncio
+import base64
+import contextlib
+import hashlib
+import itertools
+import json
+from typing import TYPE_CHECKING
+
+from pydantic import BaseModel, Field
+
+if TYPE_CHECKING:
+    import websockets
+
+# obs-websocket v5のオペコード
+OP_HELLO = 0
+OP_IDENTIFY = 1
+OP_IDENTIFIED = 2
+OP_REQUEST = 6
+OP_REQUEST_RESPONSE = 7
+OP_REQUEST_BATCH = 8
+OP_REQUEST_BATCH_RESPONSE = 9
+# 認証に失敗した場合の切断コード
+CLOSE_AUTHENTICATION_FAILED = 4009
+
+
+class OBSWebSocketConfig(BaseModel):
+    """OBS WebSocketの接続と更新の設定"""
+
+    subtitle_source: str = Field(default="Subtitle", description="字幕を表示するテキストソース名")
+    update_interval: float = Field(
+        default=0.05, description="まとめた更新を送る間隔(秒、間隔内の更新は最新の値だけを送る)"
+    )
+    connect_timeout: float = Field(default=5.0, description="接続と認証のタイムアウト(秒)")
+    request_timeout: float = Field(default=5.0, description="リクエストの応答のタイムアウト(秒)")
+    reconnect_delay: float = Field(default=1.0, description="再接続までの最初の待ち時間(秒)")
+    max_reconnect_delay: float = Field(default=30.0, description="再接続までの待ち時間の上限(秒)")
+
+
+def make_authentication(password: str, salt: str, challenge: str) -> str:
+    """obs-websocketの認証文字列を作成
+
+    Args:
+        password: OBS WebSocketのパスワード
+        salt: Helloに含まれるソルト
+        challenge: Helloに含まれるチャレンジ
+
+    Returns:
+        Identifyに含める認証文字列
+    """
+    secret = base64.b64encode(hashlib.sha256((password + salt).encode()).digest()).decode()
+    return base64.b64encode(hashlib.sha256((secret + challenge).encode()).digest()).decode()
+
+
+class OBSWebSocketClient:
+    """1本の接続を保つobs-websocket v5クライアント
+
+    接続が切れた場合は待ち時間を倍にしながら再接続する(認証に失敗した場合は再接続しない)。
+    `queue_request` / `set_text` による更新は待たずに戻り、同じキーの更新は最新の値だけを残して
+    `update_interval` ごとに1回のRequestBatchでまとめて送る。
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 4455,
+        password: str | None = None,
+        config: OBSWebSocketConfig | None = None,
+    ) -> None:
+        """
+        Args:
+            host: OBS WebSocketのホスト
+            port: OBS WebSocketのポート
+            password: OBS WebSocketのパスワード
+            config: 接続と更新の設定
+        """
+        self.url = f"ws://{host}:{port}"
+        self.password = password
+        self.config = config or OBSWebSocketConfig()
+        self._ws: websockets.ClientConnection | None = None
+        self._task: asyncio.Task | None = None
+        self._closed = False
+        self._identified = asyncio.Event()
+        self._first_attempt: asyncio.Future | None = None
+        self._responses: dict[str, asyncio.Future] = {}
+        self._request_ids = itertools.count(1)
+        # キーごとの最新の更新(送信待ち)
+        self._pending: dict[str, tuple[str, dict]] = {}
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._flush_tasks: set[asyncio.Task] = set()
+        self.stats = {
+            "connections": 0,
+            "reconnects": 0,
+            "requests": 0,
+            "batches": 0,
+            "updates": 0,
+            "coalesced": 0,
+            "failures": 0,
+            "malformed": 0,
+        }
+
+    @property
+    def connected(self) -> bool:
+        """接続と認証が済んでいるかどうか"""
+        return self._identified.is_set()
+
+    async def start(self) -> bool:
+        """接続を開始し、最初の接続の試行が終わるまで待つ
+
+        接続できなかった場合もバックグラウンドで再接続を続ける。
+
+        Returns:
+            接続できた場合はTrue
+        """
+        if self._task is None:
+            self._closed = False
+            self._first_attempt = asyncio.get_running_loop().create_future()
+            self._task = asyncio.create_task(self._run())
+        first_attempt = self._first_attempt
+        assert first_attempt is not None
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(asyncio.shield(first_attempt), self.config.connect_timeout)
+        return self.connected
+
+    async def close(self) -> None:
+        """接続を切断"""
+        self._closed = True
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for task in list(self._flush_tasks):
+            task.cancel()
+        self._pending.clear()
+
+    async def request(self, request_type: str, data: dict | None = None) -> dict:
+        """リクエストを送り、応答を待つ
+
+        Args:
+            request_type: リクエストの種類(GetVersionなど)
+            data: リクエストのデータ
+
+        Returns:
+            応答のデータ
+        """
+        message = {"requestType": request_type, "requestData": data or {}}
+        response = await self._call(OP_REQUEST, message)
+        self.stats["requests"] += 1
+        status = response["requestStatus"]
+        if not status["result"]:
+            raise RuntimeError(
+                f"OBS request {request_type} failed ({status['code']}): {status.get('comment')}"
+            )
+        return response.get("responseData") or {}
+
+    async def request_batch(
+        self, requests: list[tuple[str, dict]], halt_on_failure: bool = False
+    ) -> list[dict]:
+        """複数のリクエストを1往復で送る
+
+        Args:
+            requests: リクエストの種類とデータの組のリスト
+            halt_on_failure: 失敗したリクエスト以降を実行しないかどうか
+
+        Returns:
+            リクエストごとの結果(requestStatusとresponseDataを含む)
+        """
+        message = {
+            "haltOnFailure": halt_on_failure,
+            "executionType": 0,
+            "requests": [
+                {"requestType": request_type, "requestData": data}
+                for request_type, data in requests
+            ],
+        }
+        response = await self._call(OP_REQUEST_BATCH, message)
+        self.stats["batches"] += 1
+        results: list[dict] = response.get("results", [])
+        self.stats["failures"] += sum(1 for r in results if not r["requestStatus"]["result"])
+        return results
+
+    def queue_request(self, key: str, request_type: str, data: dict) -> None:
+        """リクエストを次のまとめた送信に加える(同じキーのリクエストは最新のものだけを送る)
+
+        Args:
+            key: 更新対象を表すキー
+            request_type: リクエストの種類
+            data: リクエストのデータ
+        """
+        self.stats["updates"] += 1
+        if key in self._pending:
+            self.stats["coalesced"] += 1
+        self._pending[key] = (request_type, data)
+        if self._flush_handle is None and self.connected:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self.config.update_interval, self._start_flush
+            )
+
+    def set_text(self, input_name: str, text: str) -> None:
+        """テキストソースの表示を更新(待たずに戻り、まとめて送る)
+
+        Args:
+            input_name: テキストソース名
+            text: 表示するテキスト
+        """
+        self.queue_request(
+            f"text:{input_name}",
+            "SetInputSettings",
+            {"inputName": input_name, "inputSettings": {"text": text}},
+        )
+
+    async def flush(self) -> None:
+        """送信待ちの更新をまとめて送る"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            await self.request_batch(list(pending.values()))
+        except (ConnectionError, TimeoutError) as e:
+            print(f"Error sending updates to OBS: {e}")
+            # 送れなかった更新は、新しい更新がない場合だけ再接続後に送る
+            for key, request in pending.items():
+                self._pending.setdefault(key, request)
+        except (KeyError, ValueError, TypeError) as e:
+            # 不正なデータや応答は送り直しても同じ結果になるため破棄し、以降の送信は続ける
+            print(f"Error in OBS batch update: {e!r}")
+            self.stats["malformed"] += 1
+
+    def _start_flush(self) -> None:
+        self._flush_handle = None
+        task = asyncio.create_task(self.flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _call(self, op: int, message: dict) -> dict:
+        """メッセージを送り、同じrequestIdの応答を待つ"""
+        if not self.connected:
+            try:
+                await asyncio.wait_for(self._identified.wait(), self.config.request_timeout)
+            except TimeoutError:
+                raise ConnectionError("Not connected to OBS") from None
+
+        import websockets
+
+        ws = self._ws
+        if ws is None:
+            raise ConnectionError("Not connected to OBS")
+        request_id = str(next(self._request_ids))
+        future = asyncio.get_running_loop().create_future()
+        self._responses[request_id] = future
+        try:
+            try:
+                await ws.send(json.dumps({"op": op, "d": {**message, "requestId": request_id}}))
+            except websockets.ConnectionClosed as e:
+                raise ConnectionError("OBS WebSocket connection lost") from e
+            return await asyncio.wait_for(future, self.config.request_timeout)
+        finally:
+            self._responses.pop(request_id, None)
+
+    async def _run(self) -> None:
+        """接続を保ち、切断された場合は再接続する"""
+        # 起動を速くするため接続時に読み込む
+        import websockets
+
+        delay = self.config.reconnect_delay
+        while not self._closed:
+            try:
+                async with websockets.connect(self.url, compression=None) as ws:
+                    await asyncio.wait_for(self._identify(ws), self.config.connect_timeout)
+                    self._ws = ws
+                    self._identified.set()
+                    self.stats["connections"] += 1
+                    self._resolve_first_attempt()
+                    delay = self.config.reconnect_delay
+                    if self._pending:
+                        # 切断中にたまった更新を送る
+                        self._start_flush()
+                    async for raw in ws:
+                        try:
+                            self._dispatch(json.loads(raw))
+                        except (ValueError, KeyError, TypeError, AttributeError) as e:
+                            # 1件の不正なメッセージで接続と受信タスクを止めない
+                            print(f"Ignoring malformed OBS WebSocket message: {e!r}")
+                            self.stats["malformed"] += 1
+            except PermissionError as e:
+                print(f"OBS WebSocket authentication failed: {e}")
+                break
+            except (OSError, websockets.WebSocketException) as e:
+                if not self._closed:
+                    print(f"OBS WebSocket connection lost: {e}")
+            finally:
+                self._disconnected()
+
+            # closeされた場合はループの条件で終了する
+            if not self._closed:
+                self.stats["reconnects"] += 1
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.config.max_reconnect_delay)
+
+    async def _identify(self, ws: "websockets.ClientConnection") -> None:
+        """HelloへのIdentifyで認証する"""
+        import websockets
+
+        try:
+            hello = json.loads(await ws.recv())
+            if hello.get("op") != OP_HELLO:
+                raise ConnectionError(f"Unexpected message from OBS: {hello}")
+            identify: dict[str, object] = {"rpcVersion": 1, "eventSubscriptions": 0}
+            authentication = hello["d"].get("authentication")
+            if authentication:
+                if self.password is None:
+                    raise PermissionError("OBS WebSocket requires a password")
+                identify["authentication"] = make_authentication(
+                    self.password, authentication["salt"], authentication["challenge"]
+                )
+            await ws.send(json.dumps({"op": OP_IDENTIFY, "d": identify}))
+
+            identified = json.loads(await ws.recv())
+            if identified.get("op") != OP_IDENTIFIED:
+                raise ConnectionError(f"Unexpected message from OBS: {identified}")
+        except websockets.ConnectionClosed as e:
+            if getattr(e.rcvd, "code", None) == CLOSE_AUTHENTICATION_FAILED:
+                raise PermissionError("Wrong OBS WebSocket password") from None
+            raise
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            # 再接続で回復できるよう接続エラーとして扱う
+            raise ConnectionError(f"Malformed handshake message from OBS: {e!r}") from e
+
+    def _dispatch(self, message: dict) -> None:
+        """応答を待っているリクエストに渡す(イベントは購読しないため無視する)"""
+        if message.get("op") in (OP_REQUEST_RESPONSE, OP_REQUEST_BATCH_RESPONSE):
+            data = message["d"]
+            future = self._responses.get(data.get("requestId"))
+            if future is not None and not future.done():
+                future.set_result(data)
+
+    def _disconnected(self) -> None:
+        self._ws = None
+        self._identified.clear()
+        self._resolve_first_attempt()
+        for future in self._responses.values():
+            if not future.done():
+                future.set_exception(ConnectionError("OBS WebSocket connection lost"))
+
+    def _resolve_first_attempt(self) -> None:
+        if self._first_attempt is not None and not self._first_attempt.done():
+            self._first_attempt.set_result(None)
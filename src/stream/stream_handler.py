@@ -7,11 +7,14 @@ import asyncio
 import json
 from collections.abc import AsyncGenerator
 from datetime import datetime
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
-import pytchat
 from pydantic import BaseModel, Field
 
+if TYPE_CHECKING:
+    from src.stream.obs_websocket import OBSWebSocketClient, OBSWebSocketConfig
+    from src.stream.twitch_irc import TwitchChatClient, TwitchIRCConfig
+
 
 class ChatMessage(BaseModel):
     """チャットメッセージのモデル"""
@@ -20,6 +23,8 @@ class ChatMessage(BaseModel):
     message: str = Field(..., description="メッセージ内容")
     timestamp: datetime = Field(..., description="投稿時刻")
     platform: str = Field(..., description="配信プラットフォーム")
+    superchat_amount: float | None = Field(default=None, description="スーパーチャットの金額")
+    superchat_currency: str | None = Field(default=None, description="スーパーチャットの通貨")
 
 
 class StreamHandler:
@@ -32,34 +37,60 @@ class StreamHandler:
         obs_host: str = "localhost",
         obs_port: int = 4455,
         obs_password: str | None = None,
+        twitch_config: "TwitchIRCConfig | None" = None,
+        obs_config: "OBSWebSocketConfig | None" = None,
     ) -> None:
         """
         Args:
-            video_id: 配信ID
+            video_id: 配信ID(Twitchの場合はチャンネル名)
             platform: 配信プラットフォーム ("youtube" or "twitch")
             obs_host: OBS WebSocketのホスト
             obs_port: OBS WebSocketのポート
-            obs_password: OBS WebSocketのパスワード
+            obs_password: OBS WebSocketのパスワード(Noneの場合は認証なし)
+            twitch_config: Twitchチャットへの接続設定
+            obs_config: OBS WebSocketの接続と字幕の更新の設定
         """
         self.video_id = video_id
         self.platform = platform
         self.obs_host = obs_host
         self.obs_port = obs_port
         self.obs_password = obs_password
+        self.twitch_config = twitch_config
+        self.obs_config = obs_config
         self._chat = None
-        self._obs_connected = False
+        self._twitch: TwitchChatClient | None = None
+        self._obs: OBSWebSocketClient | None = None
+
+    @property
+    def obs_websocket_url(self) -> str | None:
+        """OBS WebSocketのURL(ホストの指定がない場合はNone)"""
+        return f"ws://{self.obs_host}:{self.obs_port}" if self.obs_host else None
+
+    @property
+    def _obs_connected(self) -> bool:
+        return self._obs is not None and self._obs.connected
 
     async def connect(self) -> None:
         """配信プラットフォームとOBSに接続"""
         if self.platform == "youtube":
+            # 起動を速くするため接続時に読み込む
+            import pytchat
+
             self._chat = pytchat.create(video_id=self.video_id)
         elif self.platform == "twitch":
-            # TODO: Twitch接続の実装
-            pass
+            from src.stream.twitch_irc import TwitchChatClient
+
+            # 接続と再接続はメッセージの受信開始時に行う
+            self._twitch = TwitchChatClient(self.video_id, self.twitch_config)
+
+        if self.obs_websocket_url and self._obs is None:
+            from src.stream.obs_websocket import OBSWebSocketClient
 
-        if self.obs_websocket_url:
-            # TODO: OBS WebSocket接続の実装
-            self._obs_connected = True
+            # 接続できなかった場合もバックグラウンドで再接続を続ける
+            self._obs = OBSWebSocketClient(
+                self.obs_host, self.obs_port, self.obs_password, self.obs_config
+            )
+            await self._obs.start()
 
     async def get_chat_messages(self) -> AsyncGenerator[ChatMessage, None]:
         """チャットメッセージを取得
@@ -67,9 +98,14 @@ class StreamHandler:
         Yields:
             チャットメッセージ
         """
-        if not self._chat:
+        if not self._chat and not self._twitch:
             await self.connect()
 
+        if self._twitch is not None:
+            async for message in self._twitch.messages():
+                yield message
+            return
+
         while self._chat.is_alive():
             try:
                 data = await self._chat.get()
@@ -79,22 +115,24 @@ class StreamHandler:
                         message=item.message,
                         timestamp=item.timestamp,
                         platform=self.platform,
+                        superchat_amount=item.amountValue or None,
+                        superchat_currency=item.currency or None,
                     )
             except Exception as e:
                 print(f"Error getting chat messages: {e}")
                 break
 
     async def send_to_obs(self, message: str) -> None:
-        """OBSにメッセージを送信
+        """OBSの字幕のテキストソースにメッセージを表示
+
+        頻繁に呼ばれても、一定間隔ごとに最新のメッセージだけをまとめて送る。
 
         Args:
             message: 送信するメッセージ
         """
-        if not self._obs_connected:
+        if self._obs is None:
             return
-
-        # TODO: OBS WebSocketを使用したメッセージ送信の実装
-        pass
+        self._obs.set_text(self._obs.config.subtitle_source, message)
 
     async def disconnect(self) -> None:
         """接続を切断"""
@@ -102,9 +140,13 @@ class StreamHandler:
             self._chat.terminate()
             self._chat = None
 
-        if self._obs_connected:
-            # TODO: OBS WebSocket接続の切断処理を実装
-            self._obs_connected = False
+        if self._twitch is not None:
+            await self._twitch.close()
+            self._twitch = None
+
+        if self._obs is not None:
+            await self._obs.close()
+            self._obs = None
 
     def get_stream_info(self) -> dict:
         """配信情報を取得
@@ -112,9 +154,10 @@ class StreamHandler:
         Returns:
             配信情報を含む辞書
         """
-        # TODO: 配信情報取得の実装
         return {
             "platform": self.platform,
             "video_id": self.video_id,
             "obs_connected": self._obs_connected,
+            "obs": dict(self._obs.stats) if self._obs is not None else None,
+            "twitch": dict(self._twitch.stats) if self._twitch is not None else None,
         }
@@ -0,0 +1,302 @@
+"""
+Twitchチャット(IRC)クライアントの実装
+asyncioのソケットから行単位で読み取り、IRCv3タグ付きのメッセージをChatMessageに変換する
+"""
+
+import asyncio
+import contextlib
+import math
+import random
+import ssl
+from collections.abc import AsyncGenerator
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from pydantic import BaseModel, Field
+
+from src.stream.stream_handler import ChatMessage
+
+# IRCv3タグの値のエスケープ
+_TAG_ESCAPES = {":": ";", "s": " ", "\\": "\\", "r": "\r", "n": "\n"}
+# 改行のない受信データの上限(超えた場合は接続をやり直す)
+_MAX_BUFFER_SIZE = 1 << 20
+
+
+class TwitchIRCConfig(BaseModel):
+    """Twitchチャットへの接続設定"""
+
+    host: str = Field(default="irc.chat.twitch.tv", description="IRCサーバーのホスト")
+    port: int = Field(default=6697, description="IRCサーバーのポート")
+    tls: bool = Field(default=True, description="TLSで接続する")
+    nickname: str | None = Field(
+        default=None, description="ログインするユーザー名(Noneの場合は匿名で読み取り専用)"
+    )
+    token: str | None = Field(default=None, description="OAuthトークン(oauth:から始まる)")
+    read_size: int = Field(default=65536, description="1回に読み取る最大バイト数")
+    idle_timeout: float = Field(
+        default=360.0, description="この時間何も受信しない場合は切断されたとみなす(秒)"
+    )
+    reconnect_delay: float = Field(default=1.0, description="再接続までの最初の待ち時間(秒)")
+    max_reconnect_delay: float = Field(default=60.0, description="再接続までの待ち時間の上限(秒)")
+
+
+@dataclass
+class IrcMessage:
+    """IRCメッセージ1行分"""
+
+    command: str
+    params: list[str] = field(default_factory=list)
+    prefix: str = ""
+    tags: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def nick(self) -> str:
+        """送信者のニックネーム"""
+        return self.prefix.partition("!")[0]
+
+
+def _unescape_tag_value(value: str) -> str:
+    """IRCv3タグの値のエスケープを戻す"""
+    parts = value.split("\\")
+    result = [parts[0]]
+    pending = False
+    for part in parts[1:]:
+        if pending:
+            # 「\\」の後半は次の断片の先頭として扱わない
+            result.append(part)
+            pending = False
+        elif part:
+            result.append(_TAG_ESCAPES.get(part[0], part[0]) + part[1:])
+        else:
+            result.append("\\")
+            pending = True
+    return "".join(result)
+
+
+def parse_irc_line(line: str) -> IrcMessage:
+    """IRCメッセージ1行を解析
+
+    タグは `;` と `=` での分割だけで辞書にし、エスケープを含む値だけを戻す。
+
+    Args:
+        line: 改行を除いたIRCメッセージ
+
+    Returns:
+        解析したメッセージ
+    """
+    tags: dict[str, str] = {}
+    if line.startswith("@"):
+        raw_tags, _, line = line[1:].partition(" ")
+        for item in raw_tags.split(";"):
+            key, _, value = item.partition("=")
+            tags[key] = _unescape_tag_value(value) if "\\" in value else value
+
+    prefix = ""
+    if line.startswith(":"):
+        prefix, _, line = line[1:].partition(" ")
+
+    line, separator, trailing = line.partition(" :")
+    params = line.split()
+    command = params.pop(0).upper() if params else ""
+    if separator:
+        params.append(trailing)
+    return IrcMessage(command=command, params=params, prefix=prefix, tags=tags)
+
+
+def _parse_sent_at(value: str | None) -> datetime:
+    """tmi-sent-tsタグ(ミリ秒)を時刻に変換(不正な値の場合は現在時刻)"""
+    if value:
+        try:
+            return datetime.fromtimestamp(int(value) / 1000)
+        except (ValueError, OverflowError, OSError):
+            pass
+    return datetime.now()
+
+
+def _parse_bits(value: str | None) -> float | None:
+    """bitsタグを数値に変換(不正な値の場合はNone)"""
+    if not value:
+        return None
+    try:
+        bits = float(value)
+    except ValueError:
+        return None
+    return bits if math.isfinite(bits) and bits > 0 else None
+
+
+def to_chat_message(message: IrcMessage) -> ChatMessage | None:
+    """PRIVMSGをChatMessageに変換
+
+    Args:
+        message: IRCメッセージ
+
+    Returns:
+        チャットメッセージ(PRIVMSG以外の場合はNone)。
+        時刻やbitsのタグが不正な場合は、受信時刻・bitsなしとして扱う
+    """
+    if message.command != "PRIVMSG" or len(message.params) < 2:
+        return None
+    tags = message.tags
+    text = message.params[1]
+    if text.startswith("\x01ACTION ") and text.endswith("\x01"):
+        # /me コマンド
+        text = text[8:-1]
+
+    bits = _parse_bits(tags.get("bits"))
+    return ChatMessage(
+        author=tags.get("display-name") or message.nick,
+        message=text,
+        timestamp=_parse_sent_at(tags.get("tmi-sent-ts")),
+        platform="twitch",
+        superchat_amount=bits,
+        superchat_currency="BITS" if bits is not None else None,
+    )
+
+
+class TwitchChatClient:
+    """asyncioで動作するTwitchチャットの読み取りクライアント
+
+    受信データはまとめて読み取り、完全な行だけをまとめてデコードして解析する。
+    PINGには即座にPONGを返し、切断された場合は待ち時間を倍にしながら再接続する。
+    大量のメッセージを受信している間もイベントループを占有しないよう、
+    読み取りごとに他のタスクに処理を譲る。
+    """
+
+    def __init__(self, channel: str, config: TwitchIRCConfig | None = None) -> None:
+        """
+        Args:
+            channel: チャンネル名(先頭の#は省略可)
+            config: 接続設定
+        """
+        self.channel = channel.lstrip("#").lower()
+        self.config = config or TwitchIRCConfig()
+        self._writer: asyncio.StreamWriter | None = None
+        self._closed = False
+        self.connected = False
+        self.stats = {
+            "connections": 0,
+            "reconnects": 0,
+            "messages": 0,
+            "pings": 0,
+            "bytes": 0,
+            "malformed": 0,
+        }
+
+    async def messages(self) -> AsyncGenerator[ChatMessage, None]:
+        """チャットメッセージを受信(切断された場合は再接続する)
+
+        ログインに失敗した場合は再接続せずに `PermissionError` を送出する。
+
+        Yields:
+            チャットメッセージ
+        """
+        delay = self.config.reconnect_delay
+        while not self._closed:
+            try:
+                reader = await self._connect()
+                async for message in self._read_messages(reader):
+                    # 受信できていれば待ち時間を戻す
+                    delay = self.config.reconnect_delay
+                    yield message
+            except PermissionError as e:
+                # 認証情報の誤りは再接続しても直らないため、呼び出し元に伝えて終了させる
+                print(f"Twitch chat login failed: {e}")
+                raise
+            except OSError as e:
+                # タイムアウト(TimeoutError)もOSErrorに含まれる
+                if not self._closed:
+                    print(f"Twitch chat connection lost: {e}")
+            finally:
+                await self._close_writer()
+
+            # closeされた場合はループの条件で終了する
+            if not self._closed:
+                self.stats["reconnects"] += 1
+                # 同時に切断された多数のクライアントが一斉に再接続しないようにずらす
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+                delay = min(delay * 2, self.config.max_reconnect_delay)
+
+    async def close(self) -> None:
+        """接続を切断し、受信を終了"""
+        self._closed = True
+        await self._close_writer()
+
+    async def _connect(self) -> asyncio.StreamReader:
+        config = self.config
+        reader, self._writer = await asyncio.open_connection(
+            config.host, config.port, ssl=ssl.create_default_context() if config.tls else None
+        )
+        self.stats["connections"] += 1
+        # 匿名ログインは「justinfan」で始まる任意のユーザー名で行える
+        nickname = (config.nickname or f"justinfan{random.randint(10000, 99999)}").lower()
+        lines = ["CAP REQ :twitch.tv/tags twitch.tv/commands"]
+        if config.token:
+            token = config.token
+            lines.append(f"PASS {token if token.startswith('oauth:') else 'oauth:' + token}")
+        lines += [f"NICK {nickname}", f"JOIN #{self.channel}"]
+        await self._send(*lines)
+        return reader
+
+    async def _read_messages(
+        self, reader: asyncio.StreamReader
+    ) -> AsyncGenerator[ChatMessage, None]:
+        buffer = b""
+        while True:
+            chunk = await asyncio.wait_for(
+                reader.read(self.config.read_size), self.config.idle_timeout
+            )
+            if not chunk:
+                raise ConnectionResetError("Connection closed by server")
+            self.stats["bytes"] += len(chunk)
+
+            complete, separator, buffer = (buffer + chunk).rpartition(b"\r\n")
+            if not separator:
+                # 完全な行がまだない
+                if len(buffer) > _MAX_BUFFER_SIZE:
+                    raise ConnectionResetError("Received line is too long")
+                continue
+
+            for line in complete.decode("utf-8", errors="replace").split("\r\n"):
+                if not line:
+                    continue
+                message = parse_irc_line(line)
+                command = message.command
+                if command == "PRIVMSG":
+                    try:
+                        chat_message = to_chat_message(message)
+                    except ValueError as e:
+                        # 1件の不正なメッセージで読み取りを止めない
+                        print(f"Error parsing Twitch chat message: {e}")
+                        self.stats["malformed"] += 1
+                        continue
+                    if chat_message is not None:
+                        self.stats["messages"] += 1
+                        yield chat_message
+                elif command == "PING":
+                    self.stats["pings"] += 1
+                    await self._send(f"PONG :{message.params[-1] if message.params else ''}")
+                elif command == "001":
+                    self.connected = True
+                elif command == "RECONNECT":
+                    # サーバーの再起動前に送られる
+                    raise ConnectionResetError("Server requested reconnect")
+                elif command == "NOTICE" and "authentication failed" in " ".join(message.params):
+                    raise PermissionError(message.params[-1])
+
+            # 大量に受信している間も他のタスクを実行できるようにする
+            await asyncio.sleep(0)
+
+    async def _send(self, *lines: str) -> None:
+        if self._writer is None:
+            return
+        self._writer.write("".join(f"{line}\r\n" for line in lines).encode())
+        await self._writer.drain()
+
+    async def _close_writer(self) -> None:
+        self.connected = False
+        writer, self._writer = self._writer, None
+        if writer is None:
+            return
+        writer.close()
+        with contextlib.suppress(OSError):
+            await writer.wait_closed()
@@ -0,0 +1,300 @@
+"""
+音声合成結果のキャッシュ
+メモリ上のLRUとディスク上の永続キャッシュの2段構成で合成済み音声を再利用する
+"""
+
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from src.tts.local_tts import VoiceConfig
+
+# キャッシュ形式を変更した場合に古いエントリを無効化するためのバージョン
+CACHE_VERSION = 1
+
+
+def normalize_text(text: str) -> str:
+    """キャッシュキー用にテキストを正規化
+
+    Args:
+        text: 正規化するテキスト
+
+    Returns:
+        全角・半角を統一し、空白をまとめたテキスト
+    """
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class AudioCache:
+    """合成済み音声の2段キャッシュ
+
+    キーは正規化テキストと `VoiceConfig` の全フィールドから計算したハッシュ。
+    メモリ層はバイト数で上限を設けたLRU、ディスク層は再起動後も残る。
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | None = None,
+        max_memory_bytes: int = 64 * 1024 * 1024,
+        max_disk_bytes: int | None = None,
+    ) -> None:
+        """
+        Args:
+            cache_dir: ディスクキャッシュのディレクトリ(Noneの場合はメモリのみ)
+            max_memory_bytes: メモリキャッシュの上限バイト数
+            max_disk_bytes: ディスクキャッシュの上限バイト数(Noneの場合は無制限)
+        """
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: OrderedDict[str, int] = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._scan_disk(self.cache_dir)
+
+    @staticmethod
+    def make_key(text: str, voice_config: "VoiceConfig") -> str:
+        """キャッシュキーを計算
+
+        Args:
+            text: 合成するテキスト
+            voice_config: 音声設定
+
+        Returns:
+            キャッシュキー(16進文字列)
+        """
+        payload = json.dumps(
+            {
+                "version": CACHE_VERSION,
+                "text": normalize_text(text),
+                "speaker_id": voice_config.speaker_id,
+                "voice": voice_config.model_dump(),
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> bytes | None:
+        """キャッシュから音声を取得
+
+        Args:
+            key: キャッシュキー
+
+        Returns:
+            音声データ(キャッシュにない場合はNone)
+        """
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return data
+
+            if key in self._disk:
+                path = self._disk_path(key)
+                try:
+                    data = path.read_bytes()
+                except OSError:
+                    self._forget_disk(key)
+                else:
+                    # 再起動後もLRU順を保てるよう更新時刻を更新する
+                    path.touch()
+                    self._disk.move_to_end(key)
+                    self.stats["disk_hits"] += 1
+                    self._store_memory(key, data)
+                    return data
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        """音声をキャッシュに保存
+
+        Args:
+            key: キャッシュキー
+            data: 音声データ
+        """
+        with self._lock:
+            self._store_memory(key, data)
+            if self.cache_dir and key not in self._disk:
+                self._store_disk(key, data)
+
+    def clear(self) -> None:
+        """メモリキャッシュとディスクキャッシュを削除"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            for key in list(self._disk):
+                self._disk_path(key).unlink(missing_ok=True)
+            self._disk.clear()
+            self._disk_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._memory.keys() | self._disk.keys())
+
+    @property
+    def memory_bytes(self) -> int:
+        """メモリキャッシュの使用バイト数"""
+        return self._memory_bytes
+
+    def _store_memory(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_memory_bytes:
+            return
+
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.stats["memory_evictions"] += 1
+
+    def _store_disk(self, key: str, data: bytes) -> None:
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # 書き込み途中のファイルを読まないよう一時ファイルから置き換える
+            fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            Path(tmp_name).replace(path)
+        except OSError as e:
+            print(f"Error writing audio cache: {e}")
+            return
+
+        self._disk[key] = len(data)
+        self._disk_bytes += len(data)
+        # 書き込んだばかりのエントリは上限を超えていても残す
+        self._trim_disk(keep=1)
+
+    def _trim_disk(self, keep: int = 0) -> None:
+        """ディスクキャッシュが上限を超えている間、古いエントリから削除"""
+        if self.max_disk_bytes is None:
+            return
+        while self._disk_bytes > self.max_disk_bytes and len(self._disk) > keep:
+            evicted = next(iter(self._disk))
+            self._disk_path(evicted).unlink(missing_ok=True)
+            self._forget_disk(evicted)
+            self.stats["disk_evictions"] += 1
+
+    def _forget_disk(self, key: str) -> None:
+        self._disk_bytes -= self._disk.pop(key, 0)
+
+    def _disk_path(self, key: str) -> Path:
+        cache_dir = self.cache_dir
+        assert cache_dir is not None
+        return cache_dir / key[:2] / f"{key}.wav"
+
+    def _scan_disk(self, cache_dir: Path) -> None:
+        """既存のディスクキャッシュを古い順に登録し、上限を超える分を削除
+
+        書き込み途中で終了した一時ファイルもここで削除する。
+        """
+        for path in cache_dir.glob("*/*.tmp"):
+            path.unlink(missing_ok=True)
+        entries = []
+        for path in cache_dir.glob("*/*.wav"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._trim_disk()
+
+
+class AudioQueryCache:
+    """VOICEVOXの音声クエリのキャッシュ
+
+    話速・音量などのスケールはアクセント句の解析結果に影響しないため、
+    テキストと話者IDが同じであれば取得済みのクエリを再利用できる。
+    スケールは取り出した側で設定し直す前提で、呼び出しごとに複製を返す。
+    """
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        """
+        Args:
+            max_entries: 保持する最大クエリ数
+        """
+        self.max_entries = max_entries
+        self._queries: OrderedDict[tuple[str, int], dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+        }
+
+    def get(self, text: str, speaker_id: int) -> dict | None:
+        """キャッシュから音声クエリを取得
+
+        Args:
+            text: 合成するテキスト
+            speaker_id: 話者ID
+
+        Returns:
+            音声クエリの複製(キャッシュにない場合はNone)
+        """
+        key = (normalize_text(text), speaker_id)
+        with self._lock:
+            query = self._queries.get(key)
+            if query is None:
+                self.stats["misses"] += 1
+                return None
+            self._queries.move_to_end(key)
+            self.stats["hits"] += 1
+        return copy.deepcopy(query)
+
+    def put(self, text: str, speaker_id: int, query: dict) -> None:
+        """音声クエリをキャッシュに保存
+
+        Args:
+            text: 合成するテキスト
+            speaker_id: 話者ID
+            query: エンジンから取得した音声クエリ
+        """
+        key = (normalize_text(text), speaker_id)
+        query = copy.deepcopy(query)
+        with self._lock:
+            self._queries[key] = query
+            self._queries.move_to_end(key)
+            while len(self._queries) > self.max_entries:
+                self._queries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        """キャッシュを削除"""
+        with self._lock:
+            self._queries.clear()
+
+    def __len__(self) -> int:
+        return len(self._queries)
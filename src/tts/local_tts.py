@@ -3,12 +3,26 @@
 VOICEVOXを使用した音声合成を担当
 """
 
+import asyncio
+import io
+import itertools
 import json
+import threading
+import time
+import zipfile
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional, Union
+from typing import Optional, TypeVar, Union
 
+import httpx
 import requests
 from pydantic import BaseModel, Field
+from requests.adapters import HTTPAdapter
+
+from src.tts.audio_cache import AudioCache, AudioQueryCache
+
+T = TypeVar("T")
 
 
 class VoiceConfig(BaseModel):
@@ -21,23 +35,121 @@ class VoiceConfig(BaseModel):
     intonation_scale: float = Field(default=1.0, description="イントネーション")
 
 
+class EngineConfig(BaseModel):
+    """VOICEVOXエンジン1つ分の設定"""
+
+    host: str = Field(default="127.0.0.1", description="VOICEVOXエンジンのホスト")
+    port: int = Field(default=50021, description="VOICEVOXエンジンのポート")
+
+
+class EnginePoolConfig(BaseModel):
+    """複数のVOICEVOXエンジンへの振り分けの設定"""
+
+    engines: list[EngineConfig] = Field(
+        default_factory=list, description="VOICEVOXエンジンの一覧(空の場合はhost/portのみを使う)"
+    )
+    max_failures: int = Field(default=2, description="連続して失敗した場合に切り離す回数")
+    health_check_interval: float = Field(
+        default=10.0, description="ヘルスチェックの間隔(秒、0で無効)"
+    )
+    health_check_timeout: float = Field(default=2.0, description="ヘルスチェックのタイムアウト(秒)")
+    affinity_slack: int = Field(
+        default=0,
+        description="話者を合成済みのエンジンを優先する、処理中のリクエスト数の差の上限",
+    )
+
+
+@dataclass(eq=False)
+class _Engine:
+    """VOICEVOXエンジン1つ分の状態"""
+
+    base_url: str
+    outstanding: int = 0
+    healthy: bool = True
+    failures: int = 0
+    last_used: int = 0
+    speakers: set[int] = field(default_factory=set)
+    stats: dict = field(
+        default_factory=lambda: {"requests": 0, "failures": 0, "ejections": 0, "readmissions": 0}
+    )
+
+
+def _is_retryable(error: Exception) -> bool:
+    """別のエンジンで再試行すべき失敗か(接続エラー・タイムアウト・5xx)"""
+    if isinstance(error, requests.HTTPError | httpx.HTTPStatusError):
+        return error.response is not None and error.response.status_code >= 500
+    return isinstance(error, requests.ConnectionError | requests.Timeout | httpx.TransportError)
+
+
+@dataclass
+class SynthesisResult:
+    """一括音声合成の1区間分の結果"""
+
+    text: str
+    audio_data: bytes
+    query_time: float = 0.0
+    synthesis_time: float = 0.0
+    cached: bool = False
+
+
 class LocalTTS:
-    """ローカル音声合成システムのメインクラス"""
+    """ローカル音声合成システムのメインクラス
+
+    VOICEVOXエンジンへの接続はKeep-Aliveで使い回す。
+    同期APIは `requests.Session`、非同期APIは `httpx.AsyncClient` の接続プールを使用する。
+
+    複数のエンジンを指定した場合は、処理中のリクエストが最も少ないエンジンに振り分ける
+    (同数の場合は同じ話者を合成済みのエンジンを優先する)。接続エラーや5xxの場合は
+    別のエンジンで再試行し、連続して失敗したエンジンはヘルスチェックに成功するまで切り離す。
+    """
 
     def __init__(
         self,
         host: str = "127.0.0.1",
         port: int = 50021,
         voice_config: VoiceConfig | None = None,
+        cache: AudioCache | None = None,
+        query_cache: AudioQueryCache | None = None,
+        timeout: float = 30.0,
+        max_connections: int = 8,
+        max_concurrency: int = 4,
+        engine_pool: EnginePoolConfig | None = None,
     ) -> None:
         """
         Args:
             host: VOICEVOXエンジンのホスト
             port: VOICEVOXエンジンのポート
             voice_config: 音声設定
+            cache: 合成済み音声のキャッシュ(Noneの場合はキャッシュしない)
+            query_cache: 音声クエリのキャッシュ(Noneの場合はキャッシュしない)
+            timeout: 音声クエリ・音声合成リクエストのタイムアウト(秒)
+            max_connections: 接続プールに保持する最大接続数
+            max_concurrency: 非同期APIで同時に合成する最大数
+            engine_pool: 複数のVOICEVOXエンジンへの振り分け設定(指定した場合はhost/portより優先)
         """
-        self.base_url = f"http://{host}:{port}"
+        self.engine_pool = engine_pool or EnginePoolConfig()
+        engines = self.engine_pool.engines or [EngineConfig(host=host, port=port)]
+        self._engines = [_Engine(f"http://{e.host}:{e.port}") for e in engines]
+        self._engine_lock = threading.Lock()
+        self._engine_sequence = itertools.count(1)
+        self._health_thread: threading.Thread | None = None
+        self._health_stop = threading.Event()
+        self.base_url = self._engines[0].base_url
         self.voice_config = voice_config or VoiceConfig()
+        self.cache = cache
+        self.query_cache = query_cache
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self._engines), pool_maxsize=max_connections)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+        # 非同期クライアントは使用するイベントループ上で遅延生成する
+        self._async_client: httpx.AsyncClient | None = None
+        self._semaphore: asyncio.Semaphore | None = None
 
     def text_to_speech(self, text: str, output_path: str | None = None) -> bytes | str:
         """テキストを音声に変換
@@ -49,51 +161,326 @@ class LocalTTS:
         Returns:
             音声データ(バイナリ)または出力ファイルパス
         """
-        # 音声クエリの生成
-        query_response = requests.post(
-            f"{self.base_url}/audio_query",
-            params={
-                "text": text,
-                "speaker": self.voice_config.speaker_id,
-            },
-            timeout=30.0,
-        )
-        query_response.raise_for_status()
-        audio_query = query_response.json()
+        cache_key, audio_data = self._lookup_cache(text)
+        if audio_data is None:
+            audio_data = self._synthesize(text)
+            self._store_cache(cache_key, audio_data)
+
+        # 出力ファイルが指定されている場合は保存
+        if output_path:
+            with Path(output_path).open("wb") as f:
+                f.write(audio_data)
+            return output_path
+
+        return audio_data
+
+    async def text_to_speech_async(self, text: str) -> bytes:
+        """テキストを音声に変換(非同期版)
+
+        同時に実行される合成の数は `max_concurrency` までに制限される。
+
+        Args:
+            text: 変換するテキスト
+
+        Returns:
+            音声データ(バイナリ)
+        """
+        cache_key, audio_data = await self._lookup_cache_async(text)
+        if audio_data is None:
+            async with self._get_semaphore():
+                audio_data = await self._synthesize_async(text)
+            await self._store_cache_async(cache_key, audio_data)
+        return audio_data
+
+    async def text_to_speech_with_query_async(self, text: str) -> tuple[bytes, dict]:
+        """テキストを音声に変換し、合成に使った音声クエリとともに返す
+
+        音声クエリはリップシンクの生成などに再利用できる。
+
+        Args:
+            text: 変換するテキスト
+
+        Returns:
+            音声データ(バイナリ)と音声設定を反映した音声クエリ
+        """
+        cache_key, audio_data = await self._lookup_cache_async(text)
+        synthesized = False
+        async with self._get_semaphore():
+            audio_query = await self.get_audio_query_async(text)
+            if audio_data is None:
+                audio_data, _ = await self._synthesis_async(json.dumps(audio_query))
+                synthesized = True
+        if synthesized:
+            await self._store_cache_async(cache_key, audio_data)
+        return audio_data, audio_query
+
+    async def text_to_speech_batch(
+        self, texts: list[str], use_multi_synthesis: bool = True
+    ) -> list[SynthesisResult]:
+        """複数のテキストをまとめて音声に変換
+
+        音声クエリは並行して取得し、音声合成は `/multi_synthesis` の1往復で行う。
+        エンジンが `/multi_synthesis` に対応していない場合や、複数のエンジンに振り分けられる
+        場合は `/synthesis` を並行実行する。
+        `/multi_synthesis` 使用時の `synthesis_time` は一括合成全体の所要時間になる。
+
+        Args:
+            texts: 変換するテキストのリスト
+            use_multi_synthesis: `/multi_synthesis` を使用するかどうか
+
+        Returns:
+            入力と同じ順序の合成結果のリスト
+        """
+        results: list[SynthesisResult | None] = [None] * len(texts)
+        cache_keys: list[str | None] = [None] * len(texts)
+        missing: list[int] = []
+        for i, text in enumerate(texts):
+            cache_keys[i], audio_data = await self._lookup_cache_async(text)
+            if audio_data is None:
+                missing.append(i)
+            else:
+                results[i] = SynthesisResult(text=text, audio_data=audio_data, cached=True)
+
+        if missing:
+            timed_queries = await asyncio.gather(
+                *(self._timed_audio_query_async(texts[i]) for i in missing)
+            )
+            queries = [json.dumps(query) for query, _ in timed_queries]
+
+            audio_list: list[bytes] | None = None
+            synthesis_times: list[float] = []
+            if use_multi_synthesis and len(missing) > 1 and self._healthy_engine_count() == 1:
+                start = time.perf_counter()
+                try:
+                    audio_list = await self._multi_synthesis_async(queries)
+                except (httpx.HTTPStatusError, httpx.TransportError) as e:
+                    print(f"multi_synthesis unavailable, falling back: {e}")
+                else:
+                    synthesis_times = [time.perf_counter() - start] * len(missing)
+
+            if audio_list is None:
+                timed_audio = await asyncio.gather(
+                    *(self._limited(self._synthesis_async(query)) for query in queries)
+                )
+                audio_list = [audio for audio, _ in timed_audio]
+                synthesis_times = [elapsed for _, elapsed in timed_audio]
+
+            for j, i in enumerate(missing):
+                results[i] = SynthesisResult(
+                    text=texts[i],
+                    audio_data=audio_list[j],
+                    query_time=timed_queries[j][1],
+                    synthesis_time=synthesis_times[j],
+                )
+                await self._store_cache_async(cache_keys[i], audio_list[j])
+
+        return [result for result in results if result is not None]
 
+    def get_audio_query(self, text: str) -> dict:
+        """音声設定を反映した音声クエリを取得
+
+        音声クエリのキャッシュがある場合は `/audio_query` を呼ばずに再利用する。
+
+        Args:
+            text: 合成するテキスト
+
+        Returns:
+            音声クエリ
+        """
+        audio_query = self._cached_audio_query(text)
+        if audio_query is None:
+            query_response = self._send(
+                lambda url: self._session.post(
+                    url, params=self._query_params(text), timeout=self.timeout
+                ),
+                "/audio_query",
+                self.voice_config.speaker_id,
+            )
+            audio_query = query_response.json()
+            self._store_audio_query(text, audio_query)
+        return self._apply_voice_config(audio_query)
+
+    async def get_audio_query_async(self, text: str) -> dict:
+        """音声設定を反映した音声クエリを取得(非同期版)
+
+        Args:
+            text: 合成するテキスト
+
+        Returns:
+            音声クエリ
+        """
+        audio_query = self._cached_audio_query(text)
+        if audio_query is None:
+            client = self._get_async_client()
+            query_response = await self._send_async(
+                lambda url: client.post(url, params=self._query_params(text)),
+                "/audio_query",
+                self.voice_config.speaker_id,
+            )
+            audio_query = query_response.json()
+            self._store_audio_query(text, audio_query)
+        return self._apply_voice_config(audio_query)
+
+    def close(self) -> None:
+        """同期APIの接続プールを閉じる"""
+        self._session.close()
+
+    async def aclose(self) -> None:
+        """同期・非同期APIの接続プールを閉じる"""
+        self.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+            self._semaphore = None
+
+    def _lookup_cache(self, text: str) -> tuple[str | None, bytes | None]:
+        """キャッシュキーとキャッシュ済み音声を取得"""
+        if self.cache is None:
+            return None, None
+        cache_key = self.cache.make_key(text, self.voice_config)
+        return cache_key, self.cache.get(cache_key)
+
+    def _store_cache(self, cache_key: str | None, audio_data: bytes) -> None:
+        if cache_key is not None and self.cache is not None:
+            self.cache.put(cache_key, audio_data)
+
+    async def _lookup_cache_async(self, text: str) -> tuple[str | None, bytes | None]:
+        """キャッシュキーとキャッシュ済み音声を取得(ディスク層の読み込みはスレッドで行う)"""
+        if self.cache is None or self.cache.cache_dir is None:
+            return self._lookup_cache(text)
+        return await asyncio.to_thread(self._lookup_cache, text)
+
+    async def _store_cache_async(self, cache_key: str | None, audio_data: bytes) -> None:
+        """音声をキャッシュに保存(ディスク層への書き込みはスレッドで行う)"""
+        if self.cache is None or self.cache.cache_dir is None:
+            self._store_cache(cache_key, audio_data)
+        else:
+            await asyncio.to_thread(self._store_cache, cache_key, audio_data)
+
+    def _query_params(self, text: str) -> dict:
+        return {"text": text, "speaker": self.voice_config.speaker_id}
+
+    def _cached_audio_query(self, text: str) -> dict | None:
+        if self.query_cache is None:
+            return None
+        return self.query_cache.get(text, self.voice_config.speaker_id)
+
+    def _store_audio_query(self, text: str, audio_query: dict) -> None:
+        if self.query_cache is not None:
+            self.query_cache.put(text, self.voice_config.speaker_id, audio_query)
+
+    def _apply_voice_config(self, audio_query: dict) -> dict:
+        """音声クエリに音声設定を反映"""
         # 音声合成パラメータの設定
         audio_query["speedScale"] = self.voice_config.speed_scale
         audio_query["volumeScale"] = self.voice_config.volume_scale
         audio_query["pitchScale"] = self.voice_config.pitch_scale
         audio_query["intonationScale"] = self.voice_config.intonation_scale
+        return audio_query
+
+    def _synthesize(self, text: str) -> bytes:
+        """VOICEVOXエンジンで音声を合成"""
+        # 音声クエリの生成
+        audio_query = self.get_audio_query(text)
 
         # 音声合成
-        synthesis_response = requests.post(
-            f"{self.base_url}/synthesis",
-            params={"speaker": self.voice_config.speaker_id},
-            data=json.dumps(audio_query),
-            headers={"Content-Type": "application/json"},
-            timeout=30.0,
+        speaker = self.voice_config.speaker_id
+        synthesis_response = self._send(
+            lambda url: self._session.post(
+                url,
+                params={"speaker": speaker},
+                data=json.dumps(audio_query),
+                headers={"Content-Type": "application/json"},
+                timeout=self.timeout,
+            ),
+            "/synthesis",
+            speaker,
         )
-        synthesis_response.raise_for_status()
-        audio_data = synthesis_response.content
-
-        # 出力ファイルが指定されている場合は保存
-        if output_path:
-            with Path(output_path).open("wb") as f:
-                f.write(audio_data)
-            return output_path
+        return synthesis_response.content
 
+    async def _synthesize_async(self, text: str) -> bytes:
+        """VOICEVOXエンジンで音声を合成(非同期版)"""
+        audio_query = await self.get_audio_query_async(text)
+        audio_data, _ = await self._synthesis_async(json.dumps(audio_query))
         return audio_data
 
+    async def _timed_audio_query_async(self, text: str) -> tuple[dict, float]:
+        """同時実行数の上限内で音声クエリを取得して所要時間とともに返す"""
+        async with self._get_semaphore():
+            start = time.perf_counter()
+            audio_query = await self.get_audio_query_async(text)
+            return audio_query, time.perf_counter() - start
+
+    async def _synthesis_async(self, audio_query: str) -> tuple[bytes, float]:
+        """音声クエリから音声を合成して所要時間とともに返す"""
+        client = self._get_async_client()
+        speaker = self.voice_config.speaker_id
+        start = time.perf_counter()
+        synthesis_response = await self._send_async(
+            lambda url: client.post(
+                url,
+                params={"speaker": speaker},
+                content=audio_query,
+                headers={"Content-Type": "application/json"},
+            ),
+            "/synthesis",
+            speaker,
+        )
+        return synthesis_response.content, time.perf_counter() - start
+
+    async def _multi_synthesis_async(self, audio_queries: list[str]) -> list[bytes]:
+        """複数の音声クエリを1回のリクエストで合成"""
+        client = self._get_async_client()
+        speaker = self.voice_config.speaker_id
+        response = await self._send_async(
+            lambda url: client.post(
+                url,
+                params={"speaker": speaker},
+                content="[" + ",".join(audio_queries) + "]",
+                headers={"Content-Type": "application/json"},
+            ),
+            "/multi_synthesis",
+            speaker,
+        )
+
+        # 応答はクエリ順に連番が振られたWAVファイルのZIPアーカイブ
+        with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+            names = sorted(archive.namelist())
+            if len(names) != len(audio_queries):
+                raise ValueError(
+                    f"multi_synthesis returned {len(names)} files for {len(audio_queries)} queries"
+                )
+            return [archive.read(name) for name in names]
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            # エンジンごとに宛先が変わるため、リクエストは絶対URLで送る
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._async_client
+
+    async def _limited(self, coroutine: Awaitable[T]) -> T:
+        """同時実行数の上限内でコルーチンを実行"""
+        async with self._get_semaphore():
+            return await coroutine
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
     def get_speakers(self) -> dict:
         """利用可能な話者の一覧を取得
 
         Returns:
             話者情報を含む辞書
         """
-        response = requests.get(f"{self.base_url}/speakers", timeout=10.0)
-        response.raise_for_status()
+        response = self._send(lambda url: self._session.get(url, timeout=10.0), "/speakers")
         return response.json()
 
     def get_version(self) -> str:
@@ -103,8 +490,7 @@ class LocalTTS:
             バージョン文字列
         """
         try:
-            response = requests.get(f"{self.base_url}/version", timeout=10.0)
-            response.raise_for_status()
+            response = self._send(lambda url: self._session.get(url, timeout=10.0), "/version")
             result = response.json()
             if isinstance(result, dict):
                 return result.get("version", "unknown")
@@ -112,3 +498,164 @@ class LocalTTS:
                 return str(result)
         except Exception:
             return "unknown"
+
+    def check_health(self) -> None:
+        """全エンジンのバージョン取得によるヘルスチェックを行い、切り離しと復帰を反映"""
+        for engine in self._engines:
+            try:
+                response = self._session.get(
+                    f"{engine.base_url}/version", timeout=self.engine_pool.health_check_timeout
+                )
+                response.raise_for_status()
+                ok = True
+            except requests.RequestException:
+                ok = False
+            with self._engine_lock:
+                if ok:
+                    engine.failures = 0
+                    self._readmit(engine)
+                elif engine.healthy:
+                    self._eject(engine)
+
+    def start_health_checks(self) -> None:
+        """定期的なヘルスチェックを開始(エンジンが1つの場合は行わない)"""
+        if len(self._engines) < 2 or self.engine_pool.health_check_interval <= 0:
+            return
+        if self._health_thread is not None and self._health_thread.is_alive():
+            return
+        self._health_stop.clear()
+        self._health_thread = threading.Thread(
+            target=self._health_loop, name="tts-health-check", daemon=True
+        )
+        self._health_thread.start()
+
+    def stop_health_checks(self) -> None:
+        """定期的なヘルスチェックを停止"""
+        self._health_stop.set()
+        if self._health_thread is not None:
+            self._health_thread.join(timeout=5.0)
+            self._health_thread = None
+
+    def get_engine_stats(self) -> dict:
+        """エンジンごとの統計を取得
+
+        Returns:
+            エンジンのURLごとのリクエスト数・失敗数・処理中のリクエスト数・状態
+        """
+        with self._engine_lock:
+            return {
+                e.base_url: {**e.stats, "outstanding": e.outstanding, "healthy": e.healthy}
+                for e in self._engines
+            }
+
+    def _health_loop(self) -> None:
+        while not self._health_stop.wait(self.engine_pool.health_check_interval):
+            self.check_health()
+
+    def _healthy_engine_count(self) -> int:
+        with self._engine_lock:
+            return sum(1 for e in self._engines if e.healthy)
+
+    def _acquire_engine(self, speaker: int | None, tried: set[_Engine]) -> _Engine:
+        """処理中のリクエストが最も少ないエンジンを選ぶ
+
+        同数(`affinity_slack` の差まで)であれば話者を合成済みのエンジンを優先する。
+        正常なエンジンが残っていない場合は、切り離したエンジンも試す。
+        """
+        with self._engine_lock:
+            untried = [e for e in self._engines if e not in tried]
+            candidates = [e for e in untried if e.healthy] or untried
+            least = min(e.outstanding for e in candidates)
+            warmed = [
+                e
+                for e in candidates
+                if speaker in e.speakers
+                and e.outstanding <= least + self.engine_pool.affinity_slack
+            ]
+            engine = min(warmed or candidates, key=lambda e: (e.outstanding, e.last_used))
+            engine.outstanding += 1
+            engine.last_used = next(self._engine_sequence)
+            engine.stats["requests"] += 1
+            return engine
+
+    def _release_engine(self, engine: _Engine, speaker: int | None, ok: bool | None) -> None:
+        """エンジンの処理中のリクエストを減らし、成否を反映(Noneの場合は成否を問わない)"""
+        with self._engine_lock:
+            engine.outstanding -= 1
+            if ok:
+                engine.failures = 0
+                if speaker is not None:
+                    engine.speakers.add(speaker)
+                self._readmit(engine)
+            elif ok is not None:
+                engine.failures += 1
+                engine.stats["failures"] += 1
+                if engine.healthy and engine.failures >= self.engine_pool.max_failures:
+                    self._eject(engine)
+
+    def _eject(self, engine: _Engine) -> None:
+        """エンジンを切り離す(ロックを取得した状態で呼ぶ)"""
+        engine.healthy = False
+        engine.stats["ejections"] += 1
+        print(f"VOICEVOX engine {engine.base_url} is unavailable and has been ejected")
+
+    def _readmit(self, engine: _Engine) -> None:
+        """切り離したエンジンを戻す(ロックを取得した状態で呼ぶ)"""
+        if not engine.healthy:
+            engine.healthy = True
+            engine.stats["readmissions"] += 1
+            print(f"VOICEVOX engine {engine.base_url} is back online")
+
+    def _send(
+        self,
+        send: Callable[[str], requests.Response],
+        path: str,
+        speaker: int | None = None,
+    ) -> requests.Response:
+        """エンジンを選んでリクエストを送り、接続エラーや5xxの場合は別のエンジンで再試行"""
+        tried: set[_Engine] = set()
+        while True:
+            engine = self._acquire_engine(speaker, tried)
+            ok: bool | None = None
+            try:
+                response = send(f"{engine.base_url}{path}")
+                response.raise_for_status()
+                ok = True
+                return response
+            except Exception as e:
+                if not _is_retryable(e):
+                    raise
+                ok = False
+                tried.add(engine)
+                if len(tried) == len(self._engines):
+                    raise
+                print(f"VOICEVOX engine {engine.base_url} failed, retrying: {e}")
+            finally:
+                self._release_engine(engine, speaker, ok)
+
+    async def _send_async(
+        self,
+        send: Callable[[str], Awaitable[httpx.Response]],
+        path: str,
+        speaker: int | None = None,
+    ) -> httpx.Response:
+        """エンジンを選んでリクエストを送り、接続エラーや5xxの場合は別のエンジンで再試行(非同期版)"""
+        tried: set[_Engine] = set()
+        while True:
+            engine = self._acquire_engine(speaker, tried)
+            ok: bool | None = None
+            try:
+                response = await send(f"{engine.base_url}{path}")
+                response.raise_for_status()
+                ok = True
+                return response
+            except Exception as e:
+                if not _is_retryable(e):
+                    raise
+                ok = False
+                tried.add(engine)
+                if len(tried) == len(self._engines):
+                    raise
+                print(f"VOICEVOX engine {engine.base_url} failed, retrying: {e}")
+            finally:
+                self._release_engine(engine, speaker, ok)
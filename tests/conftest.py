@@ -0,0 +1,557 @@
+"""
+テスト共通のフィクスチャ
+外部エンジンを模したローカルのスタブサーバーを提供する
+"""
+
+import asyncio
+import io
+import json
+import math
+import struct
+import threading
+import time
+import wave
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+
+def make_wav(duration: float, sample_rate: int = 24000, frequency: float = 220.0) -> bytes:
+    """正弦波のWAVデータを生成"""
+    n_samples = int(duration * sample_rate)
+    samples = [
+        int(8000 * math.sin(2 * math.pi * frequency * i / sample_rate)) for i in range(n_samples)
+    ]
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(struct.pack(f"<{n_samples}h", *samples))
+    return buffer.getvalue()
+
+
+def make_glb(gltf: dict, binary: bytes = b"") -> bytes:
+    """JSONとバイナリからGLB形式のデータを生成"""
+    json_chunk = json.dumps(gltf).encode()
+    json_chunk += b" " * (-len(json_chunk) % 4)
+    binary += b"\0" * (-len(binary) % 4)
+    chunks = struct.pack("<II", len(json_chunk), 0x4E4F534A) + json_chunk
+    if binary:
+        chunks += struct.pack("<II", len(binary), 0x004E4942) + binary
+    return struct.pack("<4sII", b"glTF", 2, 12 + len(chunks)) + chunks
+
+
+def make_audio_query(text: str) -> dict:
+    """VOICEVOXのaudio_query形式の応答を生成(1文字を1モーラとして扱う)"""
+    vowels = "aiueo"
+    moras = [
+        {
+            "text": char,
+            "consonant": "k" if i % 2 else None,
+            "consonant_length": 0.05 if i % 2 else None,
+            "vowel": vowels[i % len(vowels)],
+            "vowel_length": 0.1,
+            "pitch": 5.5,
+        }
+        for i, char in enumerate(text)
+    ]
+    return {
+        "accent_phrases": [{"moras": moras, "accent": 1, "pause_mora": None}],
+        "speedScale": 1.0,
+        "pitchScale": 0.0,
+        "intonationScale": 1.0,
+        "volumeScale": 1.0,
+        "prePhonemeLength": 0.1,
+        "postPhonemeLength": 0.1,
+        "outputSamplingRate": 24000,
+        "outputStereo": False,
+        "kana": text,
+    }
+
+
+class StubVoicevoxEngine:
+    """VOICEVOXエンジンのHTTP APIを模したスタブサーバー"""
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.healthy = True
+        # 未対応として404を返すパス(古いエンジンの再現用)
+        self.unsupported: set[str] = set()
+        self.connections = 0
+        self.requests: list[str] = []
+        self.queries: list[dict] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self.host, self.port = self._server.server_address
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> "StubVoicevoxEngine":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, path: str) -> int:
+        with self._lock:
+            return sum(1 for request in self.requests if request == path)
+
+    def _make_handler(self) -> type[BaseHTTPRequestHandler]:
+        engine = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self) -> None:
+                super().setup()
+                with engine._lock:
+                    engine.connections += 1
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+            def _send(self, status: int, body: bytes, content_type: str) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _read_body(self) -> bytes:
+                length = int(self.headers.get("Content-Length", 0))
+                return self.rfile.read(length) if length else b""
+
+            def _handle(self) -> None:
+                url = urlparse(self.path)
+                params = parse_qs(url.query)
+                body = self._read_body()
+                with engine._lock:
+                    engine.requests.append(url.path)
+
+                if not engine.healthy:
+                    self._send(503, b"unavailable", "text/plain")
+                    return
+
+                if url.path in engine.unsupported:
+                    self._send(404, b"not found", "text/plain")
+                elif url.path == "/version":
+                    self._send(200, b'"0.14.4"', "application/json")
+                elif url.path == "/speakers":
+                    speakers = [{"name": "stub", "speaker_uuid": "stub", "styles": []}]
+                    self._send(200, json.dumps(speakers).encode(), "application/json")
+                elif url.path == "/audio_query":
+                    time.sleep(engine.delay)
+                    query = make_audio_query(params["text"][0])
+                    self._send(200, json.dumps(query).encode(), "application/json")
+                elif url.path == "/synthesis":
+                    time.sleep(engine.delay)
+                    query = json.loads(body)
+                    with engine._lock:
+                        engine.queries.append(query)
+                    self._send(200, self._synthesize(query), "audio/wav")
+                elif url.path == "/multi_synthesis":
+                    time.sleep(engine.delay)
+                    queries = json.loads(body)
+                    archive = io.BytesIO()
+                    with zipfile.ZipFile(archive, "w") as zf:
+                        for i, query in enumerate(queries):
+                            zf.writestr(f"{i + 1:03d}.wav", self._synthesize(query))
+                    self._send(200, archive.getvalue(), "application/zip")
+                else:
+                    self._send(404, b"not found", "text/plain")
+
+            def _synthesize(self, query: dict) -> bytes:
+                moras = [m for phrase in query["accent_phrases"] for m in phrase["moras"]]
+                duration = sum(m["vowel_length"] + (m["consonant_length"] or 0) for m in moras)
+                return make_wav(duration / query.get("speedScale", 1.0))
+
+            def do_GET(self) -> None:
+                self._handle()
+
+            def do_POST(self) -> None:
+                self._handle()
+
+        return Handler
+
+
+@pytest.fixture
+def voicevox_engine():
+    """起動済みのスタブVOICEVOXエンジン"""
+    engine = StubVoicevoxEngine().start()
+    yield engine
+    engine.stop()
+
+
+@pytest.fixture
+def voicevox_engines():
+    """起動済みのスタブVOICEVOXエンジン3つ"""
+    engines = [StubVoicevoxEngine().start() for _ in range(3)]
+    yield engines
+    for engine in engines:
+        engine.stop()
+
+
+def parse_keep_alive(value: float | str | None) -> float:
+    """Ollamaのkeep_aliveを秒に変換(負の値は無期限)"""
+    if value is None:
+        return 300.0
+    if isinstance(value, int | float):
+        return math.inf if value < 0 else float(value)
+    units = {"s": 1.0, "m": 60.0, "h": 3600.0}
+    seconds = float(value[:-1]) * units[value[-1]] if value[-1] in units else float(value)
+    return math.inf if seconds < 0 else seconds
+
+
+class StubOllamaServer:
+    """OllamaのHTTP APIを模したスタブサーバー
+
+    モデルは最初の呼び出しで `load_delay` 秒かけて読み込まれ、
+    最後の呼び出しから `keep_alive` の期間が過ぎると破棄される。
+    チャットの最初のトークンは `first_token_delay` 秒後に返し、
+    `healthy` をFalseにすると全てのリクエストに503を返す。
+    `chat_status` を設定するとチャットにそのステータスを返す。
+    """
+
+    def __init__(
+        self, load_delay: float = 0.2, first_token_delay: float = 0.0, reply_prefix: str = ""
+    ) -> None:
+        self.load_delay = load_delay
+        self.first_token_delay = first_token_delay
+        self.reply_prefix = reply_prefix
+        self.healthy = True
+        self.chat_status: int | None = None
+        self.loads = 0
+        self.active = 0
+        self.max_active = 0
+        self.requests: list[tuple[str, dict]] = []
+        self._loaded_until: float | None = None
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self.host, self.port = self._server.server_address
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def is_loaded(self) -> bool:
+        with self._lock:
+            return self._loaded_until is not None and self._loaded_until > time.monotonic()
+
+    def unload(self) -> None:
+        """keep_aliveの期限切れと同じ状態にする"""
+        with self._lock:
+            self._loaded_until = None
+
+    def start(self) -> "StubOllamaServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def bodies(self, path: str) -> list[dict]:
+        with self._lock:
+            return [body for request_path, body in self.requests if request_path == path]
+
+    def _load(self, keep_alive: float | str | None) -> int:
+        """モデルを読み込み、読み込みにかかった時間(ナノ秒)を返す"""
+        with self._lock:
+            cold = self._loaded_until is None or self._loaded_until <= time.monotonic()
+            if cold:
+                self.loads += 1
+        if cold:
+            time.sleep(self.load_delay)
+        with self._lock:
+            self._loaded_until = time.monotonic() + parse_keep_alive(keep_alive)
+        return int((self.load_delay if cold else 0.001) * 1e9)
+
+    def _make_handler(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+            def _send_json(self, body: dict) -> None:
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, chunks: list[dict]) -> None:
+                data = b"".join(json.dumps(chunk).encode() + b"\n" for chunk in chunks)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_status(self, status: int) -> None:
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self) -> None:
+                path = urlparse(self.path).path
+                if not server.healthy:
+                    self._send_status(503)
+                elif path == "/api/tags":
+                    self._send_json({"models": []})
+                else:
+                    self._send_status(404)
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                path = urlparse(self.path).path
+                with server._lock:
+                    server.requests.append((path, body))
+                if not server.healthy:
+                    self._send_status(503)
+                    return
+                with server._lock:
+                    server.active += 1
+                    server.max_active = max(server.max_active, server.active)
+                try:
+                    self._handle(path, body)
+                finally:
+                    with server._lock:
+                        server.active -= 1
+
+            def _handle(self, path: str, body: dict) -> None:
+                common = {"model": body.get("model", ""), "created_at": "2024-01-01T00:00:00Z"}
+                if path == "/api/show":
+                    self._send_json({"modelfile": "", "parameters": "", "template": ""})
+                    return
+                if path == "/api/chat" and server.chat_status is not None:
+                    self._send_status(server.chat_status)
+                    return
+
+                load_duration = server._load(body.get("keep_alive"))
+                done = {**common, "done": True, "load_duration": load_duration}
+                if path == "/api/generate":
+                    prompt = body.get("prompt") or ""
+                    reason = "stop" if prompt else "load"
+                    self._send_json(
+                        {**done, "response": "stub" if prompt else "", "done_reason": reason}
+                    )
+                elif path == "/api/chat":
+                    user = [m["content"] for m in body["messages"] if m["role"] == "user"]
+                    content = f"{server.reply_prefix}応答:{user[-1] if user else ''}"
+                    time.sleep(server.first_token_delay)
+                    if body.get("stream", True):
+                        tokens = [content[:3], content[3:]]
+                        chunks = [
+                            {
+                                **common,
+                                "done": False,
+                                "message": {"role": "assistant", "content": t},
+                            }
+                            for t in tokens
+                        ]
+                        chunks.append({**done, "message": {"role": "assistant", "content": ""}})
+                        self._send_stream(chunks)
+                    else:
+                        self._send_json(
+                            {**done, "message": {"role": "assistant", "content": content}}
+                        )
+                else:
+                    self._send_status(404)
+
+        return Handler
+
+
+@pytest.fixture
+def ollama_server():
+    """起動済みのスタブOllamaサーバー"""
+    server = StubOllamaServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def ollama_server_factory():
+    """スタブOllamaサーバーを必要な台数だけ起動する関数"""
+    servers: list[StubOllamaServer] = []
+
+    def create(**kwargs: float | str) -> StubOllamaServer:
+        server = StubOllamaServer(**kwargs).start()
+        servers.append(server)
+        return server
+
+    yield create
+    for server in servers:
+        server.stop()
+
+
+class FakeIrcServer:
+    """Twitchのチャット(IRC)サーバーを模したasyncioのスタブサーバー
+
+    接続ごとにログインの行を受け取ってから `sessions` の先頭の行をまとめて送り、
+    以降はクライアントからの行を記録する。Noneの行を送る時点で接続を切断する。
+    """
+
+    def __init__(self) -> None:
+        self.sessions: list[list[str | None]] = []
+        self.received: list[str] = []
+        self.connections = 0
+        self._server: asyncio.Server | None = None
+        self._writers: list[asyncio.StreamWriter] = []
+
+    async def start(self) -> "FakeIrcServer":
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.host, self.port = self._server.sockets[0].getsockname()[:2]
+        return self
+
+    async def stop(self) -> None:
+        for writer in self._writers:
+            writer.close()
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def wait_for(self, line: str, timeout: float = 5.0) -> None:
+        """クライアントから指定の行を受け取るまで待つ"""
+        deadline = time.monotonic() + timeout
+        while line not in self.received:
+            assert time.monotonic() < deadline, f"{line!r} was not received"
+            await asyncio.sleep(0.01)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        self._writers.append(writer)
+        session = self.sessions.pop(0) if self.sessions else []
+        try:
+            while True:
+                line = (await reader.readline()).decode().rstrip("\r\n")
+                if not line:
+                    return
+                self.received.append(line)
+                if line.startswith("JOIN"):
+                    break
+            writer.write(b":tmi.twitch.tv 001 viewer :Welcome, GLHF!\r\n")
+            for line in session:
+                if line is None:
+                    await writer.drain()
+                    writer.close()
+                    return
+                writer.write(f"{line}\r\n".encode())
+            await writer.drain()
+            while line := (await reader.readline()).decode():
+                self.received.append(line.rstrip("\r\n"))
+        except ConnectionError:
+            pass
+
+
+@pytest.fixture
+async def irc_server():
+    """起動済みのスタブIRCサーバー"""
+    server = await FakeIrcServer().start()
+    yield server
+    await server.stop()
+
+
+class FakeOBSServer:
+    """obs-websocket v5を模したスタブサーバー
+
+    パスワードを指定した場合は認証を求め、リクエストには成功を返す。
+    受け取ったリクエストと一括リクエストを記録する。
+    `junk` に入れたフレームはリクエストへの応答の前に送る。
+    """
+
+    def __init__(self, password: str | None = None) -> None:
+        self.password = password
+        self.connections = 0
+        self.requests: list[tuple[str, dict]] = []
+        self.batches: list[list[tuple[str, dict]]] = []
+        self.junk: list[str] = []
+        self._server = None
+        self._clients: set = set()
+
+    async def start(self) -> "FakeOBSServer":
+        import websockets
+
+        self._server = await websockets.serve(self._handle, "127.0.0.1", 0)
+        self.host, self.port = next(iter(self._server.sockets)).getsockname()[:2]
+        return self
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def drop(self) -> None:
+        """接続中のクライアントを切断する"""
+        for client in list(self._clients):
+            await client.close()
+
+    async def _handle(self, ws: object) -> None:
+        from src.stream.obs_websocket import make_authentication
+
+        hello = {"obsWebSocketVersion": "5.0.0", "rpcVersion": 1}
+        if self.password is not None:
+            hello["authentication"] = {"challenge": "challenge", "salt": "salt"}
+        await ws.send(json.dumps({"op": 0, "d": hello}))
+        identify = json.loads(await ws.recv())["d"]
+        if self.password is not None and identify.get("authentication") != make_authentication(
+            self.password, "salt", "challenge"
+        ):
+            await ws.close(4009, "Authentication failed.")
+            return
+        await ws.send(json.dumps({"op": 2, "d": {"negotiatedRpcVersion": 1}}))
+        self.connections += 1
+        self._clients.add(ws)
+        try:
+            async for raw in ws:
+                message = json.loads(raw)
+                data = message["d"]
+                if message["op"] == 6:
+                    self.requests.append((data["requestType"], data["requestData"]))
+                    for frame in self.junk:
+                        await ws.send(frame)
+                    await ws.send(json.dumps({"op": 7, "d": self._result(data)}))
+                elif message["op"] == 8:
+                    batch = [(r["requestType"], r.get("requestData", {})) for r in data["requests"]]
+                    self.batches.append(batch)
+                    results = [self._result(r) for r in data["requests"]]
+                    response = {"requestId": data["requestId"], "results": results}
+                    await ws.send(json.dumps({"op": 9, "d": response}))
+        except Exception:
+            pass
+        finally:
+            self._clients.discard(ws)
+
+    @staticmethod
+    def _result(request: dict) -> dict:
+        result = {
+            "requestType": request["requestType"],
+            "requestStatus": {"result": True, "code": 100},
+        }
+        if "requestId" in request:
+            result["requestId"] = request["requestId"]
+        if request["requestType"] == "GetVersion":
+            result["responseData"] = {"obsVersion": "30.0.0", "rpcVersion": 1}
+        return result
+
+
+@pytest.fixture
+async def obs_server():
+    """起動済みのスタブobs-websocketサーバー(パスワードあり)"""
+    server = await FakeOBSServer(password="secret").start()
+    yield server
+    await server.stop()
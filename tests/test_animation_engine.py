@@ -0,0 +1,156 @@
+"""
+アニメーションエンジンのユニットテスト
+"""
+
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from src.avatar.animation_engine import AnimationConfig, AnimationEngine
+from src.avatar.avatar_controller import AvatarController, ExpressionConfig
+from src.avatar.lip_sync_timeline import LipSyncData, LipSyncTimeline
+
+
+class FakeClock:
+    """手動で進める時計"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def engine(clock):
+    avatar = AvatarController("test_assets/test.vrm")
+    config = AnimationConfig(transition_time=1.0, easing="linear")
+    return AnimationEngine(avatar, config, clock=clock)
+
+
+def _weight(engine: AnimationEngine, weights: np.ndarray, name: str) -> float:
+    return float(weights[engine.channel_index[name]])
+
+
+def test_channels_include_visemes(engine):
+    """表情と口形のチャンネルが揃っているテスト"""
+    assert engine.channel_names[:5] == ["happy", "angry", "sad", "relaxed", "surprised"]
+    assert {"aa", "ih", "ou", "ee", "oh"} <= set(engine.channel_names)
+    weights = engine.tick()
+    assert weights.dtype == np.float32
+    assert weights.flags.c_contiguous
+    assert len(weights) == len(engine.channel_names)
+
+
+def test_expression_interpolates(engine, clock):
+    """表情が切り替え時間をかけて目標値に近づくテスト"""
+    engine.set_target(ExpressionConfig(happy=1.0))
+
+    assert _weight(engine, engine.tick(0.0), "happy") == pytest.approx(0.0)
+    assert _weight(engine, engine.tick(0.5), "happy") == pytest.approx(0.5)
+    assert _weight(engine, engine.tick(2.0), "happy") == pytest.approx(1.0)
+
+    # 補間の途中で目標を変えても現在の値から続ける
+    engine.set_target(ExpressionConfig(happy=1.0))
+    clock.now = 0.5
+    engine.set_target({"happy": 0.0}, transition_time=1.0)
+    assert _weight(engine, engine.tick(0.5), "happy") == pytest.approx(0.5)
+    assert _weight(engine, engine.tick(1.5), "happy") == pytest.approx(0.0)
+
+
+def test_easing_curve(clock):
+    """イージングによって補間の途中の値が変わるテスト"""
+    avatar = AvatarController("test_assets/test.vrm")
+    engine = AnimationEngine(
+        avatar, AnimationConfig(transition_time=1.0, easing="ease_in_out"), clock=clock
+    )
+    engine.set_target({"happy": 1.0})
+    assert _weight(engine, engine.tick(0.25), "happy") == pytest.approx(0.15625)
+    assert _weight(engine, engine.tick(0.5), "happy") == pytest.approx(0.5)
+
+
+def test_viseme_overlay(engine, clock):
+    """再生中のリップシンクの口形が重ねられるテスト"""
+    timeline = LipSyncTimeline.from_lip_sync_data(
+        [
+            LipSyncData("a", 0.0, 0.1, 0.8),
+            LipSyncData("n", 0.1, 0.2, 1.0),
+            LipSyncData("o", 0.2, 0.3, 0.6),
+        ]
+    )
+    clock.now = 10.0
+    engine.play_lip_sync(timeline)
+
+    weights = engine.tick(10.05)
+    assert _weight(engine, weights, "aa") == pytest.approx(0.8)
+    assert _weight(engine, weights, "oh") == pytest.approx(0.0)
+
+    weights = engine.tick(10.15)
+    for name in ("aa", "ih", "ou", "ee", "oh"):
+        assert _weight(engine, weights, name) == pytest.approx(0.0)
+
+    weights = engine.tick(10.25)
+    assert _weight(engine, weights, "oh") == pytest.approx(0.6)
+
+    # 再生が終わると口形の上書きをやめる
+    engine.tick(10.5)
+    assert engine.lip_sync_end is None
+
+
+def test_lip_sync_chunks_play_back_to_back(engine, clock):
+    """続けて再生したリップシンクが前のものの終了後に始まるテスト"""
+    first = LipSyncTimeline.from_lip_sync_data([LipSyncData("a", 0.0, 0.3, 0.8)])
+    second = LipSyncTimeline.from_lip_sync_data([LipSyncData("o", 0.0, 0.2, 0.6)])
+    clock.now = 10.0
+    assert engine.play_lip_sync(first) == pytest.approx(10.0)
+    clock.now = 10.01
+    assert engine.play_lip_sync(second) == pytest.approx(10.3)
+    assert engine.lip_sync_end == pytest.approx(10.5)
+
+    # 後のチャンクが届いても前のチャンクの口形を打ち切らない
+    weights = engine.tick(10.2)
+    assert _weight(engine, weights, "aa") == pytest.approx(0.8)
+    assert _weight(engine, weights, "oh") == pytest.approx(0.0)
+
+    weights = engine.tick(10.35)
+    assert _weight(engine, weights, "aa") == pytest.approx(0.0)
+    assert _weight(engine, weights, "oh") == pytest.approx(0.6)
+
+    engine.tick(10.6)
+    assert engine.lip_sync_end is None
+    # 再生が終わった後は現在時刻から始める
+    clock.now = 11.0
+    assert engine.play_lip_sync(first) == pytest.approx(11.0)
+
+
+@pytest.mark.asyncio
+async def test_run_loop_reports_missed_deadlines():
+    """更新ループが一定周期で動作し、遅れた周期を記録するテスト"""
+    avatar = AvatarController("test_assets/test.vrm")
+    frames = []
+    engine = AnimationEngine(
+        avatar,
+        AnimationConfig(tick_rate=100.0),
+        on_frame=lambda weights: frames.append(weights.copy()),
+    )
+    await engine.start()
+    await asyncio.sleep(0.2)
+
+    # イベントループを止めて周期に間に合わない状態を作る
+    time.sleep(0.1)
+    await asyncio.sleep(0.05)
+    await engine.stop()
+
+    stats = engine.get_stats()
+    assert not engine.is_running
+    assert stats["ticks"] == len(frames)
+    assert 10 <= stats["ticks"] <= 40
+    assert stats["missed_deadlines"] >= 5
+    assert stats["mean_tick_time"] < engine.tick_budget
@@ -0,0 +1,137 @@
+"""
+アニメーションの記録と読み込みのユニットテスト
+"""
+
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from src.avatar.animation_engine import AnimationConfig, AnimationEngine
+from src.avatar.animation_recorder import (
+    AnimationRecorder,
+    AnimationRecording,
+    recover_recordings,
+)
+from src.avatar.avatar_controller import AvatarController
+from src.avatar.pose import euler_to_quaternion
+
+
+def test_record_and_read_back(tmp_path):
+    """記録した重みと姿勢がそのまま読み戻せるテスト"""
+    path = tmp_path / "session.glb"
+    n_frames = 2500
+    times = np.arange(n_frames, dtype=np.float32) / 60
+    weights = np.random.default_rng(0).random((n_frames, 3), dtype=np.float32)
+    translations = np.stack([times, -times, np.zeros(n_frames)], axis=1)
+    rotations = euler_to_quaternion(np.stack([np.zeros(n_frames)] * 2 + [times], axis=1))
+
+    with AnimationRecorder(path, ["happy", "aa", "oh"], ["Head"], chunk_frames=256) as recorder:
+        for i in range(n_frames):
+            recorder.record(times[i], weights[i], translations[i : i + 1], rotations[i : i + 1])
+            # バッファはチャンク単位で書き出されるため一定量を超えない
+            assert recorder._buffered < 256
+
+    # 一時ファイルは残らない
+    assert [p.name for p in tmp_path.iterdir()] == ["session.glb"]
+
+    with AnimationRecording.open(path) as recording:
+        assert recording.frames == n_frames
+        assert recording.channel_names == ["happy", "aa", "oh"]
+        assert recording.node_names == ["Head"]
+        np.testing.assert_array_equal(recording.times, times)
+        np.testing.assert_array_equal(recording.weights, weights)
+        np.testing.assert_array_equal(recording.channel("aa"), weights[:, 1])
+        np.testing.assert_allclose(recording.translation("Head"), translations, atol=1e-6)
+        np.testing.assert_allclose(recording.rotation(0), rotations, atol=1e-6)
+        # 読み込んだ配列はファイルを参照する
+        assert not recording.weights.flags.owndata
+        assert not recording.weights.flags.writeable
+
+        gltf = recording.glb.json
+        sampler = gltf["animations"][0]["samplers"][0]
+        assert gltf["accessors"][sampler["input"]]["max"] == [pytest.approx(times[-1])]
+
+
+def test_empty_recording(tmp_path):
+    """フレームのない記録も読み込めるテスト"""
+    path = tmp_path / "empty.glb"
+    AnimationRecorder(path, ["happy"]).close()
+
+    with AnimationRecording.open(path) as recording:
+        assert recording.frames == 0
+        assert recording.weights.shape == (0, 1)
+
+
+def test_record_after_close(tmp_path):
+    """終了後の記録はエラーになるテスト"""
+    recorder = AnimationRecorder(tmp_path / "closed.glb", ["happy"])
+    recorder.close()
+    with pytest.raises(RuntimeError):
+        recorder.record(0.0, np.zeros(1))
+
+
+@pytest.mark.asyncio
+async def test_engine_records_session(tmp_path):
+    """アニメーションエンジンの更新ループが記録されるテスト"""
+    path = tmp_path / "engine.glb"
+    avatar = AvatarController("test_assets/test.vrm")
+    engine = AnimationEngine(avatar, AnimationConfig(tick_rate=100.0))
+    await engine.start_recording(str(path), nodes=[0], chunk_frames=4)
+    await engine.start()
+    avatar.update_pose((0.0, 1.0, 0.0), (0.0, 0.0, 0.0))
+    await asyncio.sleep(0.1)
+    await engine.stop()
+
+    with AnimationRecording.open(path) as recording:
+        assert recording.frames == engine.stats["ticks"]
+        assert recording.channel_names == engine.channel_names
+        assert np.all(np.diff(recording.times) > 0)
+        np.testing.assert_allclose(recording.translation(0)[-1], [0.0, 1.0, 0.0])
+
+
+@pytest.mark.asyncio
+async def test_engine_restart_recording_closes_off_loop(tmp_path, monkeypatch):
+    """記録をやり直すと前の記録をイベントループの外で終了するテスト"""
+    threads = []
+    original_close = AnimationRecorder.close
+
+    def record_close(self):
+        threads.append(threading.current_thread())
+        original_close(self)
+
+    monkeypatch.setattr(AnimationRecorder, "close", record_close)
+    avatar = AvatarController("test_assets/test.vrm")
+    engine = AnimationEngine(avatar, AnimationConfig(tick_rate=100.0))
+    first = tmp_path / "first.glb"
+    await engine.start_recording(str(first), chunk_frames=4)
+    await engine.start()
+    await asyncio.sleep(0.05)
+    await engine.start_recording(str(tmp_path / "second.glb"), chunk_frames=4)
+    await engine.stop()
+
+    assert len(threads) == 2
+    assert all(thread is not threading.main_thread() for thread in threads)
+    with AnimationRecording.open(first) as recording:
+        assert recording.frames > 0
+
+
+def test_recover_after_crash(tmp_path):
+    """異常終了で残った一時ファイルから書き出し済みのフレームを復元するテスト"""
+    path = tmp_path / "crashed.glb"
+    recorder = AnimationRecorder(path, ["happy", "aa"], ["Head"], chunk_frames=4)
+    for i in range(10):
+        recorder.record(i / 60, np.full(2, i / 10), np.full((1, 3), float(i)))
+    # closeせずに終了した状態(バッファ中の2フレームは失われる)
+    for track in recorder._tracks():
+        track.close()
+
+    assert recover_recordings(tmp_path) == [path]
+    assert [p.name for p in tmp_path.iterdir()] == ["crashed.glb"]
+    with AnimationRecording.open(path) as recording:
+        assert recording.frames == 8
+        assert recording.node_names == ["Head"]
+        np.testing.assert_allclose(recording.times, np.arange(8) / 60, atol=1e-6)
+        np.testing.assert_allclose(recording.translation("Head")[:, 0], np.arange(8))
+        np.testing.assert_allclose(recording.weights[-1], [0.7, 0.7], atol=1e-6)
@@ -0,0 +1,152 @@
+"""
+音声キャッシュのユニットテスト
+"""
+
+import os
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.tts.audio_cache import AudioCache, AudioQueryCache
+from src.tts.local_tts import LocalTTS, VoiceConfig
+
+
+def test_make_key_normalizes_text():
+    """全角・半角や空白の違いが同じキーになるテスト"""
+    config = VoiceConfig()
+    assert AudioCache.make_key("ＡＢＣ  です", config) == AudioCache.make_key("ABC です", config)
+
+
+def test_make_key_depends_on_voice_config():
+    """音声設定のいずれかが異なれば別のキーになるテスト"""
+    base = AudioCache.make_key("こんにちは", VoiceConfig())
+    assert base != AudioCache.make_key("こんにちは", VoiceConfig(speaker_id=2))
+    assert base != AudioCache.make_key("こんにちは", VoiceConfig(speed_scale=1.1))
+    assert base != AudioCache.make_key("こんにちは", VoiceConfig(intonation_scale=0.9))
+
+
+def test_memory_lru_eviction():
+    """メモリキャッシュがバイト数の上限でLRU削除されるテスト"""
+    cache = AudioCache(max_memory_bytes=10)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    assert cache.get("a") == b"1234"  # aを最近使用にする
+    cache.put("c", b"1234")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1234"
+    assert cache.get("c") == b"1234"
+    assert cache.memory_bytes == 8
+    assert cache.stats["memory_evictions"] == 1
+    assert cache.stats["misses"] == 1
+
+
+def test_disk_cache_survives_restart(tmp_path):
+    """ディスクキャッシュが再生成後も利用できるテスト"""
+    cache = AudioCache(cache_dir=str(tmp_path))
+    cache.put("abcdef", b"audio")
+
+    restarted = AudioCache(cache_dir=str(tmp_path))
+    assert restarted.get("abcdef") == b"audio"
+    assert restarted.stats["disk_hits"] == 1
+    # ディスクから読んだ音声はメモリ層に載る
+    assert restarted.get("abcdef") == b"audio"
+    assert restarted.stats["memory_hits"] == 1
+
+
+def test_disk_cache_eviction(tmp_path):
+    """ディスクキャッシュが上限バイト数で古い順に削除されるテスト"""
+    cache = AudioCache(cache_dir=str(tmp_path), max_memory_bytes=0, max_disk_bytes=10)
+    cache.put("aa01", b"123456")
+    cache.put("bb02", b"123456")
+
+    assert cache.get("aa01") is None
+    assert cache.get("bb02") == b"123456"
+    assert cache.stats["disk_evictions"] == 1
+    assert not (tmp_path / "aa" / "aa01.wav").exists()
+
+
+def test_disk_cache_trimmed_on_startup(tmp_path):
+    """起動時に上限を超える古いエントリと書き込み途中の一時ファイルを削除するテスト"""
+    cache = AudioCache(cache_dir=str(tmp_path), max_memory_bytes=0)
+    for i, key in enumerate(["aa01", "bb02", "cc03"]):
+        cache.put(key, b"123456")
+        os.utime(tmp_path / key[:2] / f"{key}.wav", (1000 + i, 1000 + i))
+    (tmp_path / "aa" / "tmpabc.tmp").write_bytes(b"partial")
+
+    restarted = AudioCache(cache_dir=str(tmp_path), max_memory_bytes=0, max_disk_bytes=12)
+    assert restarted.stats["disk_evictions"] == 1
+    assert not (tmp_path / "aa" / "aa01.wav").exists()
+    assert not (tmp_path / "aa" / "tmpabc.tmp").exists()
+    assert restarted.get("bb02") == b"123456"
+    assert restarted.get("cc03") == b"123456"
+
+
+@patch("requests.Session.post")
+def test_text_to_speech_uses_cache(mock_post):
+    """2回目の音声合成がキャッシュから返されるテスト"""
+    mock_query_response = MagicMock()
+    mock_query_response.json.return_value = {"speedScale": 1.0}
+    mock_synthesis_response = MagicMock()
+    mock_synthesis_response.content = b"fake audio data"
+    mock_post.side_effect = [mock_query_response, mock_synthesis_response]
+
+    tts = LocalTTS(cache=AudioCache())
+    assert tts.text_to_speech("こんにちは") == b"fake audio data"
+    assert tts.text_to_speech("こんにちは") == b"fake audio data"
+    assert mock_post.call_count == 2
+    assert tts.cache.stats["memory_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_async_disk_cache_runs_off_event_loop(tmp_path, voicevox_engine):
+    """非同期版の音声合成がディスクキャッシュの読み書きをイベントループ外で行うテスト"""
+    cache = AudioCache(cache_dir=str(tmp_path))
+    threads = []
+    original_get, original_put = cache.get, cache.put
+
+    def get(key):
+        threads.append(threading.current_thread())
+        return original_get(key)
+
+    def put(key, data):
+        threads.append(threading.current_thread())
+        original_put(key, data)
+
+    cache.get, cache.put = get, put
+    tts = LocalTTS(host=voicevox_engine.host, port=voicevox_engine.port, cache=cache)
+    try:
+        first = await tts.text_to_speech_async("こんにちは")
+        assert await tts.text_to_speech_async("こんにちは") == first
+    finally:
+        await tts.aclose()
+
+    assert len(threads) == 3
+    assert threading.main_thread() not in threads
+    assert voicevox_engine.count("/synthesis") == 1
+
+
+def test_audio_query_cache_returns_copies():
+    """音声クエリのキャッシュが複製を返し、保存済みクエリが変更されないテスト"""
+    cache = AudioQueryCache()
+    cache.put("こんにちは", 1, {"speedScale": 1.0, "accent_phrases": []})
+
+    query = cache.get("こんにちは", 1)
+    query["speedScale"] = 1.5
+    assert cache.get("こんにちは", 1)["speedScale"] == pytest.approx(1.0)
+    assert cache.get("こんにちは", 2) is None
+    assert cache.stats == {"hits": 2, "misses": 1, "evictions": 0}
+
+
+def test_audio_query_cache_eviction():
+    """音声クエリのキャッシュが最大件数でLRU削除されるテスト"""
+    cache = AudioQueryCache(max_entries=2)
+    cache.put("a", 1, {})
+    cache.put("b", 1, {})
+    cache.get("a", 1)
+    cache.put("c", 1, {})
+
+    assert len(cache) == 2
+    assert cache.get("b", 1) is None
+    assert cache.stats["evictions"] == 1
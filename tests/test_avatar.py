@@ -2,11 +2,14 @@
 アバター制御システムのユニットテスト
 """
 
+import itertools
 import os
 
+import numpy as np
 import pytest
 
 from src.avatar.avatar_controller import AvatarController, ExpressionConfig, LipSyncData
+from src.avatar.lip_sync_timeline import LipSyncTimeline
 
 
 @pytest.fixture
@@ -104,3 +107,175 @@ def test_export_animation(avatar_controller, tmp_path):
     avatar_controller.export_animation(str(output_path))
     assert output_path.exists()
     assert output_path.stat().st_size > 0
+
+
+def test_classify_frames_matches_reference(avatar_controller):
+    """一括計算の音素分類がフレームごとの逐次計算と一致するテスト"""
+    rng = np.random.default_rng(0)
+    features = rng.normal(scale=0.5, size=(200, 13))
+    features[5] = np.nan
+
+    indices, scores = avatar_controller._classify_frames(features)
+
+    names = avatar_controller._phoneme_names
+    for i, frame_features in enumerate(features):
+        best_phoneme = "n"
+        best_score = float("inf")
+        for phoneme, template in avatar_controller.phoneme_model.items():
+            score = np.linalg.norm(frame_features - template)
+            if score < best_score:
+                best_score = score
+                best_phoneme = phoneme
+        assert names[indices[i]] == best_phoneme
+        assert scores[i] == pytest.approx(best_score)
+
+
+def test_lip_sync_wav_uses_header_sample_rate(avatar_controller):
+    """WAVデータのサンプリングレートでリップシンクの時間が計算されるテスト"""
+    from conftest import make_wav
+
+    audio_data = make_wav(1.0, sample_rate=24000)
+    lip_sync_data = avatar_controller.lip_sync(audio_data)
+    # 24kHz・hop 512 で約47フレーム、最終フレームは約1秒
+    assert len(lip_sync_data) == pytest.approx(24000 / 512, abs=1)
+    assert lip_sync_data[-1].end_time == pytest.approx(1.0, abs=0.03)
+    assert all(np.isfinite(data.intensity) for data in lip_sync_data)
+
+
+def test_lip_sync_stream_matches_batch(avatar_controller):
+    """チャンク単位の逐次解析が一括解析と同じフレームを生成するテスト"""
+    from conftest import make_wav
+
+    from src.avatar.wav_reader import read_wav
+
+    audio_data = make_wav(0.5, sample_rate=24000)
+    expected = avatar_controller.lip_sync(audio_data)
+
+    pcm = bytes(read_wav(audio_data).pcm)
+    stream = avatar_controller.create_lip_sync_stream(sample_rate=24000)
+    first = stream.feed(pcm[:4096])
+    # 最初のチャンクの時点でフレームが得られる
+    assert len(first) > 0
+    # サンプルの途中で区切られたチャンクも扱える
+    result = list(first)
+    for i in range(4096, len(pcm), 777):
+        result.extend(stream.feed(pcm[i : i + 777]))
+    result.extend(stream.flush())
+
+    assert len(result) == len(expected)
+    assert [d.phoneme for d in result] == [d.phoneme for d in expected]
+    assert [d.start_time for d in result] == pytest.approx([d.start_time for d in expected])
+    # 振幅の下限の基準が異なる両端を除けば強度も一致する
+    assert [d.intensity for d in result[2:-2]] == pytest.approx(
+        [d.intensity for d in expected[2:-2]], abs=1e-3
+    )
+
+
+def test_lip_sync_stream_constant_memory(avatar_controller):
+    """逐次解析の内部バッファが入力の長さによらず一定であるテスト"""
+    stream = avatar_controller.create_lip_sync_stream(sample_rate=24000)
+    chunk = np.zeros(2400, dtype=np.float32)
+    total = 0
+    for _ in range(50):
+        total += len(stream.feed(chunk))
+        assert stream._ring.shape == (avatar_controller.win_length,)
+    assert total == stream.frames_emitted
+    assert total == 1 + (50 * 2400 - 1024) // 512
+
+
+def test_lip_sync_stream_running_peak(avatar_controller):
+    """振幅の下限がチャンクではなく入力全体の最大値を基準にするテスト"""
+    sample_rate = avatar_controller.sample_rate
+    t = np.arange(sample_rate // 2, dtype=np.float32) / sample_rate
+    tone = np.sin(2 * np.pi * 220.0 * t).astype(np.float32)
+    # 大きな音の後に続く小さな音のチャンク
+    audio = np.concatenate([0.5 * tone, 1e-5 * tone])
+    expected = avatar_controller.lip_sync_timeline(audio.tobytes(), merge=False)
+
+    stream = avatar_controller.create_lip_sync_stream()
+    timelines = [stream.feed(audio[i : i + 4096]) for i in range(0, len(audio), 4096)]
+    timelines.append(stream.flush())
+
+    assert all(isinstance(timeline, LipSyncTimeline) for timeline in timelines)
+    codes = np.concatenate([timeline.codes for timeline in timelines])
+    intensities = np.concatenate([timeline.intensities for timeline in timelines])
+    assert codes.tolist() == expected.codes.tolist()
+    assert intensities == pytest.approx(expected.intensities, abs=1e-3)
+
+
+def test_lip_sync_stream_analyze(avatar_controller):
+    """区切りごとの解析が一括解析と一致し、振幅の基準を引き継ぐテスト"""
+    from conftest import make_wav
+
+    from src.avatar.wav_reader import read_wav
+
+    audio_data = make_wav(0.5, sample_rate=24000)
+    samples = read_wav(audio_data).samples()
+    expected = avatar_controller.lip_sync_timeline(audio_data)
+
+    stream = avatar_controller.create_lip_sync_stream(sample_rate=24000)
+    first = stream.analyze(samples)
+    second = stream.analyze(samples)
+
+    assert first.codes.tolist() == expected.codes.tolist()
+    assert first.start_times == pytest.approx(expected.start_times)
+    assert first.intensities == pytest.approx(expected.intensities)
+    # 2つ目の区切りも時刻は先頭から始まる
+    assert second.start_times == pytest.approx(first.start_times)
+    assert stream._peak_db > -np.inf
+
+
+def test_lip_sync_from_audio_query(avatar_controller):
+    """音声クエリのモーラ長からリップシンクデータが生成されるテスト"""
+    from conftest import make_audio_query
+
+    audio_query = make_audio_query("あいう")
+    lip_sync_data = avatar_controller.lip_sync_from_audio_query(audio_query)
+
+    assert [(d.phoneme, d.intensity) for d in lip_sync_data] == [
+        ("n", 0.0),  # 前の無音
+        ("a", 1.0),
+        ("i", 0.5),  # 子音は続く母音の口形
+        ("i", 1.0),
+        ("u", 1.0),
+        ("n", 0.0),  # 後の無音
+    ]
+    # 区間は隙間なく連続し、合計は合成音声の長さに一致する
+    for previous, current in itertools.pairwise(lip_sync_data):
+        assert current.start_time == pytest.approx(previous.end_time)
+    assert lip_sync_data[-1].end_time == pytest.approx(0.1 + 0.35 + 0.1)
+
+
+def test_lip_sync_from_audio_query_special_moras(avatar_controller):
+    """無声化母音・撥音・両唇音・ポーズと話速の反映のテスト"""
+    audio_query = {
+        "accent_phrases": [
+            {
+                "moras": [
+                    {"consonant": "m", "consonant_length": 0.1, "vowel": "a", "vowel_length": 0.2},
+                    {"consonant": "s", "consonant_length": 0.1, "vowel": "U", "vowel_length": 0.2},
+                    {
+                        "consonant": None,
+                        "consonant_length": None,
+                        "vowel": "N",
+                        "vowel_length": 0.2,
+                    },
+                ],
+                "pause_mora": {
+                    "consonant": None,
+                    "consonant_length": None,
+                    "vowel": "pau",
+                    "vowel_length": 0.4,
+                },
+            }
+        ],
+        "speedScale": 2.0,
+        "prePhonemeLength": 0.0,
+        "postPhonemeLength": 0.0,
+    }
+    lip_sync_data = avatar_controller.lip_sync_from_audio_query(audio_query)
+
+    assert [d.phoneme for d in lip_sync_data] == ["n", "a", "u", "u", "n", "n"]
+    assert lip_sync_data[3].intensity < 1.0
+    assert lip_sync_data[-1].intensity == pytest.approx(0.0)
+    assert lip_sync_data[-1].end_time == pytest.approx(1.2 / 2.0)
@@ -0,0 +1,188 @@
+"""
+Ollamaサーバーの振り分けのテスト(スタブサーバーを使用)
+"""
+
+import threading
+import time
+
+import ollama
+import pytest
+
+from src.llm.backend_pool import BackendConfig, BackendPool, BackendPoolConfig
+from src.llm.local_llm import LocalLLM
+
+MESSAGES = [{"role": "user", "content": "こんにちは"}]
+
+
+def _pool(*servers, max_concurrency=(), **kwargs) -> BackendPool:
+    caps = list(max_concurrency) or [1] * len(servers)
+    backends = [
+        BackendConfig(host=server.base_url, max_concurrency=cap)
+        for server, cap in zip(servers, caps, strict=True)
+    ]
+    return BackendPool(BackendPoolConfig(backends=backends, **kwargs))
+
+
+def test_least_outstanding_routing_respects_caps(ollama_server_factory):
+    """処理中のリクエストが少ないサーバーへ上限内で振り分けるテスト"""
+    first = ollama_server_factory(load_delay=0.0, first_token_delay=0.3)
+    second = ollama_server_factory(load_delay=0.0, first_token_delay=0.3)
+    pool = _pool(first, second, max_concurrency=(1, 2), hedge_delay=None)
+
+    replies = []
+    threads = [
+        threading.Thread(target=lambda: replies.append(pool.chat(model="m", messages=MESSAGES)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert [r["message"]["content"] for r in replies] == ["応答:こんにちは"] * 4
+    assert first.max_active == 1
+    assert second.max_active == 2
+    # 上限に達した分は空きを待ってから送られる
+    assert len(first.bodies("/api/chat")) + len(second.bodies("/api/chat")) == 4
+    stats = pool.get_stats()["backends"]
+    assert all(backend["outstanding"] == 0 for backend in stats.values())
+
+
+def test_eject_and_readmit(ollama_server_factory):
+    """失敗したサーバーを切り離し、ヘルスチェックで戻すテスト"""
+    broken = ollama_server_factory(load_delay=0.0, reply_prefix="A")
+    working = ollama_server_factory(load_delay=0.0, reply_prefix="B")
+    broken.healthy = False
+    pool = _pool(broken, working, max_failures=1, hedge_delay=None)
+
+    # 失敗したリクエストは別のサーバーで再送される
+    response = pool.chat(model="m", messages=MESSAGES)
+    assert response["message"]["content"] == "B応答:こんにちは"
+    assert pool.stats["failovers"] == 1
+    assert pool.get_stats()["backends"][broken.base_url]["healthy"] is False
+
+    for _ in range(3):
+        pool.chat(model="m", messages=MESSAGES)
+    assert len(broken.bodies("/api/chat")) == 1
+
+    pool.check_health()
+    assert pool.get_stats()["backends"][broken.base_url]["healthy"] is False
+
+    broken.healthy = True
+    pool.check_health()
+    backend = pool.get_stats()["backends"][broken.base_url]
+    assert backend["healthy"] is True
+    assert backend["readmissions"] == 1
+    pool.chat(model="m", messages=MESSAGES)
+    assert len(broken.bodies("/api/chat")) == 2
+
+
+def test_all_backends_failing_raises(ollama_server_factory):
+    """全サーバーが失敗した場合は例外を送出するテスト"""
+    server = ollama_server_factory(load_delay=0.0)
+    server.healthy = False
+    pool = _pool(server, max_failures=1, hedge_delay=None)
+
+    with pytest.raises(ollama.ResponseError):
+        pool.chat(model="m", messages=MESSAGES)
+    assert pool.get_stats()["backends"][server.base_url]["healthy"] is False
+
+
+def test_ejected_backend_is_last_resort(ollama_server_factory):
+    """正常なサーバーがない場合は切り離したサーバーに送り、成功すれば戻すテスト"""
+    server = ollama_server_factory(load_delay=0.0)
+    server.healthy = False
+    pool = _pool(server, max_failures=1, hedge_delay=None, health_check_interval=0)
+
+    with pytest.raises(ollama.ResponseError):
+        pool.chat(model="m", messages=MESSAGES)
+    with pytest.raises(ollama.ResponseError):
+        pool.chat(model="m", messages=MESSAGES)
+    assert len(server.bodies("/api/chat")) == 2
+
+    # ヘルスチェックなしでも成功した時点で戻る
+    server.healthy = True
+    response = pool.chat(model="m", messages=MESSAGES)
+    assert response["message"]["content"] == "応答:こんにちは"
+    backend = pool.get_stats()["backends"][server.base_url]
+    assert backend["healthy"] is True
+    assert backend["readmissions"] == 1
+
+
+def test_client_error_is_not_retried(ollama_server_factory):
+    """4xxは別のサーバーに再送せず、失敗として数えないテスト"""
+    first = ollama_server_factory(load_delay=0.0)
+    second = ollama_server_factory(load_delay=0.0)
+    first.chat_status = second.chat_status = 404
+    pool = _pool(first, second, max_failures=1, hedge_delay=None)
+
+    with pytest.raises(ollama.ResponseError) as excinfo:
+        pool.chat(model="missing", messages=MESSAGES)
+    assert excinfo.value.status_code == 404
+    assert len(first.bodies("/api/chat")) + len(second.bodies("/api/chat")) == 1
+    assert pool.stats["failovers"] == 0
+    time.sleep(0.05)
+    for backend in pool.get_stats()["backends"].values():
+        assert backend["healthy"] is True
+        assert backend["failures"] == 0
+        assert backend["outstanding"] == 0
+
+
+def test_hedged_request_uses_faster_backend(ollama_server_factory):
+    """最初のトークンが遅い場合に別のサーバーの応答を採用するテスト"""
+    slow = ollama_server_factory(load_delay=0.0, first_token_delay=1.0, reply_prefix="A")
+    fast = ollama_server_factory(load_delay=0.0, reply_prefix="B")
+    pool = _pool(slow, fast, hedge_delay=0.1)
+
+    started = time.perf_counter()
+    tokens = [
+        chunk["message"]["content"]
+        for chunk in pool.chat(stream=True, model="m", messages=MESSAGES)
+    ]
+    elapsed = time.perf_counter() - started
+
+    assert "".join(tokens) == "B応答:こんにちは"
+    assert elapsed < 0.8
+    assert pool.stats["hedges"] == 1
+    assert pool.stats["hedge_wins"] == 1
+    # 遅いサーバーは生成を終えるまで枠を使い続ける
+    backend = pool.get_stats()["backends"][slow.base_url]
+    assert backend["outstanding"] == 1
+    # 応答後に解放され、失敗とはみなさない
+    time.sleep(1.2)
+    backend = pool.get_stats()["backends"][slow.base_url]
+    assert backend["outstanding"] == 0
+    assert backend["failures"] == 0
+
+
+def test_fast_backend_is_not_hedged(ollama_server_factory):
+    """期限内に最初のトークンが届いた場合は他のサーバーに送らないテスト"""
+    first = ollama_server_factory(load_delay=0.0)
+    second = ollama_server_factory(load_delay=0.0)
+    pool = _pool(first, second, hedge_delay=0.5)
+
+    pool.chat(model="m", messages=MESSAGES)
+    assert pool.stats["hedges"] == 0
+    assert len(first.bodies("/api/chat")) + len(second.bodies("/api/chat")) == 1
+
+
+def test_local_llm_with_pool(ollama_server_factory):
+    """LocalLLMが振り分けを通して応答を生成し、全サーバーでウォームアップするテスト"""
+    first = ollama_server_factory(load_delay=0.05)
+    second = ollama_server_factory(load_delay=0.05)
+    llm = LocalLLM(model_name="stub", pool=_pool(first, second))
+
+    result = llm.warm_up()
+    assert first.loads == 1
+    assert second.loads == 1
+    assert result["load_time"] >= 0.05
+
+    assert "".join(llm.generate_response_stream("質問")) == "応答:質問"
+    assert llm.generate_response("次の質問") == "応答:次の質問"
+    assert llm.stats["warm_requests"] == 2
+    assert [m.content for m in llm.context.history] == [
+        "質問",
+        "応答:質問",
+        "次の質問",
+        "応答:次の質問",
+    ]
@@ -0,0 +1,200 @@
+"""
+チャット受付キューのユニットテスト
+"""
+
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from src.pipeline.chat_queue import ChatQueue, ChatQueueConfig, normalize_message
+from src.stream.stream_handler import ChatMessage
+
+
+class FakeClock:
+    """手動で進める時計"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _message(text: str, author: str = "viewer", **kwargs: object) -> ChatMessage:
+    return ChatMessage(
+        author=author, message=text, timestamp=datetime.now(), platform="youtube", **kwargs
+    )
+
+
+def _texts(queue: ChatQueue) -> list[str]:
+    texts = []
+    while (entry := queue.get_nowait()) is not None:
+        texts.append(entry.message.message)
+    return texts
+
+
+def test_normalize_message():
+    """表記ゆれを揃える正規化のテスト"""
+    assert normalize_message("こんにちは！！") == normalize_message("こんにちは")
+    assert normalize_message("ＨＥＬＬＯ  World") == "helloworld"
+    assert normalize_message("草wwwwww") == "草ww"
+    assert normalize_message("!!! 。") == ""
+
+
+def test_scoring_order():
+    """スコアの高い順、同点の場合は到着順に取り出すテスト"""
+    queue = ChatQueue(ChatQueueConfig(first_time_weight=0.0, mention_names=["アイちゃん"]))
+    queue.put(_message("こんばんは"))
+    queue.put(_message("今日は何する?"))
+    queue.put(_message("アイちゃん見てる"))
+    queue.put(_message("おつかれ"))
+    queue.put(_message("ありがとう", superchat_amount=500.0, superchat_currency="JPY"))
+
+    assert _texts(queue) == [
+        "ありがとう",
+        "アイちゃん見てる",
+        "今日は何する?",
+        "こんばんは",
+        "おつかれ",
+    ]
+
+
+def test_first_time_viewer_bonus():
+    """初めての投稿者のメッセージを優先するテスト"""
+    queue = ChatQueue()
+    queue.put(_message("1回目", author="regular"))
+    queue.get_nowait()
+    queue.put(_message("2回目", author="regular"))
+    queue.put(_message("はじめまして", author="newcomer"))
+    assert _texts(queue) == ["はじめまして", "2回目"]
+
+
+def test_coalesce_duplicates():
+    """同じ内容のメッセージをまとめて加点するテスト"""
+    discarded = []
+    queue = ChatQueue(ChatQueueConfig(first_time_weight=0.0), on_discard=discarded.append)
+    queue.put(_message("こんにちは"))
+    queue.put(_message("888"))
+    for author in ("a", "b", "c"):
+        assert queue.put(_message("８８８８８！", author=author))
+
+    assert len(queue) == 2
+    assert queue.stats["coalesced"] == 3
+    assert len(discarded) == 3
+
+    entry = queue.get_nowait()
+    assert entry.message.message == "888"
+    assert entry.count == 4
+    assert entry.score == pytest.approx(1.5)
+    assert _texts(queue) == ["こんにちは"]
+
+
+def test_bounded_size_evicts_lowest_score():
+    """上限を超えるとスコアの低い候補を破棄するテスト"""
+    discarded = []
+    queue = ChatQueue(
+        ChatQueueConfig(first_time_weight=0.0), max_size=2, on_discard=discarded.append
+    )
+    assert queue.put(_message("質問です?"))
+    assert queue.put(_message("こんにちは"))
+    # 同点の場合は古い候補を破棄する
+    assert not queue.put(_message("こんばんは"))
+    assert [m.message for m in discarded] == ["こんにちは"]
+
+    # 新しいメッセージの方がスコアが低い場合はそれを破棄する
+    queue.put(_message("質問2?"))
+    assert not queue.put(_message("おはよう"))
+    assert [m.message for m in discarded] == ["こんにちは", "こんばんは", "おはよう"]
+    assert len(queue) == 2
+    assert _texts(queue) == ["質問です?", "質問2?"]
+
+
+def test_ttl_expires_old_messages():
+    """有効期限を過ぎたメッセージを破棄するテスト"""
+    clock = FakeClock()
+    queue = ChatQueue(ChatQueueConfig(ttl=10.0), clock=clock)
+    queue.put(_message("古いメッセージ?"))
+    clock.now = 5.0
+    queue.put(_message("新しいメッセージ", author="other"))
+    clock.now = 12.0
+    assert _texts(queue) == ["新しいメッセージ"]
+    assert queue.stats["expired"] == 1
+
+
+def test_memory_stays_bounded():
+    """大量の投入と更新でも内部の要素数が一定に収まるテスト"""
+    queue = ChatQueue(max_size=64)
+    for i in range(20000):
+        queue.put(_message(f"message {i % 200}", author=f"user{i % 1000}"))
+        if i % 3 == 0:
+            queue.get_nowait()
+
+    assert len(queue) <= 64
+    assert len(queue._best) + len(queue._worst) + len(queue._arrivals) <= 6 * 64 + 64 + 2
+    total = sum(queue.stats[key] for key in ("served", "coalesced", "evicted", "rejected"))
+    assert total + len(queue) == queue.stats["pushed"]
+
+
+@pytest.mark.asyncio
+async def test_get_waits_for_message():
+    """候補が届くまで取り出しを待機するテスト"""
+    queue = ChatQueue()
+    task = asyncio.create_task(queue.get())
+    await asyncio.sleep(0.01)
+    assert not task.done()
+
+    queue.put(_message("こんにちは"))
+    entry = await asyncio.wait_for(task, timeout=1)
+    assert entry.message.message == "こんにちは"
+
+
+def test_peek_keeps_candidates():
+    """上位の候補を取り出さずに取得するテスト"""
+    queue = ChatQueue(ChatQueueConfig(first_time_weight=0.0))
+    queue.put(_message("こんにちは"))
+    queue.put(_message("質問です?"))
+    queue.put(_message("888"))
+    queue.put(_message("８８８"))
+
+    top = queue.peek(2)
+    assert [entry.message.message for entry in top] == ["質問です?", "888"]
+    assert len(queue) == 3
+    assert queue.get_nowait() is top[0]
+
+
+def test_coalesce_similar_messages():
+    """表記ゆれのあるメッセージを類似度でまとめるテスト"""
+    queue = ChatQueue(ChatQueueConfig(first_time_weight=0.0))
+    queue.put(_message("こんにちは!"))
+    queue.put(_message("こんばんは"))
+    assert queue.put(_message("こんにちはー", author="a"))
+    assert queue.put(_message("こんにちわ", author="b"))
+
+    assert len(queue) == 2
+    assert queue.stats["coalesced"] == 2
+    entry = queue.get_nowait()
+    assert entry.message.message == "こんにちは!"
+    assert entry.count == 3
+    assert _texts(queue) == ["こんばんは"]
+
+    # 閾値が1の場合は正規化後の完全一致のみまとめる
+    exact = ChatQueue(ChatQueueConfig(similarity_threshold=1.0))
+    exact.put(_message("こんにちは!"))
+    exact.put(_message("こんにちわ"))
+    assert len(exact) == 2
+
+
+def test_author_remembered_only_when_accepted():
+    """破棄されたメッセージの投稿者は初めての投稿者のまま扱うテスト"""
+    queue = ChatQueue(ChatQueueConfig(question_weight=2.0), max_size=1)
+    queue.put(_message("質問です?", author="regular"))
+    # スコアが低く受け付けられなかった
+    assert not queue.put(_message("こんばんは", author="newcomer"))
+    assert queue.score(_message("こんばんは", author="newcomer")) == pytest.approx(1.0)
+
+    # 受け付けた後に破棄された場合も記憶しない
+    assert not queue.put(_message("はじめまして?", author="newcomer"))
+    assert queue.stats["evicted"] == 1
+    assert queue.score(_message("2回目", author="regular")) == pytest.approx(1.0)
+    assert queue.score(_message("2回目", author="newcomer")) == pytest.approx(0.0)
@@ -0,0 +1,166 @@
+"""
+会話コンテキストのユニットテスト
+"""
+
+import threading
+
+from src.llm.conversation_context import (
+    ContextConfig,
+    ConversationContext,
+    Message,
+    estimate_tokens,
+)
+
+
+def _add_turns(context: ConversationContext, count: int, start: int = 0) -> None:
+    for i in range(start, start + count):
+        context.add("user", f"質問{i}")
+        context.add("assistant", f"応答{i}")
+
+
+def test_estimate_tokens():
+    """トークン数の概算のテスト"""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("こんにちは") == 5
+    assert estimate_tokens("hello world!") == 3
+
+
+def test_system_prompt_included_once():
+    """システムプロンプトが先頭に1件だけ含まれるテスト"""
+    context = ConversationContext("あなたはAITuberです")
+    _add_turns(context, 3)
+    messages = context.messages()
+    assert messages[0] == Message(role="system", content="あなたはAITuberです")
+    assert [m.role for m in messages].count("system") == 1
+    assert len(messages) == 7
+
+
+def test_keep_last_turns():
+    """直近の組だけを残し、古い組を要約待ちに移すテスト"""
+    context = ConversationContext(config=ContextConfig(keep_turns=2))
+    _add_turns(context, 5)
+    assert [m.content for m in context.history] == ["質問3", "応答3", "質問4", "応答4"]
+    assert [m.content for m in context.pending][:2] == ["質問0", "応答0"]
+    assert len(context.pending) == 6
+
+
+def test_token_budget_keeps_latest_message():
+    """トークン数の上限を超える古い発話を除くテスト"""
+    context = ConversationContext("system", ContextConfig(max_tokens=40, keep_turns=10))
+    context.add("user", "あ" * 20)
+    context.add("assistant", "い" * 20)
+    context.add("user", "う" * 10)
+
+    messages = context.messages()
+    assert [m.content for m in messages] == ["system", "う" * 10]
+    assert context.prompt_tokens() <= 40
+
+    # 最新の発話は上限を超えても残す
+    context.add("user", "え" * 100)
+    assert context.messages()[-1].content == "え" * 100
+
+
+def test_summary_replaces_old_turns():
+    """古い組が要約にまとめられ、プロンプトの大きさが一定に保たれるテスト"""
+    calls = []
+
+    def summarizer(summary: str, messages: list[Message]) -> str:
+        calls.append((summary, [m.content for m in messages]))
+        return f"{summary}+{len(messages)}"
+
+    context = ConversationContext(
+        "system", ContextConfig(keep_turns=2, summarize_every=2), summarizer=summarizer
+    )
+    sizes = []
+    for i in range(40):
+        _add_turns(context, 1, start=i)
+        if context.needs_summary:
+            assert context.summarize()
+        sizes.append(context.prompt_tokens())
+
+    assert calls[0] == ("", ["質問0", "応答0", "質問1", "応答1"])
+    assert context.summary.startswith("+4+4")
+    assert "これまでの会話の要約" in context.messages()[0].content
+    # 要約の上限により、会話が続いてもプロンプトはほぼ一定
+    assert max(sizes[10:]) - min(sizes[10:]) <= 10
+    assert len(context.pending) < 4
+
+
+def test_summary_truncated_to_budget():
+    """要約が上限のトークン数に切り詰められるテスト"""
+    context = ConversationContext(
+        config=ContextConfig(keep_turns=1, summarize_every=1, summary_tokens=10),
+        summarizer=lambda summary, messages: "長" * 100,
+    )
+    _add_turns(context, 2)
+    assert context.summarize()
+    assert context.summary == "長" * 10
+
+
+def test_turns_added_while_summarizing_are_kept():
+    """要約中に追加された発話が失われないテスト"""
+    started = threading.Event()
+    release = threading.Event()
+
+    def summarizer(summary: str, messages: list[Message]) -> str:
+        started.set()
+        release.wait(timeout=5)
+        return "要約"
+
+    context = ConversationContext(
+        config=ContextConfig(keep_turns=1, summarize_every=1), summarizer=summarizer
+    )
+    _add_turns(context, 2)
+    thread = threading.Thread(target=context.summarize)
+    thread.start()
+    started.wait(timeout=5)
+    _add_turns(context, 1, start=2)
+    release.set()
+    thread.join()
+
+    assert context.summary == "要約"
+    assert [m.content for m in context.pending] == ["質問1", "応答1"]
+    assert [m.content for m in context.history] == ["質問2", "応答2"]
+
+
+def test_pending_turns_are_bounded():
+    """要約が追いつかない場合も要約待ちが上限を超えないテスト"""
+    context = ConversationContext(config=ContextConfig(keep_turns=1, max_pending_turns=3))
+    _add_turns(context, 10)
+    assert len(context.pending) == 6
+    assert context.pending[0].content == "質問6"
+    assert context.stats["dropped_turns"] == 6
+
+
+def test_preview_does_not_change_history():
+    """発話を追加した場合のメッセージ列を履歴を変えずに作成するテスト"""
+    context = ConversationContext("system", ContextConfig(keep_turns=2))
+    _add_turns(context, 2)
+    version = context.version
+
+    preview = context.preview("次の質問")
+    assert [m.content for m in preview] == ["system", "質問1", "応答1", "次の質問"]
+    assert context.version == version
+    assert len(context.history) == 4
+    assert context.pending == []
+
+    context.add("user", "次の質問")
+    assert context.version == version + 1
+    assert context.messages() == preview
+
+
+def test_fingerprint_covers_recent_turns():
+    """文脈のハッシュが直近の組だけで決まるテスト"""
+    context = ConversationContext("system")
+    other = ConversationContext("system")
+    assert context.fingerprint(1) == other.fingerprint(1)
+    assert context.fingerprint(0) == ""
+
+    _add_turns(context, 3)
+    _add_turns(other, 1, start=2)
+    # 直近1組が同じなら古い発話が違っても一致する
+    assert context.fingerprint(1) == other.fingerprint(1)
+    assert context.fingerprint(2) != other.fingerprint(2)
+
+    other.add("user", "質問3")
+    assert context.fingerprint(1) != other.fingerprint(1)
@@ -0,0 +1,96 @@
+"""
+リップシンクタイムラインのユニットテスト
+"""
+
+import numpy as np
+import pytest
+
+from src.avatar.avatar_controller import AvatarController
+from src.avatar.lip_sync_timeline import PHONEME_CODES, LipSyncData, LipSyncTimeline
+
+
+def _frames(phonemes: str, frame_duration: float = 0.01) -> list[LipSyncData]:
+    return [
+        LipSyncData(phoneme, i * frame_duration, (i + 1) * frame_duration, 0.1 * (i + 1))
+        for i, phoneme in enumerate(phonemes)
+    ]
+
+
+def test_merge_runs():
+    """同じ音素が続くフレームが1区間にまとまるテスト"""
+    timeline = LipSyncTimeline.from_lip_sync_data(_frames("aaiiinna"))
+
+    assert [d.phoneme for d in timeline] == ["a", "i", "n", "a"]
+    assert timeline[0].end_time == pytest.approx(0.02)
+    assert timeline[1].start_time == pytest.approx(0.02)
+    assert timeline[1].end_time == pytest.approx(0.05)
+    # 区間の強度はフレームの平均
+    assert timeline[1].intensity == pytest.approx((0.3 + 0.4 + 0.5) / 3)
+    assert timeline[-1].end_time == pytest.approx(timeline.duration)
+
+
+def test_without_merge_preserves_frames():
+    """まとめない場合は入力のフレームがそのまま残るテスト"""
+    frames = _frames("aai")
+    timeline = LipSyncTimeline.from_lip_sync_data(frames, merge=False)
+
+    assert len(timeline) == 3
+    for expected, actual in zip(frames, timeline.to_list()):
+        assert actual.phoneme == expected.phoneme
+        assert actual.start_time == pytest.approx(expected.start_time)
+        assert actual.intensity == pytest.approx(expected.intensity)
+
+
+def test_at_lookup():
+    """指定時刻の区間を取得するテスト"""
+    timeline = LipSyncTimeline.from_lip_sync_data(_frames("aaiiinna"))
+
+    assert timeline.at(0.0).phoneme == "a"
+    assert timeline.at(0.025).phoneme == "i"
+    assert timeline.at(0.055).phoneme == "n"
+    assert timeline.at(-0.01) is None
+    assert timeline.at(timeline.duration) is None
+
+
+def test_sample_matches_at():
+    """一括取得が1件ずつの取得と一致するテスト"""
+    timeline = LipSyncTimeline.from_lip_sync_data(_frames("aaiiinnaoo"))
+    times = np.linspace(-0.02, 0.12, 57)
+
+    codes, intensities = timeline.sample(times)
+
+    for time, code, intensity in zip(times, codes, intensities):
+        data = timeline.at(float(np.float32(time)))
+        if data is None:
+            assert code == PHONEME_CODES["n"]
+            assert intensity == pytest.approx(0.0)
+        else:
+            assert code == PHONEME_CODES[data.phoneme]
+            assert intensity == pytest.approx(data.intensity)
+
+
+def test_empty_timeline():
+    """空のタイムラインのテスト"""
+    timeline = LipSyncTimeline.from_lip_sync_data([])
+
+    assert len(timeline) == 0
+    assert timeline.duration == pytest.approx(0.0)
+    assert timeline.at(0.0) is None
+    codes, _ = timeline.sample([0.0, 1.0])
+    assert codes.tolist() == [PHONEME_CODES["n"]] * 2
+
+
+def test_avatar_timeline_is_compact():
+    """音声解析のタイムラインがフレーム単位のリストと同じ内容を少ない区間で表すテスト"""
+    from conftest import make_wav
+
+    avatar = AvatarController("test_assets/test.vrm")
+    audio_data = make_wav(1.0)
+    frames = avatar.lip_sync(audio_data)
+    timeline = avatar.lip_sync_timeline(audio_data)
+
+    assert len(timeline) < len(frames)
+    assert timeline.nbytes == len(timeline) * (1 + 3 * 4)
+    for frame in frames:
+        midpoint = (frame.start_time + frame.end_time) / 2
+        assert timeline.at(midpoint).phoneme == frame.phoneme
@@ -2,11 +2,12 @@
 LLMシステムのユニットテスト
 """
 
+import time
 from unittest.mock import MagicMock, patch
 
 import pytest
 
-from src.llm.local_llm import LocalLLM, Message
+from src.llm.local_llm import LocalLLM, Message, ResidencyConfig
 
 
 def test_local_llm_initialization():
@@ -46,6 +47,25 @@ def test_generate_response(mock_chat):
     assert response == "Hello response"
 
 
+@patch("ollama.chat")
+def test_generate_response_stream(mock_chat):
+    """トークン単位の応答生成のテスト"""
+    mock_chat.return_value = iter(
+        [
+            {"message": {"content": "Hello"}},
+            {"message": {"content": ""}},
+            {"message": {"content": " world"}},
+        ]
+    )
+
+    llm = LocalLLM()
+    tokens = list(llm.generate_response_stream("Hi"))
+    assert tokens == ["Hello", " world"]
+    assert mock_chat.call_args.kwargs["stream"] is True
+    assert llm._message_history[-1].role == "assistant"
+    assert llm._message_history[-1].content == "Hello world"
+
+
 @patch("ollama.show")
 def test_get_model_info(mock_show):
     """モデル情報取得のテスト"""
@@ -56,3 +76,104 @@ def test_get_model_info(mock_show):
     assert model_info is not None
     assert isinstance(model_info, dict)
     assert "name" in model_info
+
+
+@patch("ollama.chat")
+def test_prompt_stays_flat_over_long_conversation(mock_chat):
+    """長い会話でもシステムプロンプトは1件で、プロンプトが一定に保たれるテスト"""
+    from src.llm.conversation_context import ContextConfig
+
+    def chat(model, messages, **kwargs):
+        if messages[0]["content"].startswith("あなたは配信の会話ログを要約する"):
+            return {"message": {"content": "要約です"}}
+        return {"message": {"content": "応答です"}}
+
+    mock_chat.side_effect = chat
+    llm = LocalLLM(
+        system_prompt="あなたはAITuberです",
+        context_config=ContextConfig(keep_turns=3, summarize_every=2),
+    )
+    for i in range(30):
+        llm.generate_response(f"質問{i}")
+        # 要約はバックグラウンドで実行されるため完了を待つ
+        if llm._summary_future is not None:
+            llm._summary_future.result(timeout=5)
+
+    prompts = [
+        call.kwargs["messages"]
+        for call in mock_chat.call_args_list
+        if call.kwargs["messages"][0]["content"].startswith("あなたはAITuberです")
+    ]
+    assert all([m["role"] for m in prompt].count("system") == 1 for prompt in prompts)
+    # システムプロンプトと直近2組、最新の質問
+    assert max(len(prompt) for prompt in prompts) == 6
+    assert "要約です" in prompts[-1][0]["content"]
+    assert llm.context.stats["summaries"] >= 1
+
+
+def test_warm_up_loads_model_and_primes_system_prompt(ollama_server):
+    """ウォームアップでモデルを読み込み、最初の応答が読み込み済みのモデルで行われるテスト"""
+    llm = LocalLLM(
+        system_prompt="あなたはAITuberです",
+        host=ollama_server.base_url,
+        residency=ResidencyConfig(heartbeat_interval=0.0),
+    )
+    result = llm.warm_up()
+
+    assert ollama_server.loads == 1
+    assert result["load_time"] == pytest.approx(ollama_server.load_delay)
+    assert result["total_time"] >= result["load_time"]
+    # システムプロンプトを含む1トークンの生成を行い、履歴には残さない
+    warm_up_chat = ollama_server.bodies("/api/chat")[0]
+    assert warm_up_chat["messages"][0] == {"role": "system", "content": "あなたはAITuberです"}
+    assert warm_up_chat["options"]["num_predict"] == 1
+    assert len(llm._message_history) == 0
+
+    assert llm.generate_response("こんにちは") == "応答:こんにちは"
+    assert llm.last_request_warm is True
+    assert ollama_server.loads == 1
+    assert ollama_server.bodies("/api/chat")[-1]["keep_alive"] == "10m"
+    stats = llm.get_stats()
+    assert stats["warm_requests"] == 1
+    assert stats["cold_requests"] == 0
+    assert stats["warm_up_time"] == pytest.approx(result["total_time"])
+
+
+def test_cold_requests_are_reported(ollama_server):
+    """モデルが破棄された後の呼び出しがコールドスタートとして記録されるテスト"""
+    # スタブの読み込み時間(0.2秒)をコールドスタートとみなす
+    llm = LocalLLM(host=ollama_server.base_url, residency=ResidencyConfig(cold_load_threshold=0.1))
+    assert "".join(llm.generate_response_stream("1回目")) == "応答:1回目"
+    assert llm.last_request_warm is False
+
+    llm.generate_response("2回目")
+    assert llm.last_request_warm is True
+
+    ollama_server.unload()
+    llm.generate_response("3回目")
+    stats = llm.get_stats()
+    assert stats["requests"] == 3
+    assert stats["cold_requests"] == 2
+    assert stats["last_load_time"] == pytest.approx(ollama_server.load_delay)
+
+
+def test_heartbeat_keeps_model_loaded(ollama_server):
+    """呼び出しがない間も定期的な延長でモデルが保持されるテスト"""
+    llm = LocalLLM(
+        host=ollama_server.base_url,
+        residency=ResidencyConfig(keep_alive=0.3, heartbeat_interval=0.1),
+    )
+    llm.warm_up()
+    llm.start_heartbeat()
+    try:
+        time.sleep(0.8)
+        assert ollama_server.is_loaded
+    finally:
+        llm.stop_heartbeat()
+
+    assert llm.get_stats()["heartbeats"] >= 3
+    assert ollama_server.loads == 1
+
+    # 延長しなければ保持期間が過ぎるとモデルは破棄される
+    time.sleep(0.5)
+    assert not ollama_server.is_loaded
@@ -0,0 +1,80 @@
+"""
+NumPy版MFCCと起動時間計測のユニットテスト
+"""
+
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from src.avatar import mfcc
+from src.avatar.avatar_controller import AvatarController
+from src.startup import StartupTimer
+
+
+@pytest.mark.parametrize("sample_rate", [24000, 44100])
+def test_mfcc_matches_librosa(sample_rate):
+    """NumPy版のMFCCがlibrosaと一致するテスト"""
+    librosa = pytest.importorskip("librosa")
+    rng = np.random.default_rng(0)
+    y = (rng.normal(size=sample_rate // 2) * 0.1).astype(np.float32)
+
+    expected = librosa.feature.mfcc(y=y, sr=sample_rate, n_mfcc=13, hop_length=512, win_length=2048)
+    actual = mfcc.mfcc(y, sample_rate, n_mfcc=13, hop_length=512, win_length=2048)
+
+    assert actual.shape == expected.shape
+    np.testing.assert_allclose(actual, expected, atol=1e-3)
+
+
+def test_filterbank_is_cached():
+    """メルフィルタバンクとDCT行列がサンプリングレートごとに再利用されるテスト"""
+    assert mfcc.mel_filterbank(24000, 2048) is mfcc.mel_filterbank(24000, 2048)
+    assert mfcc.mel_filterbank(24000, 2048) is not mfcc.mel_filterbank(44100, 2048)
+    assert mfcc.dct_matrix(13, 128) is mfcc.dct_matrix(13, 128)
+    assert not mfcc.mel_filterbank(24000, 2048).flags.writeable
+
+
+def test_lip_sync_backends_agree():
+    """MFCCのバックエンドによらず同じリップシンクデータになるテスト"""
+    pytest.importorskip("librosa")
+    from conftest import make_wav
+
+    audio_data = make_wav(0.5)
+    numpy_result = AvatarController("test_assets/test.vrm").lip_sync(audio_data)
+    librosa_result = AvatarController("test_assets/test.vrm", mfcc_backend="librosa").lip_sync(
+        audio_data
+    )
+    assert [d.phoneme for d in numpy_result] == [d.phoneme for d in librosa_result]
+
+
+def test_unknown_backend():
+    """未知のバックエンドを指定した場合のテスト"""
+    with pytest.raises(ValueError):
+        AvatarController("test_assets/test.vrm", mfcc_backend="unknown")
+
+
+def test_heavy_modules_not_imported_at_startup():
+    """起動時に重いライブラリが読み込まれないことのテスト"""
+    code = (
+        "import sys, src.main; "
+        "print(','.join(m for m in ('librosa', 'numba', 'ollama', 'pytchat') if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == ""
+
+
+def test_startup_timer_report():
+    """起動時間の記録と表示のテスト"""
+    timer = StartupTimer()
+    with timer.measure("avatar"):
+        pass
+    with timer.measure("tts"):
+        pass
+
+    assert list(timer.timings) == ["avatar", "tts"]
+    report = timer.report()
+    assert "avatar" in report
+    assert "total" in report
@@ -0,0 +1,173 @@
+"""
+OBS WebSocketクライアントのテスト(スタブobs-websocketサーバーを使用)
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from src.stream.obs_websocket import OBSWebSocketClient, OBSWebSocketConfig
+from src.stream.stream_handler import StreamHandler
+
+FAST = OBSWebSocketConfig(update_interval=0.05, reconnect_delay=0.01, request_timeout=2.0)
+
+
+@pytest.mark.asyncio
+async def test_authenticate_and_request(obs_server):
+    """認証してリクエストを送り、応答を受け取るテスト"""
+    client = OBSWebSocketClient(obs_server.host, obs_server.port, "secret", FAST)
+    try:
+        assert await client.start()
+        version = await client.request("GetVersion")
+        results = await client.request_batch(
+            [
+                ("SetCurrentProgramScene", {"sceneName": "Talk"}),
+                ("SetSceneItemEnabled", {"sceneName": "Talk", "sceneItemId": 1}),
+            ]
+        )
+    finally:
+        await client.close()
+
+    assert version["obsVersion"] == "30.0.0"
+    assert obs_server.requests == [("GetVersion", {})]
+    assert [r["requestStatus"]["result"] for r in results] == [True, True]
+    assert len(obs_server.batches) == 1
+    assert obs_server.connections == 1
+
+
+@pytest.mark.asyncio
+async def test_malformed_frames_are_ignored(obs_server):
+    """不正なフレームを受信しても接続を保ち、応答を受け取れるテスト"""
+    obs_server.junk = ["not json", '{"op": 7}', "[1]"]
+    client = OBSWebSocketClient(obs_server.host, obs_server.port, "secret", FAST)
+    try:
+        assert await client.start()
+        version = await client.request("GetVersion")
+        assert version["obsVersion"] == "30.0.0"
+        await client.request("GetVersion")
+    finally:
+        await client.close()
+
+    assert client.stats["malformed"] == 6
+    assert client.stats["reconnects"] == 0
+    assert obs_server.connections == 1
+
+
+@pytest.mark.asyncio
+async def test_wrong_password_does_not_reconnect(obs_server):
+    """認証に失敗した場合は再接続しないテスト"""
+    config = FAST.model_copy(update={"request_timeout": 0.2})
+    client = OBSWebSocketClient(obs_server.host, obs_server.port, "wrong", config)
+    try:
+        assert not await client.start()
+        await asyncio.sleep(0.1)
+        assert client.stats["reconnects"] == 0
+        with pytest.raises(ConnectionError):
+            await client.request("GetVersion")
+    finally:
+        await client.close()
+    assert obs_server.connections == 0
+
+
+@pytest.mark.asyncio
+async def test_rapid_updates_are_coalesced(obs_server):
+    """頻繁な字幕の更新が最新の値だけにまとめられ、1往復で送られるテスト"""
+    client = OBSWebSocketClient(obs_server.host, obs_server.port, "secret", FAST)
+    try:
+        await client.start()
+        started = time.perf_counter()
+        for i in range(10000):
+            client.set_text("Subtitle", f"字幕{i}")
+        elapsed = time.perf_counter() - started
+        client.set_text("Title", "タイトル")
+        client.queue_request("scene", "SetCurrentProgramScene", {"sceneName": "Talk"})
+        await asyncio.sleep(0.2)
+    finally:
+        await client.close()
+
+    # 1件あたりの更新はごく短時間で終わる
+    assert elapsed / 10000 < 50e-6
+    assert obs_server.batches == [
+        [
+            ("SetInputSettings", {"inputName": "Subtitle", "inputSettings": {"text": "字幕9999"}}),
+            ("SetInputSettings", {"inputName": "Title", "inputSettings": {"text": "タイトル"}}),
+            ("SetCurrentProgramScene", {"sceneName": "Talk"}),
+        ]
+    ]
+    assert client.stats["coalesced"] == 9999
+
+
+@pytest.mark.asyncio
+async def test_invalid_batch_does_not_stop_updates(obs_server):
+    """送れないデータを含むまとめた送信が失敗しても、以降の更新を送り続けるテスト"""
+    client = OBSWebSocketClient(obs_server.host, obs_server.port, "secret", FAST)
+    try:
+        await client.start()
+        client.queue_request("bad", "SetInputSettings", {"inputSettings": {"text": object()}})
+        await asyncio.sleep(0.1)
+        client.set_text("Subtitle", "次の字幕")
+        await asyncio.sleep(0.1)
+    finally:
+        await client.close()
+
+    assert client.stats["malformed"] == 1
+    assert obs_server.batches == [
+        [("SetInputSettings", {"inputName": "Subtitle", "inputSettings": {"text": "次の字幕"}})]
+    ]
+    assert obs_server.connections == 1
+
+
+@pytest.mark.asyncio
+async def test_reconnect_and_send_pending_updates(obs_server):
+    """切断後に再接続し、切断中の更新を送るテスト"""
+    client = OBSWebSocketClient(obs_server.host, obs_server.port, "secret", FAST)
+    try:
+        await client.start()
+        await obs_server.drop()
+        await asyncio.sleep(0)
+        client.set_text("Subtitle", "切断中")
+        for _ in range(100):
+            if obs_server.batches:
+                break
+            await asyncio.sleep(0.02)
+        version = await client.request("GetVersion")
+    finally:
+        await client.close()
+
+    assert version["rpcVersion"] == 1
+    assert obs_server.connections == 2
+    assert client.stats["reconnects"] == 1
+    assert obs_server.batches[-1] == [
+        ("SetInputSettings", {"inputName": "Subtitle", "inputSettings": {"text": "切断中"}})
+    ]
+
+
+@pytest.mark.asyncio
+async def test_stream_handler_sends_subtitles(obs_server):
+    """StreamHandlerがOBSに接続して字幕を送るテスト"""
+    handler = StreamHandler(
+        video_id="channel",
+        platform="twitch",
+        obs_host=obs_server.host,
+        obs_port=obs_server.port,
+        obs_password="secret",
+        obs_config=OBSWebSocketConfig(subtitle_source="字幕", update_interval=0.01),
+    )
+    await handler.connect()
+    assert handler.obs_websocket_url == f"ws://{obs_server.host}:{obs_server.port}"
+    assert handler.get_stream_info()["obs_connected"]
+    await handler.send_to_obs("こんにちは")
+    await handler.send_to_obs("こんにちは、今日は")
+    await asyncio.sleep(0.1)
+    await handler.disconnect()
+
+    assert not handler.get_stream_info()["obs_connected"]
+    assert obs_server.batches == [
+        [
+            (
+                "SetInputSettings",
+                {"inputName": "字幕", "inputSettings": {"text": "こんにちは、今日は"}},
+            )
+        ]
+    ]
@@ -0,0 +1,512 @@
+"""
+応答パイプラインのユニットテスト
+"""
+
+import asyncio
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from src.avatar.avatar_controller import AvatarController, LipSyncData, LipSyncStream
+from src.avatar.lip_sync_timeline import LipSyncTimeline
+from src.pipeline.response_pipeline import PipelineConfig, ResponsePipeline
+from src.stream.stream_handler import ChatMessage
+
+
+class FakeLLM:
+    """同期的に待機するLLMのスタブ"""
+
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self.started: list[tuple[str, float]] = []
+        self.context_version = 0
+        self.committed: list[str] = []
+        self.history: list[tuple[str, str]] = []
+
+    def generate_response(self, user_input: str) -> str:
+        self.started.append((user_input, time.perf_counter()))
+        time.sleep(self.delay)
+        self.context_version += 1
+        self.history.append((user_input, f"reply:{user_input}"))
+        return f"reply:{user_input}"
+
+    def generate_candidate(self, user_input: str) -> str:
+        self.started.append((user_input, time.perf_counter()))
+        time.sleep(self.delay)
+        return f"reply:{user_input}"
+
+    def commit_response(self, user_input: str, response: str) -> None:
+        self.committed.append(user_input)
+        self.context_version += 1
+        self.history.append((user_input, response))
+
+    def context_fingerprint(self, turns: int) -> str:
+        return repr(self.history[-turns:]) if turns > 0 else ""
+
+    def generate_response_stream(self, user_input: str):
+        self.started.append((user_input, time.perf_counter()))
+        tokens = ["こんにちは", "。", "今日は", "いい天気", "ですね", "！", "また", "ね"]
+        for token in tokens:
+            time.sleep(self.delay)
+            yield token
+        self.context_version += 1
+        self.history.append((user_input, "".join(tokens)))
+
+
+class FakeTTS:
+    """非同期に待機するTTSのスタブ"""
+
+    def __init__(self, delay: float, delays: dict[str, float] | None = None) -> None:
+        self.delay = delay
+        self.delays = delays or {}
+
+    async def text_to_speech_async(self, text: str) -> bytes:
+        await asyncio.sleep(self.delays.get(text, self.delay))
+        return text.encode()
+
+    async def text_to_speech_with_query_async(self, text: str) -> tuple[bytes, dict]:
+        from conftest import make_audio_query
+
+        return await self.text_to_speech_async(text), make_audio_query(text)
+
+
+class FakeStream:
+    """送信内容を記録する配信システムのスタブ"""
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.sent: list[tuple[str, float]] = []
+
+    async def send_to_obs(self, message: str) -> None:
+        await asyncio.sleep(self.delay)
+        self.sent.append((message, time.perf_counter()))
+
+
+@pytest.fixture
+def avatar():
+    """リップシンクを軽量化したAvatarController"""
+    controller = AvatarController("test_assets/test.vrm")
+    controller.lip_sync_timeline = lambda audio: LipSyncTimeline.from_lip_sync_data(
+        [LipSyncData("a", 0.0, 0.1, 1.0)]
+    )
+    return controller
+
+
+def _message(text: str) -> ChatMessage:
+    return ChatMessage(author="viewer", message=text, timestamp=datetime.now(), platform="youtube")
+
+
+@pytest.mark.asyncio
+async def test_process_single_message(avatar):
+    """単発処理のテスト"""
+    stream = FakeStream()
+    pipeline = ResponsePipeline(FakeLLM(0.0), FakeTTS(0.0), avatar, stream)
+    item = await pipeline.process(_message("hello"))
+    assert item is not None
+    assert item.response == "reply:hello"
+    assert item.spoken_chunks == 1
+    assert stream.sent[0][0] == "reply:hello"
+
+
+@pytest.mark.asyncio
+async def test_event_loop_not_blocked(avatar):
+    """ブロッキング処理中もイベントループが動作することのテスト"""
+    pipeline = ResponsePipeline(FakeLLM(0.2), FakeTTS(0.1), avatar, FakeStream())
+    await pipeline.start()
+    ticks = 0
+
+    async def ticker() -> None:
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker_task = asyncio.create_task(ticker())
+    try:
+        pipeline.submit(_message("hello"))
+        await asyncio.wait_for(pipeline.join(), timeout=5)
+    finally:
+        ticker_task.cancel()
+        await pipeline.stop()
+
+    assert ticks >= 10
+    assert pipeline.stats["completed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_llm_overlaps_output(avatar):
+    """次の応答のLLM処理が現在の出力と並行して進むことのテスト"""
+    llm = FakeLLM(0.1)
+    stream = FakeStream(delay=0.3)
+    on_response_threads = []
+    pipeline = ResponsePipeline(
+        llm,
+        FakeTTS(0.05),
+        avatar,
+        stream,
+        on_response=lambda item: on_response_threads.append(threading.current_thread()),
+    )
+    await pipeline.start()
+    try:
+        for text in ("first", "second", "third"):
+            pipeline.submit(_message(text))
+        await asyncio.wait_for(pipeline.join(), timeout=5)
+    finally:
+        await pipeline.stop()
+
+    assert [sent for sent, _ in stream.sent] == ["reply:first", "reply:second", "reply:third"]
+    # 2件目のLLM処理は1件目の出力完了より前に始まっている
+    assert llm.started[1][1] < stream.sent[0][1]
+    assert all(thread is threading.main_thread() for thread in on_response_threads)
+
+
+@pytest.mark.asyncio
+async def test_submit_drops_oldest_when_full(avatar):
+    """受付キューが満杯の場合に古いメッセージを破棄することのテスト"""
+    pipeline = ResponsePipeline(
+        FakeLLM(0.2),
+        FakeTTS(0.0),
+        avatar,
+        FakeStream(),
+        config=PipelineConfig(ingest_queue_size=1),
+    )
+    await pipeline.start()
+    try:
+        assert pipeline.submit(_message("first"))
+        await asyncio.sleep(0.05)  # 1件目をLLMワーカーが取り出すのを待つ
+        assert pipeline.submit(_message("second"))
+        assert not pipeline.submit(_message("third"))
+        await asyncio.wait_for(pipeline.join(), timeout=5)
+    finally:
+        await pipeline.stop()
+
+    assert pipeline.stats["dropped"] == 1
+    assert pipeline.stats["completed"] == 2
+
+
+def test_submit_requires_start(avatar):
+    """未起動のパイプラインへの投入はエラーになることのテスト"""
+    pipeline = ResponsePipeline(FakeLLM(0.0), FakeTTS(0.0), avatar, FakeStream())
+    with pytest.raises(RuntimeError):
+        pipeline.submit(_message("hello"))
+
+
+@pytest.mark.asyncio
+async def test_streaming_emits_first_chunk_early(avatar):
+    """ストリーミングモードで最初の文が応答完成前に出力されることのテスト"""
+    stream = FakeStream()
+    done = []
+    pipeline = ResponsePipeline(
+        FakeLLM(0.05),
+        FakeTTS(0.0),
+        avatar,
+        stream,
+        config=PipelineConfig(streaming=True),
+        on_response=done.append,
+    )
+    await pipeline.start()
+    try:
+        pipeline.submit(_message("hello"))
+        await asyncio.wait_for(pipeline.join(), timeout=5)
+    finally:
+        await pipeline.stop()
+
+    assert [sent for sent, _ in stream.sent] == ["こんにちは。", "今日はいい天気ですね！", "またね"]
+    item = done[0]
+    assert item.response == "こんにちは。今日はいい天気ですね！またね"
+    # 最初の文は応答全体の生成完了(8トークン分)より前に出力される
+    assert item.first_output_at - item.received_at < 0.3
+
+
+@pytest.mark.asyncio
+async def test_streaming_reassembles_out_of_order_chunks(avatar):
+    """複数の音声合成ワーカーの完了順が入れ替わっても順序通りに出力されることのテスト"""
+    stream = FakeStream()
+    tts = FakeTTS(0.0, delays={"こんにちは。": 0.3})
+    pipeline = ResponsePipeline(
+        FakeLLM(0.0),
+        tts,
+        avatar,
+        stream,
+        config=PipelineConfig(streaming=True, tts_workers=3),
+    )
+    await pipeline.start()
+    try:
+        pipeline.submit(_message("hello"))
+        await asyncio.wait_for(pipeline.join(), timeout=5)
+    finally:
+        await pipeline.stop()
+
+    assert [sent for sent, _ in stream.sent] == ["こんにちは。", "今日はいい天気ですね！", "またね"]
+    assert pipeline.stats["completed"] == 1
+    assert pipeline.stats["chunks"] == 3
+
+
+@pytest.mark.asyncio
+async def test_streaming_lip_sync_shares_analyzer(avatar, monkeypatch):
+    """ストリーミングモードで応答内の文を同じ逐次解析器で解析するテスト"""
+    from conftest import make_wav
+
+    class WavTTS(FakeTTS):
+        async def text_to_speech_async(self, text: str) -> bytes:
+            return make_wav(0.2 * len(text) / 5)
+
+    analyzed = []
+    avatar.lip_sync_timeline = lambda audio: analyzed.append(audio)
+    streams = []
+    original = LipSyncStream.analyze
+
+    def record_analyze(self, chunk, merge=True):
+        streams.append(self)
+        return original(self, chunk, merge)
+
+    items = []
+    pipeline = ResponsePipeline(
+        FakeLLM(0.0),
+        WavTTS(0.0),
+        avatar,
+        FakeStream(),
+        config=PipelineConfig(streaming=True),
+        on_response=items.append,
+    )
+    chunks = []
+    original_output = pipeline._run_output
+
+    async def record_output(chunk):
+        chunks.append(chunk)
+        await original_output(chunk)
+
+    pipeline._run_output = record_output
+    monkeypatch.setattr(LipSyncStream, "analyze", record_analyze)
+    await pipeline.process(_message("hi"))
+
+    assert analyzed == []
+    assert len(streams) == 3
+    assert streams[0] is streams[1] is streams[2] is items[0].lip_sync_stream
+    # 各文のタイムラインはその文の先頭から始まり、文の長さを覆う
+    for chunk in chunks[:3]:
+        timeline = chunk.lip_sync_data
+        assert timeline.start_times[0] == pytest.approx(0.0)
+        assert timeline.duration == pytest.approx(0.2 * len(chunk.text) / 5, abs=0.03)
+
+
+@pytest.mark.asyncio
+async def test_lip_sync_from_audio_query_mode(avatar):
+    """音声クエリモードでは音声解析を行わずにリップシンクを生成するテスト"""
+    analyzed = []
+    avatar.lip_sync_timeline = lambda audio: analyzed.append(audio)
+    items = []
+    pipeline = ResponsePipeline(
+        FakeLLM(0.0),
+        FakeTTS(0.0),
+        avatar,
+        FakeStream(),
+        config=PipelineConfig(lip_sync_mode="audio_query"),
+        on_response=items.append,
+    )
+    chunks = []
+    original_output = pipeline._run_output
+
+    async def record_output(chunk):
+        chunks.append(chunk)
+        await original_output(chunk)
+
+    pipeline._run_output = record_output
+    await pipeline.process(_message("hi"))
+
+    assert analyzed == []
+    lip_sync_data = chunks[0].lip_sync_data
+    # "reply:hi" の8モーラ分(子音を含む)と前後の無音
+    assert len(lip_sync_data) == 2 + 8 + 4
+    assert lip_sync_data[-1].end_time == pytest.approx(0.1 + 8 * 0.1 + 4 * 0.05 + 0.1)
+    assert len(items) == 1
+
+
+@pytest.mark.asyncio
+async def test_output_drives_animation(avatar):
+    """出力段が表情の目標とリップシンクをアニメーションエンジンに渡すテスト"""
+    from src.avatar.animation_engine import AnimationEngine
+
+    animation = AnimationEngine(avatar)
+    played = []
+
+    def play_lip_sync(timeline: LipSyncTimeline, start_time: float | None = None) -> float:
+        played.append(timeline)
+        return animation.clock()
+
+    animation.play_lip_sync = play_lip_sync
+    pipeline = ResponsePipeline(
+        FakeLLM(0.0), FakeTTS(0.0), avatar, FakeStream(), animation=animation
+    )
+    await pipeline.process(_message("hello"))
+
+    assert len(played) == 1
+    assert played[0][0].phoneme == "a"
+    assert animation._target[animation.channel_index["relaxed"]] == pytest.approx(0.7)
+
+
+@pytest.mark.asyncio
+async def test_response_cache_skips_llm(avatar):
+    """キャッシュにある質問ではLLMを呼び出さず、会話履歴には追加するテスト"""
+    from src.llm.response_cache import ResponseCache, ResponseCacheConfig
+
+    llm = FakeLLM(0.0)
+    stream = FakeStream()
+    pipeline = ResponsePipeline(
+        llm,
+        FakeTTS(0.0),
+        avatar,
+        stream,
+        config=PipelineConfig(streaming=True),
+        response_cache=ResponseCache(ResponseCacheConfig(context_turns=0)),
+    )
+    first = await pipeline.process(_message("名前は?"))
+    second = await pipeline.process(_message("名前は？"))
+
+    assert len(llm.started) == 1
+    assert not first.cached
+    assert second.cached
+    assert second.response == first.response
+    # ストリーミングモードでは生成時と同じく文単位で出力する
+    assert second.spoken_chunks == first.spoken_chunks
+    assert pipeline.stats["cache_hits"] == 1
+    assert llm.history[-1] == ("名前は？", first.response)
+
+
+@pytest.mark.asyncio
+async def test_response_cache_requires_same_context(avatar):
+    """直前の会話が異なる場合はキャッシュの応答を使わないテスト"""
+    from src.llm.response_cache import ResponseCache
+
+    llm = FakeLLM(0.0)
+    pipeline = ResponsePipeline(
+        llm, FakeTTS(0.0), avatar, FakeStream(), response_cache=ResponseCache()
+    )
+    await pipeline.process(_message("おはよう"))
+    await pipeline.process(_message("それって何?"))
+    await pipeline.process(_message("こんばんは"))
+    again = await pipeline.process(_message("それって何?"))
+
+    # 直前のやり取りが違うため、同じ質問でもLLMで生成し直す
+    assert not again.cached
+    assert [text for text, _ in llm.started] == [
+        "おはよう",
+        "それって何?",
+        "こんばんは",
+        "それって何?",
+    ]
+
+    # 直前のやり取りが同じ場合は再利用する
+    llm.history.clear()
+    first = await pipeline.process(_message("おはよう"))
+    assert first.cached
+
+
+@pytest.mark.asyncio
+async def test_speculation_hides_next_reply_latency(avatar):
+    """再生中に次の候補を先行生成し、再生終了後すぐに出力するテスト"""
+    llm = FakeLLM(0.1)
+    stream = FakeStream(delay=0.5)
+    pipeline = ResponsePipeline(
+        llm, FakeTTS(0.05), avatar, stream, config=PipelineConfig(speculative=True)
+    )
+    await pipeline.start()
+    try:
+        pipeline.submit(_message("first"))
+        await asyncio.sleep(0.05)
+        pipeline.submit(_message("second"))
+        await asyncio.wait_for(pipeline.join(), timeout=5)
+    finally:
+        await pipeline.stop()
+
+    assert [sent for sent, _ in stream.sent] == ["reply:first", "reply:second"]
+    # LLMと音声合成の時間が再生時間に隠れる
+    assert stream.sent[1][1] - stream.sent[0][1] < 0.5 + 0.1
+    assert llm.committed == ["second"]
+    assert pipeline.stats["speculation_hits"] == 1
+    assert pipeline.stats["speculation_misses"] == 1
+    assert pipeline.speculation_hit_rate == pytest.approx(0.5)
+    assert pipeline.stats["completed"] == 2
+
+
+@pytest.mark.asyncio
+async def test_speculation_discarded_for_better_message(avatar):
+    """より優先度の高いメッセージが届くと先行生成をやり直すテスト"""
+    llm = FakeLLM(0.1)
+    stream = FakeStream(delay=0.5)
+    pipeline = ResponsePipeline(
+        llm,
+        FakeTTS(0.05),
+        avatar,
+        stream,
+        config=PipelineConfig(speculative=True, speculation_depth=1),
+    )
+    await pipeline.start()
+    try:
+        pipeline.submit(_message("first"))
+        await asyncio.sleep(0.05)
+        pipeline.submit(_message("second"))
+        await asyncio.sleep(0.2)
+        pipeline.submit(_message("third?"))
+        await asyncio.wait_for(pipeline.join(), timeout=5)
+    finally:
+        await pipeline.stop()
+
+    assert [sent for sent, _ in stream.sent] == ["reply:first", "reply:third?", "reply:second"]
+    # 「second」の先行生成は上位から外れたときと、会話履歴が変わったときに破棄される
+    assert llm.committed == ["third?", "second"]
+    assert pipeline.stats["speculations_discarded"] == 1
+    assert pipeline.stats["speculation_hits"] == 2
+
+
+@pytest.mark.asyncio
+async def test_stale_speculation_is_regenerated(avatar):
+    """先行生成後に会話履歴が変わった場合は生成し直すテスト"""
+    llm = FakeLLM(0.05)
+    stream = FakeStream(delay=0.3)
+    pipeline = ResponsePipeline(
+        llm, FakeTTS(0.0), avatar, stream, config=PipelineConfig(speculative=True)
+    )
+    await pipeline.start()
+    try:
+        pipeline.submit(_message("first"))
+        await asyncio.sleep(0.02)
+        pipeline.submit(_message("second"))
+        await asyncio.sleep(0.15)
+        # 再生中に会話履歴が変わる
+        llm.context_version += 1
+        await asyncio.wait_for(pipeline.join(), timeout=5)
+    finally:
+        await pipeline.stop()
+
+    assert [sent for sent, _ in stream.sent] == ["reply:first", "reply:second"]
+    assert llm.committed == []
+    assert pipeline.stats["speculation_hits"] == 0
+    assert pipeline.stats["speculation_misses"] == 2
+
+
+@pytest.mark.asyncio
+async def test_speculation_waits_for_playback(avatar):
+    """次の応答は前の応答の音声の再生が終わってから出力するテスト"""
+    avatar.lip_sync_timeline = lambda audio: LipSyncTimeline.from_lip_sync_data(
+        [LipSyncData("a", 0.0, 0.4, 1.0)]
+    )
+    stream = FakeStream()
+    pipeline = ResponsePipeline(
+        FakeLLM(0.0), FakeTTS(0.0), avatar, stream, config=PipelineConfig(speculative=True)
+    )
+    await pipeline.start()
+    try:
+        pipeline.submit(_message("first"))
+        await asyncio.sleep(0.05)
+        pipeline.submit(_message("second"))
+        await asyncio.wait_for(pipeline.join(), timeout=5)
+    finally:
+        await pipeline.stop()
+
+    assert [sent for sent, _ in stream.sent] == ["reply:first", "reply:second"]
+    # 出力自体はすぐ終わるが、再生時間(0.4秒)が経つまで次の応答を出力しない
+    assert stream.sent[1][1] - stream.sent[0][1] >= 0.4 - 0.02
+    assert pipeline.stats["speculation_hits"] == 1
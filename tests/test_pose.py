@@ -0,0 +1,114 @@
+"""
+姿勢の一括計算のユニットテスト
+"""
+
+import math
+
+import numpy as np
+import pytest
+
+from src.avatar.avatar_controller import AvatarController
+from src.avatar.pose import NodeTransforms, euler_to_quaternion, interpolate_keyframes, slerp
+
+
+def _scalar_euler_to_quaternion(rx: float, ry: float, rz: float) -> list[float]:
+    """従来のスカラー計算による変換"""
+    cr, cp, cy = math.cos(rx / 2), math.cos(ry / 2), math.cos(rz / 2)
+    sr, sp, sy = math.sin(rx / 2), math.sin(ry / 2), math.sin(rz / 2)
+    return [
+        sr * cp * cy - cr * sp * sy,
+        cr * sp * cy + sr * cp * sy,
+        cr * cp * sy - sr * sp * cy,
+        cr * cp * cy + sr * sp * sy,
+    ]
+
+
+def test_euler_to_quaternion_matches_scalar():
+    """一括変換が従来のスカラー計算と一致するテスト"""
+    rng = np.random.default_rng(0)
+    euler = rng.uniform(-math.pi, math.pi, size=(4, 50, 3))
+
+    quaternions = euler_to_quaternion(euler)
+
+    assert quaternions.shape == (4, 50, 4)
+    expected = [[_scalar_euler_to_quaternion(*angles) for angles in row] for row in euler]
+    np.testing.assert_allclose(quaternions, expected, atol=1e-12)
+    np.testing.assert_allclose(np.linalg.norm(quaternions, axis=-1), 1.0)
+
+
+def test_slerp_endpoints_and_midpoint():
+    """球面線形補間の端点と中間点のテスト"""
+    q0 = euler_to_quaternion([0.0, 0.0, 0.0])
+    q1 = euler_to_quaternion([0.0, 0.0, math.pi / 2])
+
+    np.testing.assert_allclose(slerp(q0, q1, 0.0), q0, atol=1e-12)
+    np.testing.assert_allclose(slerp(q0, q1, 1.0), q1, atol=1e-12)
+    np.testing.assert_allclose(
+        slerp(q0, q1, 0.5), euler_to_quaternion([0.0, 0.0, math.pi / 4]), atol=1e-12
+    )
+    # 符号が反転した同じ回転は最短経路で補間する
+    np.testing.assert_allclose(slerp(q1, -q1, 0.5), q1, atol=1e-12)
+
+
+def test_interpolate_keyframes():
+    """複数ノードのキーフレームを一括で補間するテスト"""
+    key_times = np.array([0.0, 1.0, 2.0])
+    yaw = np.array([[0.0, 0.0], [math.pi / 2, 0.2], [math.pi / 2, 0.4]])
+    euler = np.zeros((3, 2, 3))
+    euler[..., 2] = yaw
+    key_rotations = euler_to_quaternion(euler)
+
+    rotations = interpolate_keyframes(key_times, key_rotations, [-1.0, 0.5, 1.5, 3.0])
+
+    assert rotations.shape == (4, 2, 4)
+    expected_yaw = [[0.0, 0.0], [math.pi / 4, 0.1], [math.pi / 2, 0.3], [math.pi / 2, 0.4]]
+    expected = np.zeros((4, 2, 3))
+    expected[..., 2] = expected_yaw
+    np.testing.assert_allclose(rotations, euler_to_quaternion(expected), atol=1e-12)
+    np.testing.assert_allclose(
+        interpolate_keyframes(key_times, key_rotations, 0.5), rotations[1], atol=1e-12
+    )
+
+
+def test_node_transforms_batch_update():
+    """ノード変換の配列を一括で更新するテスト"""
+    transforms = NodeTransforms.from_nodes(
+        [{"name": "Hips", "translation": [0, 1, 0]}, {"name": "Head"}, {"name": "Neck"}]
+    )
+    transforms.set_pose(
+        ["Head", 2], positions=[[0, 1.6, 0], [0, 1.5, 0]], rotations=np.zeros((2, 3))
+    )
+
+    np.testing.assert_allclose(transforms.translation[0], [0, 1, 0])
+    np.testing.assert_allclose(transforms.translation[1], [0, 1.6, 0])
+    np.testing.assert_allclose(transforms.rotation[1:], [[0, 0, 0, 1], [0, 0, 0, 1]])
+
+    nodes = [{}, {}, {}]
+    transforms.write_nodes(nodes)
+    assert nodes[2]["translation"] == pytest.approx([0, 1.5, 0])
+
+
+def test_node_transforms_indices():
+    """整数の配列はそのまま、名前は番号に変換されるテスト"""
+    transforms = NodeTransforms(["Hips", "Spine", "Head"])
+    array = np.array([2, 0], dtype=np.intp)
+
+    assert transforms.indices(array) is array
+    np.testing.assert_array_equal(transforms.indices(np.array([1, 2], dtype=np.int32)), [1, 2])
+    np.testing.assert_array_equal(transforms.indices([0, 2]), [0, 2])
+    np.testing.assert_array_equal(transforms.indices(["Head", 1]), [2, 1])
+    assert transforms.indices([]).dtype == np.intp
+
+
+def test_update_pose_writes_root_node():
+    """従来の姿勢更新がルートノードにクォータニオンを書き込むテスト"""
+    avatar = AvatarController("test_assets/test.vrm")
+    avatar.update_pose((0.0, 1.0, 0.0), (0.1, 0.2, 0.3))
+
+    assert avatar.vrm_data["nodes"][0]["translation"] == pytest.approx([0.0, 1.0, 0.0])
+    assert avatar.vrm_data["nodes"][0]["rotation"] == pytest.approx(
+        _scalar_euler_to_quaternion(0.1, 0.2, 0.3), abs=1e-6
+    )
+    np.testing.assert_allclose(
+        avatar.node_transforms.rotation[0], _scalar_euler_to_quaternion(0.1, 0.2, 0.3), atol=1e-6
+    )
@@ -0,0 +1,104 @@
+"""
+LLM応答キャッシュのユニットテスト
+"""
+
+import time
+
+from src.llm.response_cache import ResponseCache, ResponseCacheConfig, normalize_query
+
+
+class FakeClock:
+    """手動で進める時計"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_normalize_query():
+    """表記ゆれを揃える正規化のテスト"""
+    assert normalize_query("名前は？") == normalize_query("名前は")
+    assert normalize_query("ナンノゲーム?") == "なんのげーむ"
+    assert normalize_query("ｹﾞｰﾑ  ＯＫ!!") == "げーむok"
+    assert normalize_query("!? ♪") == ""
+
+
+def test_exact_hit_after_normalization():
+    """正規化後に一致する質問の応答を返すテスト"""
+    cache = ResponseCache()
+    cache.put("名前は?", "アイです！")
+    assert cache.get("名前は？") == "アイです！"
+    assert cache.get("なまえは") is None
+    assert cache.stats["hits"] == 1
+    assert cache.stats["misses"] == 1
+
+
+def test_near_match_with_threshold():
+    """n-gramの類似度が閾値以上の質問にヒットするテスト"""
+    cache = ResponseCache(ResponseCacheConfig(similarity_threshold=0.7))
+    cache.put("今日は何のゲームをやるの?", "今日はパズルゲームだよ")
+    cache.put("何歳?", "永遠の17歳です")
+
+    assert cache.get("今日は何のゲームやるの") == "今日はパズルゲームだよ"
+    assert cache.stats["near_hits"] == 1
+    assert cache.get("昨日は何してたの") is None
+
+    # 閾値が1の場合は完全一致のみ
+    strict = ResponseCache(ResponseCacheConfig(similarity_threshold=1.0))
+    strict.put("今日は何のゲームをやるの?", "今日はパズルゲームだよ")
+    assert strict.get("今日は何のゲームやるの") is None
+
+
+def test_ttl_and_lru_eviction():
+    """有効期限とLRUによる削除のテスト"""
+    clock = FakeClock()
+    cache = ResponseCache(ResponseCacheConfig(max_entries=2, ttl=10.0), clock=clock)
+    cache.put("名前は", "アイです")
+    cache.put("何歳", "17歳です")
+    cache.get("名前は")
+    cache.put("好きな食べ物は", "プリン")
+
+    # 最も使われていない質問が削除される
+    assert len(cache) == 2
+    assert cache.stats["evictions"] == 1
+    assert cache.get("何歳") is None
+    assert cache.get("名前は") == "アイです"
+
+    clock.now = 11.0
+    assert cache.get("名前は") is None
+    assert cache.get("好きな食べ物") is None
+    assert cache.stats["expirations"] == 2
+    assert len(cache) == 0
+    assert cache._index == {}
+
+
+def test_lookup_is_fast():
+    """多数の応答を保持していても参照が十分速いテスト"""
+    cache = ResponseCache(ResponseCacheConfig(max_entries=512))
+    for i in range(512):
+        cache.put(f"質問その{i}について教えて", f"応答{i}")
+
+    started = time.perf_counter()
+    for i in range(100):
+        cache.get(f"質問その{i}について教えてください")
+    elapsed = (time.perf_counter() - started) / 100
+    assert elapsed < 0.005
+
+
+def test_context_must_match():
+    """生成時と文脈が異なる場合は応答を再利用しないテスト"""
+    cache = ResponseCache()
+    cache.put("それって何のこと", "猫のことです", context="ctx-a")
+
+    assert cache.get("それって何のこと", context="ctx-b") is None
+    assert cache.get("それって何のことか", context="ctx-b") is None
+    assert cache.get("それって何のこと", context="ctx-a") == "猫のことです"
+    assert cache.get("それって何のことか", context="ctx-a") == "猫のことです"
+
+    # 同じ質問を別の文脈で保存すると置き換わる
+    cache.put("それって何のこと", "犬のことです", context="ctx-b")
+    assert len(cache) == 1
+    assert cache.get("それって何のこと", context="ctx-a") is None
+    assert cache.get("それって何のこと", context="ctx-b") == "犬のことです"
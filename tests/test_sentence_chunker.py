@@ -0,0 +1,48 @@
+"""
+文分割のユニットテスト
+"""
+
+from src.pipeline.sentence_chunker import SentenceChunker, split_sentences
+
+
+def test_split_on_japanese_punctuation():
+    """日本語の句読点で分割するテスト"""
+    assert split_sentences("こんにちは。元気ですか？はい！") == [
+        "こんにちは。",
+        "元気ですか？",
+        "はい！",
+    ]
+
+
+def test_short_clause_is_not_split():
+    """短い節は読点で分割しないテスト"""
+    assert split_sentences("はい、そうです。") == ["はい、そうです。"]
+    assert split_sentences("今日はとても楽しかったので、また来ます。") == [
+        "今日はとても楽しかったので、",
+        "また来ます。",
+    ]
+
+
+def test_trailing_marks_stay_with_sentence():
+    """連続する記号や閉じ括弧が同じチャンクに含まれるテスト"""
+    assert split_sentences("本当に？！「すごい！」って思った") == [
+        "本当に？！",
+        "「すごい！」",
+        "って思った",
+    ]
+
+
+def test_incremental_feed():
+    """トークン単位で投入した場合のテスト"""
+    chunker = SentenceChunker()
+    assert chunker.feed("こんにち") == []
+    assert chunker.feed("は。") == []  # 後続の記号を待つ
+    assert chunker.feed("今日") == ["こんにちは。"]
+    assert chunker.flush() == ["今日"]
+    assert chunker.flush() == []
+
+
+def test_max_chunk_length():
+    """区切りのない長文を最大文字数で分割するテスト"""
+    chunks = split_sentences("あ" * 25, max_chunk_length=10)
+    assert chunks == ["あ" * 10, "あ" * 10, "あ" * 5]
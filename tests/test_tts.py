@@ -2,11 +2,15 @@
 TTSシステムのユニットテスト
 """
 
+import asyncio
+import time
 from unittest.mock import MagicMock, patch
 
 import pytest
+import requests
 
-from src.tts.local_tts import LocalTTS, VoiceConfig
+from src.tts.audio_cache import AudioCache, AudioQueryCache
+from src.tts.local_tts import EngineConfig, EnginePoolConfig, LocalTTS, VoiceConfig
 
 
 def test_voice_config_initialization():
@@ -42,7 +46,7 @@ def test_local_tts_initialization():
     assert tts.voice_config is not None
 
 
-@patch("requests.post")
+@patch("requests.Session.post")
 def test_text_to_speech(mock_post):
     """音声合成のテスト"""
     # モックレスポンスの設定
@@ -63,7 +67,7 @@ def test_text_to_speech(mock_post):
     assert len(audio_data) > 0
 
 
-@patch("requests.get")
+@patch("requests.Session.get")
 def test_get_speakers(mock_get):
     """話者一覧取得のテスト"""
     mock_response = MagicMock()
@@ -85,3 +89,239 @@ def test_get_version():
     assert version is not None
     assert isinstance(version, str)
     assert len(version) > 0
+
+
+def test_text_to_speech_reuses_connection(voicevox_engine):
+    """複数回の音声合成で接続が再利用されるテスト"""
+    tts = LocalTTS(host=voicevox_engine.host, port=voicevox_engine.port)
+    for text in ("こんにちは", "元気", "またね"):
+        audio_data = tts.text_to_speech(text)
+        assert audio_data[:4] == b"RIFF"
+    assert tts.get_version() == "0.14.4"
+    tts.close()
+
+    assert voicevox_engine.count("/synthesis") == 3
+    assert voicevox_engine.connections == 1
+
+
+@pytest.mark.asyncio
+async def test_text_to_speech_async_concurrency(voicevox_engine):
+    """非同期音声合成が同時実行数の上限内で並行に処理されるテスト"""
+    voicevox_engine.delay = 0.1
+    tts = LocalTTS(host=voicevox_engine.host, port=voicevox_engine.port, max_concurrency=4)
+    try:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(tts.text_to_speech_async(f"文{i}") for i in range(4)))
+        elapsed = time.perf_counter() - start
+    finally:
+        await tts.aclose()
+
+    assert all(audio[:4] == b"RIFF" for audio in results)
+    # 逐次実行なら 4件 * (audio_query + synthesis) = 0.8秒かかる
+    assert elapsed < 0.6
+    assert voicevox_engine.connections <= 4
+
+
+@pytest.mark.asyncio
+async def test_text_to_speech_batch(voicevox_engine):
+    """一括音声合成が入力順に結果を返すテスト"""
+    tts = LocalTTS(host=voicevox_engine.host, port=voicevox_engine.port, cache=AudioCache())
+    texts = ["こんにちは。", "今日は", "いい天気ですね！"]
+    try:
+        await tts.text_to_speech_async("今日は")
+        results = await tts.text_to_speech_batch(texts)
+    finally:
+        await tts.aclose()
+
+    assert [result.text for result in results] == texts
+    assert [result.cached for result in results] == [False, True, False]
+    # キャッシュ済みの1件を除く2件が1回の一括合成で処理される
+    assert voicevox_engine.count("/multi_synthesis") == 1
+    assert voicevox_engine.count("/synthesis") == 1
+    # 音声の長さはテキストの長さに比例する
+    assert len(results[0].audio_data) < len(results[2].audio_data)
+    assert all(result.query_time > 0 for result in results if not result.cached)
+
+
+@pytest.mark.asyncio
+async def test_text_to_speech_batch_fallback(voicevox_engine):
+    """multi_synthesis非対応のエンジンで個別合成にフォールバックするテスト"""
+    tts = LocalTTS(host=voicevox_engine.host, port=voicevox_engine.port)
+    try:
+        results = await tts.text_to_speech_batch(["あ", "いう"], use_multi_synthesis=False)
+    finally:
+        await tts.aclose()
+
+    assert [result.text for result in results] == ["あ", "いう"]
+    assert voicevox_engine.count("/synthesis") == 2
+    assert voicevox_engine.count("/multi_synthesis") == 0
+
+
+@pytest.mark.asyncio
+async def test_text_to_speech_batch_multi_synthesis_not_found(voicevox_engine):
+    """/multi_synthesisが404を返す場合に文ごとの合成結果を返すテスト"""
+    voicevox_engine.unsupported.add("/multi_synthesis")
+    tts = LocalTTS(host=voicevox_engine.host, port=voicevox_engine.port)
+    try:
+        results = await tts.text_to_speech_batch(["あ", "いう"])
+    finally:
+        await tts.aclose()
+
+    assert [result.text for result in results] == ["あ", "いう"]
+    assert all(result.audio_data and not result.cached for result in results)
+    assert voicevox_engine.count("/multi_synthesis") == 1
+    assert voicevox_engine.count("/synthesis") == 2
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_benchmark_batch_vs_sequential(voicevox_engine):
+    """一括音声合成と文ごとの逐次合成の所要時間を比較するベンチマーク"""
+    voicevox_engine.delay = 0.05
+    texts = [f"これは{i}番目の文です。" for i in range(6)]
+    tts = LocalTTS(host=voicevox_engine.host, port=voicevox_engine.port)
+    try:
+        start = time.perf_counter()
+        sequential = [await tts.text_to_speech_async(text) for text in texts]
+        sequential_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch = await tts.text_to_speech_batch(texts)
+        batch_time = time.perf_counter() - start
+    finally:
+        await tts.aclose()
+
+    print(f"sequential: {sequential_time:.3f}s, batch: {batch_time:.3f}s")
+    assert [result.audio_data for result in batch] == sequential
+    # 逐次: 12往復分の待ち時間 / 一括: 並行クエリ + 1往復
+    assert batch_time < sequential_time / 2
+
+
+def test_audio_query_cache_skips_requery(voicevox_engine):
+    """音声設定を変えても音声クエリを再取得せずに合成するテスト"""
+    tts = LocalTTS(
+        host=voicevox_engine.host,
+        port=voicevox_engine.port,
+        query_cache=AudioQueryCache(),
+    )
+    tts.text_to_speech("こんにちは")
+    tts.voice_config = VoiceConfig(speed_scale=1.5, pitch_scale=0.1)
+    tts.text_to_speech("こんにちは")
+    query = tts.get_audio_query("こんにちは")
+    tts.close()
+
+    assert voicevox_engine.count("/audio_query") == 1
+    assert voicevox_engine.count("/synthesis") == 2
+    assert voicevox_engine.queries[0]["speedScale"] == pytest.approx(1.0)
+    assert voicevox_engine.queries[1]["speedScale"] == pytest.approx(1.5)
+    assert voicevox_engine.queries[1]["pitchScale"] == pytest.approx(0.1)
+    assert query["speedScale"] == pytest.approx(1.5)
+    assert len(query["accent_phrases"][0]["moras"]) == 5
+
+
+@pytest.mark.asyncio
+async def test_text_to_speech_with_query_async(voicevox_engine):
+    """合成に使った音声クエリが音声とともに返されるテスト"""
+    tts = LocalTTS(
+        host=voicevox_engine.host,
+        port=voicevox_engine.port,
+        voice_config=VoiceConfig(speed_scale=1.5),
+        cache=AudioCache(),
+    )
+    try:
+        audio_data, query = await tts.text_to_speech_with_query_async("こんにちは")
+        assert audio_data.startswith(b"RIFF")
+        assert query["speedScale"] == pytest.approx(1.5)
+        assert voicevox_engine.queries[0] == query
+
+        # 音声がキャッシュ済みでも音声クエリは取得できる
+        cached_audio, cached_query = await tts.text_to_speech_with_query_async("こんにちは")
+        assert cached_audio == audio_data
+        assert cached_query == query
+        assert voicevox_engine.count("/synthesis") == 1
+    finally:
+        await tts.aclose()
+
+
+def _engine_pool(engines, **kwargs) -> EnginePoolConfig:
+    return EnginePoolConfig(
+        engines=[EngineConfig(host=e.host, port=e.port) for e in engines], **kwargs
+    )
+
+
+@pytest.mark.asyncio
+async def test_engine_pool_distributes_load(voicevox_engines):
+    """並行した音声合成が複数のエンジンに振り分けられるテスト"""
+    for engine in voicevox_engines:
+        engine.delay = 0.1
+    tts = LocalTTS(engine_pool=_engine_pool(voicevox_engines), max_concurrency=6)
+    try:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(tts.text_to_speech_async(f"文{i}") for i in range(6)))
+        elapsed = time.perf_counter() - start
+        batch = await tts.text_to_speech_batch(["あ", "いう", "えお"])
+    finally:
+        await tts.aclose()
+
+    assert all(audio[:4] == b"RIFF" for audio in results)
+    assert elapsed < 0.6
+    assert [engine.count("/synthesis") for engine in voicevox_engines] == [3, 3, 3]
+    # 複数のエンジンがある場合は一括合成より個別合成の振り分けを優先する
+    assert sum(engine.count("/multi_synthesis") for engine in voicevox_engines) == 0
+    assert [result.text for result in batch] == ["あ", "いう", "えお"]
+    stats = tts.get_engine_stats()
+    assert all(engine["outstanding"] == 0 for engine in stats.values())
+
+
+def test_engine_pool_speaker_affinity(voicevox_engines):
+    """空いているエンジンのうち、同じ話者を合成済みのエンジンが選ばれるテスト"""
+    first, second, _ = voicevox_engines
+    tts = LocalTTS(engine_pool=_engine_pool(voicevox_engines))
+    for text in ("あ", "い", "う"):
+        tts.text_to_speech(text)
+    assert first.count("/synthesis") == 3
+
+    tts.voice_config = VoiceConfig(speaker_id=2)
+    for text in ("あ", "い", "う"):
+        tts.text_to_speech(text)
+    tts.voice_config = VoiceConfig(speaker_id=1)
+    tts.text_to_speech("え")
+    tts.close()
+
+    assert first.count("/synthesis") == 4
+    assert second.count("/synthesis") == 3
+
+
+def test_engine_pool_ejects_and_readmits(voicevox_engines):
+    """失敗したエンジンを切り離して別のエンジンで再試行し、ヘルスチェックで戻すテスト"""
+    broken = voicevox_engines[0]
+    broken.healthy = False
+    tts = LocalTTS(engine_pool=_engine_pool(voicevox_engines, max_failures=1))
+
+    assert tts.text_to_speech("こんにちは")[:4] == b"RIFF"
+    assert tts.get_engine_stats()[broken.base_url]["healthy"] is False
+    for text in ("あ", "い", "う"):
+        tts.text_to_speech(text)
+    assert broken.count("/audio_query") == 1
+    assert broken.count("/synthesis") == 0
+
+    tts.check_health()
+    assert tts.get_engine_stats()[broken.base_url]["healthy"] is False
+    broken.healthy = True
+    tts.check_health()
+    stats = tts.get_engine_stats()[broken.base_url]
+    assert stats["healthy"] is True
+    assert stats["readmissions"] == 1
+    tts.close()
+
+
+def test_engine_pool_all_engines_failing(voicevox_engines):
+    """全エンジンが失敗した場合は例外を送出するテスト"""
+    for engine in voicevox_engines:
+        engine.healthy = False
+    tts = LocalTTS(engine_pool=_engine_pool(voicevox_engines))
+    with pytest.raises(requests.HTTPError):
+        tts.text_to_speech("こんにちは")
+    assert [engine.count("/audio_query") for engine in voicevox_engines] == [1, 1, 1]
+    assert tts.get_version() == "unknown"
+    tts.close()
@@ -0,0 +1,191 @@
+"""
+Twitchチャット(IRC)クライアントのテスト(スタブIRCサーバーを使用)
+"""
+
+import asyncio
+import time
+from datetime import datetime
+
+import pytest
+
+from src.stream.twitch_irc import (
+    TwitchChatClient,
+    TwitchIRCConfig,
+    parse_irc_line,
+    to_chat_message,
+)
+
+
+def _privmsg(author: str, text: str, **tags: str) -> str:
+    tags = {"display-name": author, "tmi-sent-ts": "1700000000000", **tags}
+    raw_tags = ";".join(f"{key}={value}" for key, value in tags.items())
+    login = author.lower()
+    return f"@{raw_tags} :{login}!{login}@{login}.tmi.twitch.tv PRIVMSG #channel :{text}"
+
+
+def _client(server, **kwargs) -> TwitchChatClient:
+    config = TwitchIRCConfig(
+        host=server.host, port=server.port, tls=False, reconnect_delay=0.01, **kwargs
+    )
+    return TwitchChatClient("#Channel", config)
+
+
+def test_parse_irc_line():
+    """IRCv3タグとパラメータの解析のテスト"""
+    message = parse_irc_line(
+        r"@badge-info=;display-name=Viewer;msg=a\sb\:c\\d;empty= "
+        ":viewer!viewer@viewer.tmi.twitch.tv PRIVMSG #channel :hello :) world"
+    )
+    assert message.command == "PRIVMSG"
+    assert message.params == ["#channel", "hello :) world"]
+    assert message.nick == "viewer"
+    assert message.tags["msg"] == "a b;c\\d"
+    assert message.tags["badge-info"] == ""
+    assert message.tags["empty"] == ""
+
+    ping = parse_irc_line("PING :tmi.twitch.tv")
+    assert ping.command == "PING"
+    assert ping.params == ["tmi.twitch.tv"]
+
+
+def test_to_chat_message():
+    """PRIVMSGのChatMessageへの変換のテスト"""
+    message = to_chat_message(
+        parse_irc_line(_privmsg("Viewer", "\x01ACTION waves\x01", bits="100"))
+    )
+    assert message.author == "Viewer"
+    assert message.message == "waves"
+    assert message.platform == "twitch"
+    assert message.timestamp == datetime.fromtimestamp(1700000000)
+    assert message.superchat_amount == pytest.approx(100.0)
+    assert message.superchat_currency == "BITS"
+
+    # 表示名がない場合はニックネームを使う
+    plain = to_chat_message(parse_irc_line(":someone!someone@host PRIVMSG #channel :やあ"))
+    assert plain.author == "someone"
+    assert plain.superchat_amount is None
+    assert to_chat_message(parse_irc_line("PING :tmi.twitch.tv")) is None
+
+
+def test_to_chat_message_with_malformed_tags():
+    """不正な時刻やbitsのタグは受信時刻・bitsなしとして扱うテスト"""
+    before = datetime.now()
+    message = to_chat_message(parse_irc_line("@bits=abc;tmi-sent-ts=x :a!a@a PRIVMSG #c :hi"))
+    assert message.message == "hi"
+    assert message.timestamp >= before
+    assert message.superchat_amount is None
+    assert message.superchat_currency is None
+
+    overflow = to_chat_message(parse_irc_line("@bits=nan;tmi-sent-ts=1e400 :a!a@a PRIVMSG #c :x"))
+    assert overflow.timestamp >= before
+    assert overflow.superchat_amount is None
+
+
+@pytest.mark.asyncio
+async def test_login_ping_and_reconnect(irc_server):
+    """ログイン、PINGへの応答、再接続の指示と切断による再接続のテスト"""
+    irc_server.sessions = [
+        [
+            _privmsg("A", "最初"),
+            "PING :tmi.twitch.tv",
+            _privmsg("B", "二番目"),
+            ":tmi.twitch.tv RECONNECT",
+        ],
+        [None],
+        [_privmsg("C", "再接続後")],
+    ]
+    client = _client(irc_server)
+
+    received = []
+    async for message in client.messages():
+        received.append((message.author, message.message))
+        if len(received) == 3:
+            break
+    await irc_server.wait_for("PONG :tmi.twitch.tv")
+    await client.close()
+
+    assert received == [("A", "最初"), ("B", "二番目"), ("C", "再接続後")]
+    assert irc_server.received[0] == "CAP REQ :twitch.tv/tags twitch.tv/commands"
+    assert irc_server.received[1].startswith("NICK justinfan")
+    assert irc_server.received[2] == "JOIN #channel"
+    assert irc_server.connections == 3
+    assert client.stats["reconnects"] == 2
+    assert client.stats["pings"] == 1
+
+
+@pytest.mark.asyncio
+async def test_malformed_tags_do_not_stop_reading(irc_server):
+    """不正なタグのメッセージを受信しても読み取りを続けるテスト"""
+    irc_server.sessions = [
+        ["@bits=abc;tmi-sent-ts=x :a!a@a PRIVMSG #channel :hi", _privmsg("B", "次")]
+    ]
+    client = _client(irc_server)
+    received = []
+    async for message in client.messages():
+        received.append(message.message)
+        if len(received) == 2:
+            break
+    await client.close()
+
+    assert received == ["hi", "次"]
+    assert client.stats["reconnects"] == 0
+
+
+@pytest.mark.asyncio
+async def test_login_failure_is_raised(irc_server):
+    """ログインに失敗した場合は再接続せずに例外を送出するテスト"""
+    irc_server.sessions = [[":tmi.twitch.tv NOTICE * :Login authentication failed"]]
+    client = _client(irc_server, nickname="MyBot", token="wrong")
+    with pytest.raises(PermissionError, match="Login authentication failed"):
+        async for _ in client.messages():
+            pass
+    await client.close()
+
+    assert irc_server.connections == 1
+    assert client.stats["reconnects"] == 0
+
+
+@pytest.mark.asyncio
+async def test_login_with_token(irc_server):
+    """トークンを指定した場合のログインのテスト"""
+    irc_server.sessions = [[_privmsg("A", "こんにちは")]]
+    client = _client(irc_server, nickname="MyBot", token="secret")
+    async for _ in client.messages():
+        break
+    await client.close()
+    assert irc_server.received[1:4] == ["PASS oauth:secret", "NICK mybot", "JOIN #channel"]
+
+
+@pytest.mark.asyncio
+async def test_high_volume_without_blocking_loop(irc_server):
+    """大量のメッセージを受信してもイベントループを止めないテスト"""
+    count = 20000
+    irc_server.sessions = [[_privmsg(f"user{i}", f"メッセージ{i}") for i in range(count)]]
+    client = _client(irc_server)
+
+    ticks = 0
+
+    async def ticker() -> None:
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0)
+
+    task = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    received = 0
+    async for message in client.messages():
+        received += 1
+        if received == count:
+            assert message.message == f"メッセージ{count - 1}"
+            break
+    elapsed = time.perf_counter() - started
+    task.cancel()
+    await client.close()
+
+    print(f"{count} messages in {elapsed:.3f}s")
+    # 1分あたり数万件を大きく上回る速度で処理できる
+    assert elapsed < 3.0
+    # 受信中も他のタスクが実行されている
+    assert ticks > 10
+    assert client.stats["messages"] == count
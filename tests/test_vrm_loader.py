@@ -0,0 +1,149 @@
+"""
+GLB/VRM読み込みのユニットテスト
+"""
+
+import numpy as np
+import pytest
+from conftest import make_glb
+
+from src.avatar.avatar_controller import AvatarController
+from src.avatar.vrm_loader import GlbFile
+
+# 3頂点の位置と、2つのブレンドシェイプの差分
+POSITIONS = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0]], dtype=np.float32)
+TARGETS = [
+    np.full((3, 3), 0.1, dtype=np.float32),
+    np.full((3, 3), 0.2, dtype=np.float32),
+]
+
+
+def _gltf_with_mesh(extensions: dict) -> tuple[dict, bytes]:
+    binary = POSITIONS.tobytes() + b"".join(target.tobytes() for target in TARGETS)
+    # 頂点位置は12バイトのデータを16バイト間隔で並べたインターリーブ形式とする
+    interleaved = b"".join(row.tobytes() + b"\0" * 4 for row in POSITIONS)
+    binary = interleaved + binary[POSITIONS.nbytes :]
+    gltf = {
+        "asset": {"version": "2.0"},
+        "nodes": [{"name": "Face", "mesh": 0, "translation": [0, 1.5, 0]}, {"name": "Root"}],
+        "meshes": [
+            {
+                "primitives": [
+                    {
+                        "attributes": {"POSITION": 0},
+                        "targets": [{"POSITION": 1}, {"POSITION": 2}],
+                    }
+                ],
+                "extras": {"targetNames": ["Fcl_ALL_Joy", "Fcl_MTH_A"]},
+            }
+        ],
+        "buffers": [{"byteLength": len(binary)}],
+        "bufferViews": [
+            {"buffer": 0, "byteOffset": 0, "byteLength": 48, "byteStride": 16},
+            {"buffer": 0, "byteOffset": 48, "byteLength": 72},
+        ],
+        "accessors": [
+            {"bufferView": 0, "componentType": 5126, "count": 3, "type": "VEC3"},
+            {"bufferView": 1, "componentType": 5126, "count": 3, "type": "VEC3"},
+            {"bufferView": 1, "byteOffset": 36, "componentType": 5126, "count": 3, "type": "VEC3"},
+        ],
+        "extensions": extensions,
+    }
+    return gltf, binary
+
+
+VRM1_EXTENSIONS = {
+    "VRMC_vrm": {
+        "expressions": {
+            "preset": {
+                "happy": {"morphTargetBinds": [{"node": 0, "index": 0, "weight": 1.0}]},
+                "aa": {"morphTargetBinds": [{"node": 0, "index": 1, "weight": 0.5}]},
+            },
+            "custom": {"wink": {"morphTargetBinds": []}},
+        }
+    }
+}
+
+VRM0_EXTENSIONS = {
+    "VRM": {
+        "blendShapeMaster": {
+            "blendShapeGroups": [
+                {
+                    "name": "Joy",
+                    "presetName": "joy",
+                    "binds": [{"mesh": 0, "index": 0, "weight": 100}],
+                },
+                {"name": "A", "presetName": "a", "binds": [{"mesh": 0, "index": 1, "weight": 50}]},
+                {"name": "Smug", "presetName": "unknown", "binds": []},
+            ]
+        }
+    }
+}
+
+
+@pytest.fixture
+def vrm_file(tmp_path):
+    """VRM 1.0形式のテスト用ファイル"""
+    path = tmp_path / "avatar.vrm"
+    path.write_bytes(make_glb(*_gltf_with_mesh(VRM1_EXTENSIONS)))
+    return path
+
+
+def test_accessors_are_zero_copy_views(vrm_file):
+    """アクセサーがBINチャンクを参照する読み取り専用の配列であるテスト"""
+    with GlbFile.open(vrm_file) as glb:
+        positions = glb.accessor(0)
+        np.testing.assert_array_equal(positions, POSITIONS)
+        # インターリーブされたデータも間隔を保ったまま参照する
+        assert positions.strides == (16, 4)
+        assert not positions.flags.owndata
+        assert not positions.flags.writeable
+        assert glb.accessor(0) is positions
+
+        np.testing.assert_array_equal(glb.morph_target(0, 1), TARGETS[1])
+        assert glb.morph_target_names(0) == ["Fcl_ALL_Joy", "Fcl_MTH_A"]
+
+
+def test_node_transforms(vrm_file):
+    """ノードの変換情報が既定値を補って取得されるテスト"""
+    with GlbFile.open(vrm_file) as glb:
+        nodes = glb.node_transforms()
+    assert nodes[0]["name"] == "Face"
+    assert nodes[0]["translation"] == [0, 1.5, 0]
+    assert nodes[1]["rotation"] == [0.0, 0.0, 0.0, 1.0]
+
+
+def test_vrm1_expressions(vrm_file):
+    """VRM 1.0の表情定義のテスト"""
+    with GlbFile.open(vrm_file) as glb:
+        expressions = glb.expressions()
+    assert list(expressions) == ["happy", "aa", "wink"]
+    assert expressions["aa"][0].mesh == 0
+    assert expressions["aa"][0].index == 1
+    assert expressions["aa"][0].weight == pytest.approx(0.5)
+
+
+def test_vrm0_expressions():
+    """VRM 0.xの表情定義がVRM 1.0の名前に変換されるテスト"""
+    glb = GlbFile(make_glb(*_gltf_with_mesh(VRM0_EXTENSIONS)))
+    expressions = glb.expressions()
+    assert list(expressions) == ["happy", "aa", "Smug"]
+    assert expressions["aa"][0].weight == pytest.approx(0.5)
+
+
+def test_invalid_glb():
+    """GLB形式でないデータのテスト"""
+    with pytest.raises(ValueError):
+        GlbFile(b'{"nodes": []}')
+
+
+def test_avatar_controller_loads_vrm(vrm_file):
+    """アバターがVRMファイルの表情一覧を読み込むテスト"""
+    avatar = AvatarController(str(vrm_file))
+    assert avatar.vrm is not None
+    expressions = avatar.get_available_expressions()
+    assert expressions[:5] == ["happy", "angry", "sad", "relaxed", "surprised"]
+    assert "aa" in expressions
+    assert "wink" in expressions
+
+    avatar.update_pose((1.0, 2.0, 3.0), (0.0, 0.0, 0.0))
+    assert avatar.vrm_data["nodes"][0]["translation"] == [1.0, 2.0, 3.0]
@@ -0,0 +1,79 @@
+"""
+WAV読み込みのユニットテスト
+"""
+
+import io
+import struct
+import wave
+
+import numpy as np
+import pytest
+
+from src.avatar.wav_reader import PcmConverter, is_wav, read_wav
+
+
+def _make_wav(samples: np.ndarray, sample_rate: int = 24000, channels: int = 1) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(samples.dtype.itemsize)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+def test_read_wav_header():
+    """ヘッダー情報の解析テスト"""
+    data = _make_wav(np.zeros(2400, dtype="<i2"), sample_rate=24000)
+    wav = read_wav(data)
+    assert is_wav(data)
+    assert wav.sample_rate == 24000
+    assert wav.channels == 1
+    assert wav.bits_per_sample == 16
+    assert wav.n_frames == 2400
+    assert wav.duration == pytest.approx(0.1)
+
+
+def test_samples_are_zero_copy():
+    """PCMデータが元のバッファを参照するテスト"""
+    data = bytearray(_make_wav(np.arange(100, dtype="<i2")))
+    samples = read_wav(data).samples()
+    assert np.shares_memory(samples, np.frombuffer(data, dtype=np.uint8))
+    assert samples[:, 0].tolist() == list(range(100))
+
+
+def test_extra_chunks_are_skipped():
+    """fmtとdata以外のチャンクを読み飛ばすテスト"""
+    data = _make_wav(np.array([1, 2, 3], dtype="<i2"))
+    # fmtチャンクの後に奇数長のLISTチャンクを挿入
+    list_chunk = b"LIST" + struct.pack("<I", 3) + b"abc" + b"\x00"
+    data = data[:36] + list_chunk + data[36:]
+    data = data[:4] + struct.pack("<I", len(data) - 8) + data[8:]
+    assert read_wav(data).samples()[:, 0].tolist() == [1, 2, 3]
+
+
+def test_to_float32_scaling_and_mixdown():
+    """float32変換とステレオのモノラル化のテスト"""
+    stereo = np.array([[16384, -16384], [32767, 32767], [-32768, 0]], dtype="<i2")
+    wav = read_wav(_make_wav(stereo, channels=2))
+    converter = PcmConverter()
+    audio = converter.to_float32(wav)
+    assert audio.dtype == np.float32
+    np.testing.assert_allclose(audio, [0.0, 32767 / 32768, -0.5], atol=1e-6)
+
+
+def test_converter_reuses_buffer():
+    """変換バッファが使い回されるテスト"""
+    converter = PcmConverter(initial_size=1000)
+    first = converter.to_float32(read_wav(_make_wav(np.ones(500, dtype="<i2"))))
+    second = converter.to_float32(read_wav(_make_wav(np.ones(800, dtype="<i2"))))
+    assert np.shares_memory(first, second)
+
+
+def test_invalid_data_raises():
+    """WAV形式でないデータでエラーになるテスト"""
+    assert not is_wav(b"test" * 10)
+    with pytest.raises(ValueError):
+        read_wav(b"test" * 10)
+    with pytest.raises(ValueError):
+        read_wav(b"RIFF\x04\x00\x00\x00WAVE")